@@ -1,7 +1,16 @@
 from typing_extensions import Self
 
+import sympy as sp
+import numpy as np
+
+from expressionCompiler import CompiledExpression
+from instrumentation import profiler
+
 
 class Offset:
+    # offsets are shared between a sketch plane and its curves, so add/subtract return new ones instead of mutating
+    __slots__ = ('x', 'y', 'z')
+
     def __init__(self, x, y, z):
         self.x = x
         self.y = y
@@ -16,5 +25,302 @@ class Offset:
         return Offset(self.x - other.x, self.y - other.y, self.z - other.z)
 
 
+    def __str__(self):
+        return f"x: {self.x}, y: {self.y}, z: {self.z}"
+
+
     def print(self):
-        print(f"offset: x: {self.x}, y: {self.y}, z: {self.z}")
\ No newline at end of file
+        print(f"offset: {self}")
+
+
+    def array(self):
+        return np.array([self.x, self.y, self.z], dtype=float)
+
+
+def rotation_matrix(axis, degrees):
+    # 4x4 rotation about x, y or z with the sign conventions every geometry class has always used
+    c = np.cos(np.radians(degrees))
+    s = np.sin(np.radians(degrees))
+
+    matrix = np.eye(4)
+
+    match axis:
+        case 'x':
+            matrix[1:3, 1:3] = [[c, -s], [s, c]]
+        case 'y':
+            matrix[0, 0], matrix[0, 2], matrix[2, 0], matrix[2, 2] = c, -s, s, c
+        case 'z':
+            matrix[0:2, 0:2] = [[c, -s], [s, c]]
+
+    return matrix
+
+
+class Pose:
+    # a rigid transform as one 4x4 float array, in place of a feature's six symbolic Tx ... Trz matrices
+    __slots__ = ('matrix',)
+
+    def __init__(self, matrix=None):
+        self.matrix = np.eye(4) if matrix is None else np.asarray(matrix, dtype=float)
+
+
+    @classmethod
+    def translation(cls, offset:Offset):
+        matrix = np.eye(4)
+
+        matrix[:3, 3] = [float(offset.x), float(offset.y), float(offset.z)]
+
+        return cls(matrix)
+
+
+    @classmethod
+    def rotation(cls, alpha, beta, gamma, order='zyx'):
+        # 'zyx' is Rz Ry Rx, what features use on themselves; the surfaces' curve helpers use 'xyz'
+        matrices = {'x': rotation_matrix('x', alpha), 'y': rotation_matrix('y', beta), 'z': rotation_matrix('z', gamma)}
+
+        return cls(matrices[order[0]] @ matrices[order[1]] @ matrices[order[2]])
+
+
+    def symbolic(self):
+        # whole numbers go in as integers so translations and zero rotations keep expressions exact
+        return sp.Matrix(4, 4, lambda i, j: int(self.matrix[i, j]) if float(self.matrix[i, j]).is_integer() else float(self.matrix[i, j]))
+
+
+    def apply(self, expression):
+        # row vector expression (1 x 3) through the transform, as the homogeneous row_insert dance did
+        expression_h = expression.T.row_insert(expression.T.rows, sp.Matrix([1]))
+
+        return (self.symbolic() * expression_h)[:-1, :].T
+
+
+def power_basis_coefficients(P_u, u):
+    # rows are the coefficients of u**0, u**1, ... for each of x, y, z
+    polys = []
+    for component in P_u:
+        try:
+            poly = sp.Poly(sp.expand(component), u)
+        except sp.PolynomialError:
+            raise ValueError(f"curve is not a polynomial in {u}: {component}")
+
+        if poly.free_symbols - {u}:
+            raise ValueError(f"curve depends on symbols other than {u}: {poly.free_symbols - {u}}")
+
+        polys.append([float(coefficient) for coefficient in reversed(poly.all_coeffs())])
+
+    degree = max(len(coefficients) for coefficients in polys) - 1
+
+    coefficients = np.zeros((degree + 1, len(polys)))
+    for i, poly in enumerate(polys):
+        coefficients[:len(poly), i] = poly
+
+    return coefficients
+
+
+def evaluate_power_basis(coefficients, u_eval):
+    # horner's rule, vectorized over the samples
+    u_eval = np.asarray(u_eval, dtype=float)[:, None]
+
+    values = np.broadcast_to(coefficients[-1], (u_eval.shape[0], coefficients.shape[1])).copy()
+    for coefficient in coefficients[-2::-1]:
+        values *= u_eval
+        values += coefficient
+
+    return values
+
+
+def polynomial_roots(coefficients, lower=0, upper=1, imaginary_tolerance=1e-6):
+    # real roots within [lower, upper] of many polynomials at once, rows being the coefficients of u**0, u**1, ...;
+    # each row's actual degree gets its own batch of companion matrices, so a zero leading coefficient never divides
+    coefficients = np.asarray(coefficients, dtype=float)
+
+    scale = np.max(np.abs(coefficients), axis=1, keepdims=True)
+
+    significant = np.abs(coefficients) > 1e-12 * scale
+
+    degrees = np.where(np.any(significant, axis=1), coefficients.shape[1] - 1 - np.argmax(significant[:, ::-1], axis=1), 0)
+
+    owners = []
+    roots = []
+
+    for degree in range(1, coefficients.shape[1]):
+        rows = np.nonzero(degrees == degree)[0]
+
+        if rows.shape[0] == 0:
+            continue
+
+        companion = np.zeros((rows.shape[0], degree, degree))
+        companion[:, 1:, :-1] = np.eye(degree - 1)
+        companion[:, :, -1] = -coefficients[rows, :degree] / coefficients[rows, degree, None]
+
+        eigenvalues = np.linalg.eigvals(companion)
+
+        # a double root (a tangency) comes back as a pair with a tiny imaginary part
+        real = np.abs(eigenvalues.imag) <= imaginary_tolerance * (1 + np.abs(eigenvalues.real))
+
+        owner, index = np.nonzero(real)
+
+        owners.append(rows[owner])
+        roots.append(eigenvalues.real[owner, index])
+
+    if not owners:
+        return np.empty(0, dtype=int), np.empty(0)
+
+    owners = np.concatenate(owners)
+    roots = np.concatenate(roots)
+
+    # a couple of newton steps on the polynomial itself, kept only where they reduce the residual
+    for _ in range(2):
+        values = np.zeros_like(roots)
+        slopes = np.zeros_like(roots)
+
+        for k in range(coefficients.shape[1] - 1, -1, -1):
+            slopes = slopes * roots + values
+            values = values * roots + coefficients[owners, k]
+
+        polished = roots - values / np.where(slopes != 0, slopes, 1)
+
+        residual = np.zeros_like(roots)
+        for k in range(coefficients.shape[1] - 1, -1, -1):
+            residual = residual * polished + coefficients[owners, k]
+
+        roots = np.where((slopes != 0) & (np.abs(residual) < np.abs(values)), polished, roots)
+
+    inside = (roots >= lower - 1e-9) & (roots <= upper + 1e-9)
+
+    owners = owners[inside]
+    roots = np.clip(roots[inside], lower, upper)
+
+    # the two halves of a double root, one entry each
+    order = np.lexsort((roots, owners))
+
+    owners = owners[order]
+    roots = roots[order]
+
+    repeated = np.zeros(roots.shape[0], dtype=bool)
+    repeated[1:] = (owners[1:] == owners[:-1]) & (np.abs(roots[1:] - roots[:-1]) < 1e-6)
+
+    return owners[~repeated], roots[~repeated]
+
+
+def lambdify_curve(u, P_u):
+    # one callable for all samples, evaluated by the session's backend; constant components are broadcast to the sample count
+    return CompiledExpression(u, list(P_u)).evaluate
+
+
+class TraceCache:
+    def __init__(self, u):
+        self.u = u
+
+        self.source = None
+
+        self.callables = {}
+
+        self.samples = {}
+
+        self.power = None
+
+        # display traces by (density, dtype), kept apart from the float64 samples that evaluation relies on
+        self.display = {}
+
+        self.sample_cache_size = 16
+
+
+    def check(self, P_u):
+        # surfaces and transforms assign a new P_u object, which invalidates everything derived from the old one
+        if P_u is not self.source:
+            self.source = P_u
+            self.callables = {}
+            self.samples = {}
+            self.power = None
+            self.display = {}
+
+
+    def callable(self, P_u, order=0):
+        self.check(P_u)
+
+        if order not in self.callables:
+            with profiler.measure('compile'):
+                expression = P_u if order == 0 else sp.diff(P_u, self.u, order)
+                self.callables[order] = lambdify_curve(self.u, expression)
+
+        return self.callables[order]
+
+
+    def sample(self, P_u, u_eval, order=0):
+        # surfaces ask for the same parameter arrays on every redraw, so samples are kept too
+        self.check(P_u)
+
+        u_eval = np.asarray(u_eval, dtype=float)
+
+        key = (order, u_eval.shape, u_eval.tobytes())
+
+        if key not in self.samples:
+            if len(self.samples) >= self.sample_cache_size:
+                self.samples.pop(next(iter(self.samples)))
+
+            samples = self.callable(P_u, order)(u_eval)
+            samples.flags.writeable = False
+            self.samples[key] = samples
+
+        return self.samples[key]
+
+
+    def power_basis(self, P_u):
+        # expanding P_u with sympy costs milliseconds, exact queries on the same curve reuse the rows
+        self.check(P_u)
+
+        if self.power is None:
+            with profiler.measure('compile'):
+                self.power = power_basis_coefficients(P_u, self.u)
+
+        return self.power
+
+
+    def trace(self, P_u, density, dtype=None):
+        if dtype is None:
+            return self.sample(P_u, np.linspace(0, 1, density))
+
+        # a drawing-only trace is cached at the precision it is drawn in, without a float64 copy alongside
+        key = (density, np.dtype(dtype))
+
+        if key not in self.display:
+            trace = self.callable(P_u)(np.linspace(0, 1, density)).astype(dtype)
+            trace.flags.writeable = False
+            self.display[key] = trace
+
+        return self.display[key]
+
+
+def display_grid(grid, dtype=None):
+    # the grid a surface keeps for drawing, at the display precision when one is asked for
+    if dtype is None:
+        return grid
+
+    return np.asarray(grid).astype(dtype, copy=False)
+
+
+def grid_traces(grid):
+    # iso-lines of an (n_u, n_w, 3) grid: one per u value followed by one per w value
+    return [grid[i, :, :] for i in range(grid.shape[0])] + [grid[:, j, :] for j in range(grid.shape[1])]
+
+
+def sample_curve(curve, u, order=0):
+    # samples any curve at an arbitrarily shaped parameter array, returning u.shape + (3,)
+    u = np.asarray(u, dtype=float)
+
+    flat = u.ravel()
+
+    if order == 0:
+        values = curve.sample(flat)
+    else:
+        values = curve.sample_derivative(flat, order)
+
+    return values.reshape(u.shape + (3,))
+
+
+def unit_normals(S_u, S_w):
+    # normalized S_u x S_w, zero where the surface is degenerate
+    N = np.cross(S_u, S_w)
+
+    magnitudes = np.linalg.norm(N, axis=-1, keepdims=True)
+
+    return N / np.where(magnitudes > 0, magnitudes, 1)
@@ -0,0 +1,362 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt
+
+import sympy as sp
+import numpy as np
+
+from CADUtils import Offset
+from sketchPlane import SketchPlane
+from straightLine import StraightLine
+from bezierCurve import BezierCurve
+from nurbsCurve import NURBSCurve
+
+from cylindricalSurface import CylindricalSurface
+from ruledSurface import RuledSurface
+from loftedSurface import LoftedSurface
+from sweptSurface import SweptSurface
+from revolvedSurface import RevolvedSurface
+
+from intersectionCurve import IntersectionCurve
+from curveIntersection import CurveIntersection, polynomial_pieces, piece_coefficients
+from curvePlaneIntersection import CurvePlaneIntersection
+from pointInversion import PointInversion
+from picker import Picker
+
+import expressionCompiler
+from expressionCompiler import CompiledExpression, available_backends, calibration_expression, time_backends
+
+
+def make_plane(orientation='xz', offset=Offset(0, 0, 0)):
+    match orientation:
+        case 'xy':
+            corners = [[-100, -100, 0], [-100, 100, 0], [100, -100, 0], [100, 100, 0]]
+        case 'xz':
+            corners = [[-100, 0, -100], [-100, 0, 100], [100, 0, -100], [100, 0, 100]]
+
+    plane = SketchPlane('plane', orientation, 10, *[sp.Matrix([corner]) for corner in corners])
+
+    plane.translate(offset)
+
+    return plane
+
+
+def control_points(count, phase=0):
+    # a wavy profile in the plane's local x/z, deterministic so runs are comparable
+    x = np.linspace(-50, 50, count)
+
+    z = 20 * np.sin(np.linspace(0, 3, count) + phase)
+
+    return sp.Matrix([[float(x[i]), 0, float(z[i])] for i in range(count)])
+
+
+def make_curve(kind, count, density, plane, phase=0):
+    match kind:
+        case 'bezier':
+            return BezierCurve('bezier', control_points(count, phase), density, plane)
+        case 'nurbs':
+            return NURBSCurve('nurbs', control_points(count, phase), min(3, count - 1), density, plane)
+
+
+class Benchmark:
+    def __init__(self, repeat=5, quick=False):
+        self.repeat = repeat
+
+        self.quick = quick
+
+        self.densities = [20, 80] if quick else [20, 80, 320]
+
+        # the bezier basis is hard-coded for 3 to 5 control points, nurbs takes any count
+        self.counts = {'bezier': [3, 5], 'nurbs': [4, 8] if quick else [4, 8, 16, 32]}
+
+        self.intersection_densities = [20] if quick else [20, 40, 80]
+
+        self.backend_points = [10000] if quick else [10000, 250000]
+
+        self.inversion_points = [100] if quick else [100, 10000]
+
+        self.pick_points = [10000] if quick else [10000, 100000]
+
+        self.section_curves = [10] if quick else [10, 100]
+
+        self.cases = {}
+
+        self.results = {}
+
+        self.build_cases()
+
+
+    def add(self, name, setup, run):
+        # setup runs untimed before every repetition so caches never carry over between runs
+        self.cases[name] = (setup, run)
+
+
+    def build_cases(self):
+        for kind, counts in self.counts.items():
+            for count in counts:
+                self.add(f"construct/{kind}/n={count}", make_plane, lambda plane, kind=kind, count=count: make_curve(kind, count, 40, plane))
+
+                for density in self.densities:
+                    self.add(f"trace/{kind}/n={count}/density={density}",
+                             lambda kind=kind, count=count, density=density: make_curve(kind, count, density, make_plane()),
+                             lambda curve: curve.generate_trace())
+
+                self.add(f"transform/{kind}/n={count}",
+                         lambda kind=kind, count=count: make_curve(kind, count, 40, make_plane()),
+                         lambda curve: (curve.translate(Offset(5, 10, 15)), curve.rotate(10, 20, 30)))
+
+        for density in self.densities:
+            self.add(f"grid/plane/density={density}", make_plane, lambda plane, density=density: plane.evaluate_grid(np.linspace(0, 1, density), np.linspace(0, 1, density)))
+
+            for name, build in self.surface_builders().items():
+                self.add(f"grid/{name}/density={density}", build, lambda surface, density=density: surface.evaluate_grid(np.linspace(0, 1, density), np.linspace(0, 1, density)))
+
+        # closest points for a batch of scattered queries, the index built in setup
+        for points in self.inversion_points:
+            self.add(f"inversion/nurbs/points={points}",
+                     lambda points=points: (PointInversion(make_curve('nurbs', 8, 40, make_plane())), self.scattered(points)),
+                     lambda fixture: fixture[0].invert(fixture[1]))
+
+            for name in ('ruled', 'swept'):
+                self.add(f"inversion/{name}/points={points}",
+                         lambda name=name, points=points: (PointInversion(self.surface_builders()[name]()), self.scattered(points)),
+                         lambda fixture: fixture[0].invert(fixture[1]))
+
+        # a click in a fresh view, so projecting every point and indexing the screen are timed with the query,
+        # and a click in a view the ui prepared beforehand, only the query timed
+        for points in self.pick_points:
+            self.add(f"pick/points={points}", lambda points=points: self.pick_fixture(points), lambda fixture: fixture[0].pick(*fixture[1]))
+
+            self.add(f"pick/prepared/points={points}", lambda points=points: self.pick_fixture(points, True), lambda fixture: fixture[0].pick(*fixture[1]))
+
+        # the same compiled patch through every installed backend, kernels built untimed in setup
+        for name in available_backends():
+            for points in self.backend_points:
+                self.add(f"backend/{name}/points={points}",
+                         lambda name=name, points=points: self.backend_fixture(name, points),
+                         lambda fixture: fixture[0](*fixture[1]))
+
+        # two profiles in one sketch plane crossing several times, out of phase
+        for count in self.counts['bezier']:
+            self.add(f"intersection/bezier/n={count}",
+                     lambda count=count: (make_curve('bezier', count, 40, make_plane()), make_curve('bezier', count, 40, make_plane(), 2)),
+                     lambda curves: CurveIntersection(*curves))
+
+        # bezier profiles cut by a stack of section planes, power basis rows and corners warmed in setup so only the root solve is timed
+        for curves in self.section_curves:
+            self.add(f"section/curves={curves}", lambda curves=curves: self.section_fixture(curves), lambda fixture: CurvePlaneIntersection(*fixture))
+
+        for density in self.intersection_densities:
+            self.add(f"intersection/cylindrical/density={density}", self.intersecting_surfaces, lambda surfaces, density=density: IntersectionCurve('intersection', *surfaces, density, 1, make_plane('xy')))
+
+
+    def surface_builders(self):
+        def ruled():
+            return RuledSurface('ruled', make_curve('nurbs', 6, 40, make_plane()), make_curve('nurbs', 6, 40, make_plane(offset=Offset(0, 20, 0)), 1))
+
+        def lofted():
+            return LoftedSurface('lofted', [make_curve('nurbs', 6, 40, make_plane(offset=Offset(0, 10 * k, 0)), k) for k in range(8)])
+
+        def cylindrical():
+            surface = CylindricalSurface('cylindrical', make_curve('nurbs', 6, 40, make_plane()))
+
+            surface.scale_q(50)
+
+            return surface
+
+        def revolved():
+            axis = StraightLine('axis', sp.Matrix([[0, 0, -100]]), sp.Matrix([[0, 0, 100]]), 10, make_plane())
+
+            return RevolvedSurface('revolved', make_curve('nurbs', 6, 40, make_plane(offset=Offset(0, 60, 0))), axis, 360)
+
+        def swept():
+            path = NURBSCurve('path', sp.Matrix([[0, 0, 0], [0, 50, 30], [40, 80, 0], [80, 60, -20]]), 3, 40, make_plane('xy'))
+
+            return SweptSurface('swept', make_curve('nurbs', 6, 40, make_plane()), path, None, False)
+
+        return {'ruled': ruled, 'lofted': lofted, 'cylindrical': cylindrical, 'revolved': revolved, 'swept': swept}
+
+
+    def scattered(self, points):
+        return np.random.default_rng(0).uniform(-60, 60, (points, 3))
+
+
+    def pick_fixture(self, points, prepared=False):
+        axes = plt.figure().add_subplot(projection='3d')
+
+        picker = Picker(axes)
+
+        # features of a thousand points each, as long drawn traces are
+        for k, trace in enumerate(self.scattered(points).reshape(-1, 1000, 3)):
+            picker.add(k, [np.cumsum(trace / 100, axis=0)])
+
+        if prepared:
+            picker.prepare()
+
+        plt.close(axes.figure)
+
+        return picker, axes.transData.transform([0, 0])
+
+
+    def section_fixture(self, count):
+        curves = [make_curve('bezier', 5, 40, make_plane(), k / 10) for k in range(count)]
+
+        for curve in curves:
+            for piece in polynomial_pieces(curve):
+                piece_coefficients(piece)
+
+        planes = [make_plane('xy', Offset(0, 0, z)) for z in np.linspace(-15, 15, 10)]
+
+        for plane in planes:
+            plane.corners()
+
+        return curves, planes
+
+
+    def backend_fixture(self, name, points):
+        compiled = CompiledExpression(*calibration_expression())
+
+        kernel = compiled.kernel(name)
+
+        values = [np.random.default_rng(i).random(points) for i in range(len(compiled.args))]
+
+        kernel(*values)
+
+        return kernel, values
+
+
+    def intersecting_surfaces(self):
+        surface1 = CylindricalSurface('surface 1', make_curve('nurbs', 4, 40, make_plane('xy')))
+        surface1.scale_q(100)
+
+        surface2 = CylindricalSurface('surface 2', make_curve('nurbs', 4, 40, make_plane('xz', Offset(0, -50, 0)), 1))
+        surface2.scale_q(100)
+
+        return surface1, surface2
+
+
+    def time_case(self, setup, run):
+        times = []
+
+        for _ in range(self.repeat):
+            fixture = setup()
+
+            start = time.perf_counter()
+            run(fixture)
+            times.append(time.perf_counter() - start)
+
+        return {'best': min(times), 'median': statistics.median(times), 'repeat': self.repeat}
+
+
+    def run(self, pattern=None):
+        for name, (setup, run) in self.cases.items():
+            if pattern is not None and pattern not in name:
+                continue
+
+            self.results[name] = self.time_case(setup, run)
+
+            print(f"{name:<50} {self.results[name]['best'] * 1e3:10.3f} ms")
+
+        return self.results
+
+
+    def report(self):
+        return {
+            'meta': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'numpy': np.__version__,
+                'sympy': sp.__version__,
+                'repeat': self.repeat,
+                'quick': self.quick,
+                'backend': expressionCompiler.current_backend(),
+            },
+            'results': self.results,
+        }
+
+
+    def save(self, file_name):
+        with open(file_name, 'w') as file:
+            json.dump(self.report(), file, indent=2)
+
+
+    def compare(self, baseline_file, threshold=0.25, noise_floor=1e-4):
+        # a case regresses when its best time grows by more than threshold and by more than the timer noise
+        with open(baseline_file) as file:
+            baseline = json.load(file)['results']
+
+        regressions = []
+
+        for name, result in self.results.items():
+            if name not in baseline:
+                continue
+
+            before = baseline[name]['best']
+            after = result['best']
+
+            ratio = after / before if before > 0 else float('inf')
+
+            regressed = ratio > 1 + threshold and after - before > noise_floor
+
+            if regressed:
+                regressions.append(name)
+
+            print(f"{name:<50} {before * 1e3:10.3f} -> {after * 1e3:10.3f} ms  x{ratio:5.2f}{'  REGRESSION' if regressed else ''}")
+
+        return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="headless geometry benchmarks")
+
+    parser.add_argument('--output', help="write results to this JSON file")
+    parser.add_argument('--baseline', help="compare against a JSON file written by --output")
+    parser.add_argument('--threshold', type=float, default=0.25, help="allowed fractional slowdown before a case counts as a regression")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--filter', help="only run cases whose name contains this")
+    parser.add_argument('--quick', action='store_true', help="smaller density and control point matrix")
+    parser.add_argument('--backend', help="evaluation backend for the run: numpy, numexpr, numba or auto")
+    parser.add_argument('--pick-backend', action='store_true', help="time the installed backends on this machine and report the fastest")
+
+    args = parser.parse_args()
+
+    # timings only compare on the machine that recorded them, so no baseline ships with the repo; record one with --output first
+    if args.baseline and not os.path.exists(args.baseline):
+        parser.error(f"baseline {args.baseline} does not exist, record one on this machine with: python benchmark.py --output {args.baseline}")
+
+    if args.pick_backend:
+        timings = time_backends()
+
+        for name, seconds in sorted(timings.items(), key=lambda item: item[1]):
+            print(f"{name:<50} {seconds * 1e3:10.3f} ms")
+
+        print(f"fastest: {min(timings, key=timings.get)}, select it with CAD_BACKEND or --backend")
+
+        sys.exit(0)
+
+    if args.backend:
+        expressionCompiler.set_backend(args.backend)
+
+    benchmark = Benchmark(args.repeat, args.quick)
+
+    benchmark.run(args.filter)
+
+    if args.output:
+        benchmark.save(args.output)
+
+    if args.baseline:
+        regressions = benchmark.compare(args.baseline, args.threshold)
+
+        if regressions:
+            print(f"{len(regressions)} regressions")
+
+            sys.exit(1)
@@ -2,10 +2,13 @@ import sympy as sp
 import matplotlib.pyplot as plt
 import numpy as np
 
-from CADUtils import Offset
+from CADUtils import Offset, Pose, TraceCache
+from diagnostics import get_logger
 
 from sketchPlane import SketchPlane
 
+log = get_logger(__name__)
+
 class BezierCurve:
     def __init__(self, name, controlPoints, density, sketchPlane : SketchPlane, color='blue'):
         self.name = name
@@ -26,12 +29,14 @@ class BezierCurve:
 
         self.offset = sketchPlane.offset
 
-        print(f"offset in bezier curve {self.name}")
+        log.debug("offset in bezier curve %s", self.name)
 
-        self.offset.print()
+        log.debug("offset: %s", self.offset)
 
         self.u = sp.symbols('u')
 
+        self.trace_cache = TraceCache(self.u)
+
         num = controlPoints.rows
         match num:
             case 3:
@@ -53,88 +58,42 @@ class BezierCurve:
         self.rotate(self.alpha, self.beta, self.gamma)
 
 
-    def generate_trace(self):
-        P = sp.lambdify(self.u, self.P_u)
+    def generate_trace(self, dtype=None):
+        return self.trace_cache.trace(self.P_u, self.density, dtype)
+
 
-        u_eval = np.linspace(0, 1, self.density)
-        P_eval = np.empty((0, 3))
+    def sample(self, u_eval):
+        return self.trace_cache.sample(self.P_u, u_eval)
 
-        for i in range(len(u_eval)):
-            point = P(u_eval[i])
-            P_eval = np.append(P_eval, point, axis=0)
 
-        return P_eval
+    def sample_derivative(self, u_eval, order=1):
+        return self.trace_cache.sample(self.P_u, u_eval, order)
     
 
     def translate(self, offset=Offset(0, 0, 0)):
-        print("translating line")
-        print(f"offset: {offset.x}, {offset.y}, {offset.z}")
+        log.debug("translating line")
+        log.debug("offset: %s, %s, %s", offset.x, offset.y, offset.z)
 
         # offset.subtract(self.offset)
-        # translation matrices
-
-        self.Tx = sp.Matrix([[1, 0, 0, offset.x],
-                        [0, 1, 0, 0],
-                        [0, 0, 1, 0],
-                        [0, 0, 0, 1]])
-        
-        self.Ty = sp.Matrix([[1, 0, 0, 0],
-                        [0, 1, 0, offset.y],
-                        [0, 0, 1, 0],
-                        [0, 0, 0, 1]])
-        
-        self.Tz = sp.Matrix([[1, 0, 0, 0],
-                        [0, 1, 0, 0],
-                        [0, 0, 1, offset.z],
-                        [0, 0, 0, 1]])
-        
-        P_u_h = self.P_u.T.row_insert(self.P_u.T.rows, sp.Matrix([1]))
-
-        P_u_h_transformed = self.Tx * self.Ty * self.Tz * P_u_h
-
-        self.P_u = P_u_h_transformed[:-1, :].T
+        T = Pose.translation(offset)
+
+        self.P_u = T.apply(self.P_u)
 
         # self.offset.add(offset)
 
         # normal vector
 
-        # normal_vector_h = self.normal_vector.T.row_insert(self.normal_vector.T.rows, sp.Matrix([1]))
-
-        # normal_vector_h_transformed = self.Tx * self.Ty * self.Tz * normal_vector_h
-
-        # self.normal_vector = normal_vector_h_transformed[:-1, :].T
+        # self.normal_vector = T.apply(self.normal_vector)
 
 
     def rotate(self, alpha, beta, gamma):
-        # rotation matrices
-        self.Trx = sp.Matrix([[1, 0, 0, 0],
-                        [0, np.cos(np.radians(alpha)), -np.sin(np.radians(alpha)), 0],
-                        [0, np.sin(np.radians(alpha)), np.cos(np.radians(alpha)), 0],
-                        [0, 0, 0, 1]])
-        
-        self.Try = sp.Matrix([[np.cos(np.radians(beta)), 0, -np.sin(np.radians(beta)), 0],
-                              [0, 1, 0, 0],
-                              [np.sin(np.radians(beta)), 0, np.cos(np.radians(beta)), 0],
-                              [0, 0, 0, 1]])
-
-        self.Trz = sp.Matrix([[np.cos(np.radians(gamma)), -np.sin(np.radians(gamma)), 0, 0],
-                         [np.sin(np.radians(gamma)), np.cos(np.radians(gamma)), 0, 0],
-                         [0, 0, 1, 0],
-                         [0, 0, 0, 1]])
-
-        P_u_h = self.P_u.T.row_insert(self.P_u.T.rows, sp.Matrix([1]))
-
-        P_u_h_transformed = self.Trz * self.Try * self.Trx * P_u_h
-        
-        self.P_u = P_u_h_transformed[:-1, :].T
-
-        # normal vector
+        R = Pose.rotation(alpha, beta, gamma)
 
-        # normal_vector_h = self.normal_vector.T.row_insert(self.normal_vector.T.rows, sp.Matrix([1]))
+        self.P_u = R.apply(self.P_u)
 
-        # normal_vector_h_transformed = self.Trz * self.Try * self.Trx * normal_vector_h
+        # normal vector
 
-        # self.normal_vector = normal_vector_h_transformed[:-1, :].T
+        # self.normal_vector = R.apply(self.normal_vector)
 
 
 if __name__ == "__main__":
@@ -2,10 +2,13 @@ import sympy as sp
 import matplotlib.pyplot as plt
 import numpy as np
 
-from CADUtils import Offset
+from CADUtils import Offset, Pose, TraceCache
+from diagnostics import get_logger, Pretty
 
 from sketchPlane import SketchPlane
 
+log = get_logger(__name__)
+
 class SubCurve:
     def __init__(self, name, u, P_u, density, sketchPlane : SketchPlane):
         self.name = name
@@ -25,18 +28,19 @@ class SubCurve:
 
         self.normal_vector = sketchPlane.normal_vector
 
+        self.trace_cache = TraceCache(self.u)
+
     
-    def generate_trace(self):
-        P = sp.lambdify(self.u, self.P_u)
+    def generate_trace(self, dtype=None):
+        return self.trace_cache.trace(self.P_u, self.density, dtype)
 
-        u_eval = np.linspace(0, 1, self.density)
-        P_eval = np.empty((0, 3))
 
-        for i in range(len(u_eval)):
-            point = P(u_eval[i])
-            P_eval = np.append(P_eval, point, axis=0)
+    def sample(self, u_eval):
+        return self.trace_cache.sample(self.P_u, u_eval)
 
-        return P_eval
+
+    def sample_derivative(self, u_eval, order=1):
+        return self.trace_cache.sample(self.P_u, u_eval, order)
 
 
 
@@ -90,7 +94,7 @@ class ClosedUniformBSpline:
                 idxs = []
                 for j in range(order+1):
                     idx = (i-1 + j) % (n+1)
-                    print(idx)
+                    log.debug("sub-curve control points %s", idx)
                     idxs.append(idx)
 
                 Gsub = sp.zeros(order+1, 3)
@@ -98,7 +102,7 @@ class ClosedUniformBSpline:
                     p = G[idx, :]
                     Gsub[j, :] = p
 
-                sp.pretty_print(Gsub)
+                log.debug("Gsub:%s", Pretty(Gsub))
 
                 P_u = self.U * self.M * Gsub
                 curve = SubCurve(f"{self.name} sub-curve{i}", self.u, P_u, self.density, sketchPlane=self.sketch_plane)
@@ -110,74 +114,27 @@ class ClosedUniformBSpline:
 
             
     def translate(self, offset=Offset(0, 0, 0)):
-        print("translating line")
-        print(f"offset: {offset.x}, {offset.y}, {offset.z}")
+        log.debug("translating line")
+        log.debug("offset: %s, %s, %s", offset.x, offset.y, offset.z)
 
         # offset.subtract(self.offset)
-        # translation matrices
+        T = Pose.translation(offset)
 
-        self.Tx = sp.Matrix([[1, 0, 0, offset.x],
-                        [0, 1, 0, 0],
-                        [0, 0, 1, 0],
-                        [0, 0, 0, 1]])
-        
-        self.Ty = sp.Matrix([[1, 0, 0, 0],
-                        [0, 1, 0, offset.y],
-                        [0, 0, 1, 0],
-                        [0, 0, 0, 1]])
-        
-        self.Tz = sp.Matrix([[1, 0, 0, 0],
-                        [0, 1, 0, 0],
-                        [0, 0, 1, offset.z],
-                        [0, 0, 0, 1]])
-        
         for i, curve in enumerate(self.curves):
-            P_u_h = curve.P_u.T.row_insert(curve.P_u.T.rows, sp.Matrix([1]))
-
-            P_u_h_transformed = self.Tx * self.Ty * self.Tz * P_u_h
-
-            self.curves[i].P_u = P_u_h_transformed[:-1, :].T
+            self.curves[i].P_u = T.apply(curve.P_u)
 
 
     def rotate(self, alpha, beta, gamma):
-        # rotation matrices
-        self.Trx = sp.Matrix([[1, 0, 0, 0],
-                        [0, np.cos(np.radians(alpha)), -np.sin(np.radians(alpha)), 0],
-                        [0, np.sin(np.radians(alpha)), np.cos(np.radians(alpha)), 0],
-                        [0, 0, 0, 1]])
-        
-        self.Try = sp.Matrix([[np.cos(np.radians(beta)), 0, -np.sin(np.radians(beta)), 0],
-                              [0, 1, 0, 0],
-                              [np.sin(np.radians(beta)), 0, np.cos(np.radians(beta)), 0],
-                              [0, 0, 0, 1]])
-
-        self.Trz = sp.Matrix([[np.cos(np.radians(gamma)), -np.sin(np.radians(gamma)), 0, 0],
-                         [np.sin(np.radians(gamma)), np.cos(np.radians(gamma)), 0, 0],
-                         [0, 0, 1, 0],
-                         [0, 0, 0, 1]])
+        R = Pose.rotation(alpha, beta, gamma)
 
         for i, curve in enumerate(self.curves):
-            P_u_h = curve.P_u.T.row_insert(curve.P_u.T.rows, sp.Matrix([1]))
-
-            P_u_h_transformed = self.Trz * self.Try * self.Trx * P_u_h
-            
-            self.curves[i].P_u = P_u_h_transformed[:-1, :].T
+            self.curves[i].P_u = R.apply(curve.P_u)
 
     
-    def generate_traces(self):
+    def generate_traces(self, dtype=None):
         traces = []
         for curve in self.curves:
-            print(type(curve))
-            P = sp.lambdify(self.u, curve.P_u)
-
-            u_eval = np.linspace(0, 1, self.density)
-            trace = np.empty((0, 3))
-
-            for i in range(len(u_eval)):
-                point = P(u_eval[i])
-                trace = np.append(trace, point, axis=0)
-
-            traces.append(trace)
+            traces.append(curve.generate_trace(dtype))
         
         return traces
 
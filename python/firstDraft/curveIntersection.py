@@ -0,0 +1,254 @@
+from math import comb
+
+import numpy as np
+
+from CADUtils import power_basis_coefficients
+from diagnostics import get_logger
+
+log = get_logger(__name__)
+
+
+def polynomial_pieces(curve):
+    # a closed b-spline is its sub-curves, every other sketch curve is a single polynomial U * N * G
+    return getattr(curve, 'curves', [curve])
+
+
+def piece_coefficients(piece):
+    # cached on the piece's trace cache where it has one
+    if hasattr(piece, 'trace_cache'):
+        return piece.trace_cache.power_basis(piece.P_u)
+
+    return power_basis_coefficients(piece.P_u, piece.u)
+
+
+def padded_coefficients(pieces, degree):
+    # (n_pieces, degree + 1, 3) power basis rows, lower degree pieces padded with zero rows
+    coefficients = np.zeros((len(pieces), degree + 1, 3))
+
+    for i, piece in enumerate(pieces):
+        rows = piece_coefficients(piece)
+
+        coefficients[i, :rows.shape[0]] = rows
+
+    return coefficients
+
+
+def bernstein_from_power(coefficients):
+    # control points of the same polynomial, b_k = sum over i <= k of C(k, i) / C(n, i) * a_i
+    n = coefficients.shape[-2] - 1
+
+    M = np.array([[comb(k, i) / comb(n, i) if i <= k else 0 for i in range(n + 1)] for k in range(n + 1)])
+
+    return M @ coefficients
+
+
+def split(P):
+    # de casteljau at u = 0.5 for a whole batch of (m, n + 1, 3) control polygons
+    left = [P[:, 0]]
+    right = [P[:, -1]]
+
+    for _ in range(P.shape[1] - 1):
+        P = (P[:, :-1] + P[:, 1:]) / 2
+
+        left.append(P[:, 0])
+        right.append(P[:, -1])
+
+    return np.stack(left, axis=1), np.stack(right[::-1], axis=1)
+
+
+def evaluate(coefficients, u, order=0):
+    # horner over a batch, each row of u with its own piece's coefficients
+    for _ in range(order):
+        coefficients = coefficients[:, 1:] * np.arange(1, coefficients.shape[1])[None, :, None]
+
+    values = coefficients[:, -1].copy()
+
+    for k in range(coefficients.shape[1] - 2, -1, -1):
+        values *= u[:, None]
+        values += coefficients[:, k]
+
+    return values
+
+
+class CurveIntersection:
+    def __init__(self, curve1, curve2, tolerance=1e-6, resolution=None, max_depth=40, max_pairs=200000):
+        # every point where two sketch curves meet, as (piece, u) on each curve and the 3d point
+        self.curve1 = curve1
+        self.curve2 = curve2
+
+        self.tolerance = tolerance
+
+        self.max_depth = max_depth
+
+        self.max_pairs = max_pairs
+
+        pieces1 = polynomial_pieces(curve1)
+        pieces2 = polynomial_pieces(curve2)
+
+        # both curves' pieces at one degree, so every pair of control polygons stacks into one array
+        coefficients1 = [piece_coefficients(piece) for piece in pieces1]
+        coefficients2 = [piece_coefficients(piece) for piece in pieces2]
+
+        degree = max(rows.shape[0] for rows in coefficients1 + coefficients2) - 1
+
+        self.coefficients1 = padded_coefficients(pieces1, degree)
+        self.coefficients2 = padded_coefficients(pieces2, degree)
+
+        self.control1 = bernstein_from_power(self.coefficients1)
+        self.control2 = bernstein_from_power(self.coefficients2)
+
+        if resolution is None:
+            # boxes this small are handed to newton, a thousandth of the pair's extent
+            points = np.concatenate([self.control1.reshape(-1, 3), self.control2.reshape(-1, 3)])
+
+            resolution = 1e-3 * max(np.linalg.norm(points.max(axis=0) - points.min(axis=0)), tolerance)
+
+        self.resolution = resolution
+
+        self.pieces, self.parameters, self.points = self.intersect()
+
+
+    def intersect(self):
+        # all piece pairs subdivided together, a pair survives a level only while its control polygons' boxes overlap
+        first, second = np.meshgrid(np.arange(self.control1.shape[0]), np.arange(self.control2.shape[0]), indexing='ij')
+
+        first = first.ravel()
+        second = second.ravel()
+
+        A = self.control1[first]
+        B = self.control2[second]
+
+        # both polygons are halved each level, so one width serves every pair
+        u1 = np.zeros(first.shape[0])
+        u2 = np.zeros(first.shape[0])
+
+        width = 1.0
+
+        seeds = []
+
+        for depth in range(self.max_depth):
+            lower1, upper1 = A.min(axis=1), A.max(axis=1)
+            lower2, upper2 = B.min(axis=1), B.max(axis=1)
+
+            overlap = np.all((lower1 <= upper2 + self.tolerance) & (lower2 <= upper1 + self.tolerance), axis=-1)
+
+            size = np.maximum(np.linalg.norm(upper1 - lower1, axis=-1), np.linalg.norm(upper2 - lower2, axis=-1))
+
+            done = overlap & (size < self.resolution)
+
+            seeds.append((first[done], second[done], u1[done] + width / 2, u2[done] + width / 2))
+
+            keep = overlap & ~done
+
+            if not np.any(keep):
+                break
+
+            if 4 * np.count_nonzero(keep) > self.max_pairs:
+                # overlapping or tangent stretches keep every pair alive, newton gets them at this size instead
+                log.warning("%d pairs still overlapping at depth %d, the curves may overlap", np.count_nonzero(keep), depth)
+
+                seeds.append((first[keep], second[keep], u1[keep] + width / 2, u2[keep] + width / 2))
+
+                break
+
+            left1, right1 = split(A[keep])
+            left2, right2 = split(B[keep])
+
+            width /= 2
+
+            # children in the order (left, left), (left, right), (right, left), (right, right)
+            A = np.concatenate([left1, left1, right1, right1])
+            B = np.concatenate([left2, right2, left2, right2])
+
+            first = np.tile(first[keep], 4)
+            second = np.tile(second[keep], 4)
+
+            u1 = np.concatenate([u1[keep], u1[keep], u1[keep] + width, u1[keep] + width])
+            u2 = np.concatenate([u2[keep], u2[keep] + width, u2[keep], u2[keep] + width])
+
+        first, second, u1, u2 = [np.concatenate(parts) for parts in zip(*seeds)]
+
+        u1, u2, distances = self.refine(first, second, u1, u2)
+
+        found = distances < self.tolerance
+
+        return self.unique(np.stack([first[found], second[found]], axis=-1), np.stack([u1[found], u2[found]], axis=-1))
+
+
+    def refine(self, first, second, u1, u2, iterations=30):
+        # gauss-newton on |C1(u1) - C2(u2)|, every seed at once, kept inside each piece's [0, 1]
+        coefficients1 = self.coefficients1[first]
+        coefficients2 = self.coefficients2[second]
+
+        for _ in range(iterations):
+            r = evaluate(coefficients1, u1) - evaluate(coefficients2, u2)
+
+            J = np.stack([evaluate(coefficients1, u1, 1), -evaluate(coefficients2, u2, 1)], axis=-1)
+
+            JtJ = np.einsum('nki,nkj->nij', J, J)
+
+            JtJ += (1e-12 * np.trace(JtJ, axis1=1, axis2=2) + 1e-300)[:, None, None] * np.eye(2)
+
+            step = np.linalg.solve(JtJ, -np.einsum('nki,nk->ni', J, r)[..., None])[..., 0]
+
+            u1 = np.clip(u1 + step[:, 0], 0, 1)
+            u2 = np.clip(u2 + step[:, 1], 0, 1)
+
+        distances = np.linalg.norm(evaluate(coefficients1, u1) - evaluate(coefficients2, u2), axis=-1)
+
+        return u1, u2, distances
+
+
+    def unique(self, pieces, parameters):
+        # neighbouring boxes converge on the same point, and a point on a joint of pieces is found from both sides;
+        # at a tangency the copies only agree to within the resolution, newton being slow along the common tangent
+        points = (evaluate(self.coefficients1[pieces[:, 0]], parameters[:, 0]) + evaluate(self.coefficients2[pieces[:, 1]], parameters[:, 1])) / 2
+
+        order = np.lexsort((parameters[:, 1], parameters[:, 0], pieces[:, 1], pieces[:, 0]))
+
+        kept = []
+
+        for i in order:
+            if all(np.linalg.norm(points[i] - points[j]) > self.resolution for j in kept):
+                kept.append(i)
+
+        kept = np.array(kept, dtype=int)
+
+        return pieces[kept].reshape(-1, 2), parameters[kept].reshape(-1, 2), points[kept].reshape(-1, 3)
+
+
+if __name__ == "__main__":
+    import time
+
+    import matplotlib
+    matplotlib.use('Agg')
+
+    import sympy as sp
+
+    from sketchPlane import SketchPlane
+    from straightLine import StraightLine
+    from bezierCurve import BezierCurve
+    from closedUniformBSpline import ClosedUniformBSpline
+
+    plane = SketchPlane('Plane0', 'xz', 10, sp.Matrix([[-100, 0, -100]]), sp.Matrix([[-100, 0, 100]]), sp.Matrix([[100, 0, -100]]), sp.Matrix([[100, 0, 100]]))
+
+    wave1 = BezierCurve('wave1', sp.Matrix([[-60, 0, -20], [-30, 0, 60], [0, 0, -60], [30, 0, 60], [60, 0, -20]]), 40, plane)
+
+    wave2 = BezierCurve('wave2', sp.Matrix([[-60, 0, 10], [-20, 0, -40], [20, 0, 50], [60, 0, -10]]), 40, plane)
+
+    line = StraightLine('line', sp.Matrix([[-80, 0, 5]]), sp.Matrix([[80, 0, 5]]), 40, plane)
+
+    loop = ClosedUniformBSpline('loop', 3, sp.Matrix([[-40, 0, -40], [40, 0, -40], [40, 0, 40], [-40, 0, 40]]), 40, plane)
+
+    for curve1, curve2 in [(wave1, wave2), (wave1, line), (loop, wave1), (loop, line)]:
+        start = time.perf_counter()
+        intersection = CurveIntersection(curve1, curve2)
+        elapsed = time.perf_counter() - start
+
+        # each point should lie on both curves
+        pieces1 = polynomial_pieces(curve1)
+        pieces2 = polynomial_pieces(curve2)
+
+        gap = max([np.linalg.norm(pieces1[i].sample(np.array([s])) - pieces2[j].sample(np.array([t]))) for (i, j), (s, t) in zip(intersection.pieces, intersection.parameters)], default=0)
+
+        print(f"{curve1.name} x {curve2.name}: {intersection.points.shape[0]} points in {elapsed * 1e3:.1f} ms, largest gap {gap:.1e}")
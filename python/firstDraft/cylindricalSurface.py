@@ -8,11 +8,15 @@ from straightLine import StraightLine
 from spline import Spline
 from bezierCurve import BezierCurve
 
-from CADUtils import Offset
+from CADUtils import Offset, Pose, display_grid, grid_traces, sample_curve, unit_normals
+from diagnostics import get_logger, Pretty
+from expressionCompiler import CompiledExpression
+
+log = get_logger(__name__)
 
 class CylindricalSurface:
-    def __init__(self, name, curve, density=40, color='green'):
-        print('init surface')
+    def __init__(self, name, curve, density=40, color='green', numeric=True):
+        log.debug('init surface')
 
         self.name = name
 
@@ -32,36 +36,81 @@ class CylindricalSurface:
 
         self.w = sp.symbols('w')
 
+        self.numeric = numeric
+
+        self.S_u_w_lines = []
+
+        if self.numeric:
+            # the sketch plane normal only carries the plane's rotation once its end points are subtracted
+            normal_vector_ends = self.normal_vector.subs(self.u, 1) - self.normal_vector.subs(self.u, 0)
+
+            self.direction = np.array(normal_vector_ends.tolist(), dtype=float)[0]
+
+            self.depth = 1
+        else:
+            self.build_symbolic()
+
+
+    def build_symbolic(self):
         self.P_u = self.curve.P_u - sp.Matrix([[self.offset.x, self.offset.y, self.offset.z]])
 
         self.Q_w = self.curve.normal_vector.subs(self.u, self.w)
 
 
-        print('p_u')
-        sp.pretty_print(self.P_u)
-        print('q_w')
-        sp.pretty_print(self.Q_w)
+        log.debug("P_u:%s", Pretty(self.P_u))
+        log.debug("Q_w:%s", Pretty(self.Q_w))
 
         self.S_u_w = self.P_u + self.Q_w
 
-        sp.pretty_print(self.S_u_w)
+        log.debug("S_u_w:%s", Pretty(self.S_u_w))
 
-        self.S_u_w_callable = sp.lambdify([self.u, self.w], self.S_u_w)
+        self.S_u_w_callable = CompiledExpression([self.u, self.w], self.S_u_w)
 
-        self.S_u_w_lines = []
+
+    def evaluate_points(self, u, w, derivatives=False):
+        w = np.asarray(w, dtype=float)
+
+        extrusion = self.depth * self.direction
+
+        # extrusion depth only scales the direction, the profile samples come from the curve's cache
+        S = sample_curve(self.curve, u) + w[..., None] * extrusion
+
+        if not derivatives:
+            return S
+
+        S_u = np.broadcast_to(sample_curve(self.curve, u, 1), S.shape)
+
+        S_w = np.broadcast_to(extrusion, S.shape)
+
+        return S, S_u, S_w, unit_normals(S_u, S_w)
+
+
+    def evaluate_grid(self, u_eval=None, w_eval=None, derivatives=False):
+        if u_eval is None:
+            u_eval = self.u_eval
+
+        if w_eval is None:
+            w_eval = self.w_eval
+
+        return self.evaluate_points(np.asarray(u_eval)[:, None], np.asarray(w_eval)[None, :], derivatives)
 
 
     def scale_q(self, scaler):
-        print("scale_q")
-        print(f"offset: {self.curve.offset.x}, {self.curve.offset.y}, {self.curve.offset.z}")
+        if self.numeric:
+            self.depth = scaler
+
+            return
+
+        log.debug("scale_q")
+        log.debug("offset: %s, %s, %s", self.curve.offset.x, self.curve.offset.y, self.curve.offset.z)
 
-        sp.pretty_print(self.S_u_w)
+        log.debug("S_u_w:%s", Pretty(self.S_u_w))
 
         self.rotate_q(-1 * self.curve.alpha, -1 * self.curve.beta, -1 * self.curve.gamma)
 
         self.translate_q(Offset(-1 * self.curve.offset.x, -1 * self.curve.offset.y, -1 * self.curve.offset.z))
 
-        sp.pretty_print(self.S_u_w)
+        log.debug("S_u_w:%s", Pretty(self.S_u_w))
 
         # print("scaling")
         # translation matrices
@@ -92,86 +141,27 @@ class CylindricalSurface:
 
     def translate(self, offset=Offset(0, 0, 0)):
         offset.subtract(self.offset)
-        # translation matrices
-
-        self.Tx = sp.Matrix([[1, 0, 0, offset.x],
-                        [0, 1, 0, 0],
-                        [0, 0, 1, 0],
-                        [0, 0, 0, 1]])
-        
-        self.Ty = sp.Matrix([[1, 0, 0, 0],
-                        [0, 1, 0, offset.y],
-                        [0, 0, 1, 0],
-                        [0, 0, 0, 1]])
-        
-        self.Tz = sp.Matrix([[1, 0, 0, 0],
-                        [0, 1, 0, 0],
-                        [0, 0, 1, offset.z],
-                        [0, 0, 0, 1]])
-        
-        S_u_w_h = self.S_u_w.T.row_insert(self.S_u_w.T.rows, sp.Matrix([1]))
-
-        S_u_w_h_transformed = self.Tx * self.Ty * self.Tz * S_u_w_h
-
-        self.S_u_w = S_u_w_h_transformed[:-1, :].T
-
-        normal_vector_h = self.normal_vector.T.row_insert(self.normal_vector.T.rows, sp.Matrix([1]))
+        T = Pose.translation(offset)
 
-        normal_vector_h_transformed = self.Tx * self.Ty * self.Tz * normal_vector_h
+        self.S_u_w = T.apply(self.S_u_w)
 
-        self.normal_vector = normal_vector_h_transformed[:-1, :].T
+        self.normal_vector = T.apply(self.normal_vector)
 
         self.offset.add(offset)
 
 
     def translate_q(self, offset=Offset(0, 0, 0)):
-        # translation matrices
-
-        self.Tx = sp.Matrix([[1, 0, 0, offset.x],
-                        [0, 1, 0, 0],
-                        [0, 0, 1, 0],
-                        [0, 0, 0, 1]])
+        T = Pose.translation(offset)
         
-        self.Ty = sp.Matrix([[1, 0, 0, 0],
-                        [0, 1, 0, offset.y],
-                        [0, 0, 1, 0],
-                        [0, 0, 0, 1]])
-        
-        self.Tz = sp.Matrix([[1, 0, 0, 0],
-                        [0, 1, 0, 0],
-                        [0, 0, 1, offset.z],
-                        [0, 0, 0, 1]])
-        
-        Q_w_h = self.Q_w.T.row_insert(self.Q_w.T.rows, sp.Matrix([1]))
-
-        Q_w_h_transformed = self.Tx * self.Ty * self.Tz * Q_w_h
-
-        self.Q_w = Q_w_h_transformed[:-1, :].T
+        self.Q_w = T.apply(self.Q_w)
 
         self.S_u_w = self.P_u + self.Q_w
 
     
     def rotate_q(self, alpha, beta, gamma):
-        self.Trx = sp.Matrix([[1, 0, 0, 0],
-                        [0, np.cos(np.radians(alpha)), -np.sin(np.radians(alpha)), 0],
-                        [0, np.sin(np.radians(alpha)), np.cos(np.radians(alpha)), 0],
-                        [0, 0, 0, 1]])
-        
-        self.Try = sp.Matrix([[np.cos(np.radians(beta)), 0, -np.sin(np.radians(beta)), 0],
-                              [0, 1, 0, 0],
-                              [np.sin(np.radians(beta)), 0, np.cos(np.radians(beta)), 0],
-                              [0, 0, 0, 1]])
-
-        self.Trz = sp.Matrix([[np.cos(np.radians(gamma)), -np.sin(np.radians(gamma)), 0, 0],
-                         [np.sin(np.radians(gamma)), np.cos(np.radians(gamma)), 0, 0],
-                         [0, 0, 1, 0],
-                         [0, 0, 0, 1]])
+        R = Pose.rotation(alpha, beta, gamma, order='xyz')
         
-        Q_w_h = self.Q_w.T.row_insert(self.Q_w.T.rows, sp.Matrix([1]))
-
-        Q_w_h_transformed = self.Trx * self.Try * self.Trz * Q_w_h
-
-        self.Q_w = Q_w_h_transformed[:-1, :].T
+        self.Q_w = R.apply(self.Q_w)
 
         self.S_u_w = self.P_u + self.Q_w
 
@@ -185,57 +175,25 @@ class CylindricalSurface:
         self.beta += beta
         self.gamma += gamma
 
-        # rotation matrices
-        self.Trx = sp.Matrix([[1, 0, 0, 0],
-                        [0, np.cos(np.radians(alpha)), -np.sin(np.radians(alpha)), 0],
-                        [0, np.sin(np.radians(alpha)), np.cos(np.radians(alpha)), 0],
-                        [0, 0, 0, 1]])
-        
-        self.Try = sp.Matrix([[np.cos(np.radians(beta)), 0, -np.sin(np.radians(beta)), 0],
-                              [0, 1, 0, 0],
-                              [np.sin(np.radians(beta)), 0, np.cos(np.radians(beta)), 0],
-                              [0, 0, 0, 1]])
-
-        self.Trz = sp.Matrix([[np.cos(np.radians(gamma)), -np.sin(np.radians(gamma)), 0, 0],
-                         [np.sin(np.radians(gamma)), np.cos(np.radians(gamma)), 0, 0],
-                         [0, 0, 1, 0],
-                         [0, 0, 0, 1]])
-        
-        S_u_w_h = self.S_u_w.T.row_insert(self.S_u_w.T.rows, sp.Matrix([1]))
+        R = Pose.rotation(alpha, beta, gamma)
 
-        S_u_w_h_transformed = self.Trz * self.Try * self.Trx * S_u_w_h
-        
-        self.S_u_w = S_u_w_h_transformed[:-1, :].T
+        self.S_u_w = R.apply(self.S_u_w)
 
         # normal vector
 
-        normal_vector_h = self.normal_vector.T.row_insert(self.normal_vector.T.rows, sp.Matrix([1]))
+        self.normal_vector = R.apply(self.normal_vector)
 
-        normal_vector_h_transformed = self.Trz * self.Try * self.Trx * normal_vector_h
+    
+    def generate_traces(self, dtype=None):
+        if self.numeric:
+            self.S_u_w_lines = grid_traces(display_grid(self.evaluate_grid(), dtype))
 
-        self.normal_vector = normal_vector_h_transformed[:-1, :].T
+            return self.S_u_w_lines
 
-    
-    def generate_traces(self):
-        self.S_u_w_lines = []
-        self.S_u_w_callable = sp.lambdify([self.u, self.w], self.S_u_w)
-        # traces along u lines
-        for i in range(len(self.w_eval)):
-            S_u_w_line = np.empty((0, 3))
-            for j in range(len(self.u_eval)):
-                point = self.S_u_w_callable(self.w_eval[i], self.u_eval[j])
-
-                S_u_w_line = np.append(S_u_w_line, point, axis=0)
-            self.S_u_w_lines.append(S_u_w_line)
-
-        # traces along w
-        for i in range(len(self.u_eval)):
-            S_u_w_line = np.empty((0, 3))
-            for j in range(len(self.w_eval)):
-                point = self.S_u_w_callable(self.w_eval[j], self.u_eval[i])
-
-                S_u_w_line = np.append(S_u_w_line, point, axis=0)
-            self.S_u_w_lines.append(S_u_w_line)
+        self.S_u_w_callable = CompiledExpression([self.u, self.w], self.S_u_w)
+
+        # the callable takes w_eval in its first slot and u_eval in its second, as the pointwise traces always did
+        self.S_u_w_lines = grid_traces(display_grid(self.S_u_w_callable.evaluate(self.w_eval[:, None], self.u_eval[None, :]), dtype))
 
         return self.S_u_w_lines
 
@@ -0,0 +1,56 @@
+import logging
+import os
+
+import sympy as sp
+
+# CAD_LOG_LEVEL=DEBUG brings back the expression dumps, anything else keeps them unformatted
+LEVEL_VARIABLE = 'CAD_LOG_LEVEL'
+
+root = logging.getLogger('cad')
+
+if not root.handlers:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(levelname)s %(name)s: %(message)s'))
+
+    root.addHandler(handler)
+
+    root.propagate = False
+
+root.setLevel(os.environ.get(LEVEL_VARIABLE, 'WARNING').upper())
+
+
+def get_logger(name):
+    return logging.getLogger(f'cad.{name}')
+
+
+def set_level(level):
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+
+class Pretty:
+    # defers sp.pretty until a handler actually formats the record
+    __slots__ = ('expression',)
+
+    def __init__(self, expression):
+        self.expression = expression
+
+
+    def __str__(self):
+        return '\n' + sp.pretty(self.expression)
+
+
+if __name__ == "__main__":
+    set_level('DEBUG')
+
+    log = get_logger('demo')
+
+    u = sp.symbols('u')
+
+    log.debug("curve:%s", Pretty(sp.Matrix([[u**2, 1 - u, 3 * u]])))
+
+    set_level('WARNING')
+
+    # not formatted at all at this level
+    log.debug("curve:%s", Pretty(sp.Matrix([[u**2, 1 - u, 3 * u]])))
+
+    log.warning("only warnings get through now")
@@ -0,0 +1,352 @@
+import math
+import multiprocessing
+import os
+import time
+
+import sympy as sp
+import numpy as np
+
+from sympy.printing.lambdarepr import NumExprPrinter
+from sympy.printing.pycode import PythonCodePrinter
+
+from diagnostics import get_logger
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+log = get_logger(__name__)
+
+# expressions with fewer operations than this are lambdified verbatim, cse would only add compile time
+CSE_THRESHOLD = int(os.environ.get('CAD_CSE_THRESHOLD', 40))
+
+# seconds simplify may spend on an expression before it is given up on, 0 turns simplification off
+SIMPLIFY_BUDGET = float(os.environ.get('CAD_SIMPLIFY_BUDGET', 0))
+
+BACKENDS = ('numpy', 'numexpr', 'numba')
+
+backend = 'numpy'
+
+
+def available_backends():
+    return [name for name, module in zip(BACKENDS, (np, numexpr, numba)) if module is not None]
+
+
+def set_backend(name):
+    global backend
+
+    if name != 'auto' and name not in BACKENDS:
+        raise ValueError(f"unknown backend {name}, expected one of {BACKENDS} or auto")
+
+    if name != 'auto' and name not in available_backends():
+        log.warning("%s is not installed, using numpy", name)
+
+        name = 'numpy'
+
+    backend = name
+
+
+# CAD_BACKEND=auto times every installed backend on first use and keeps the fastest
+set_backend(os.environ.get('CAD_BACKEND', 'numpy'))
+
+
+def current_backend():
+    if backend == 'auto':
+        set_backend(calibrate())
+
+    return backend
+
+
+def elements(expression):
+    if isinstance(expression, (list, tuple, sp.MatrixBase)):
+        return list(expression)
+
+    return [expression]
+
+
+def operation_count(expression):
+    # per point cost, every element of a matrix or list counted
+    return sum(sp.count_ops(element) for element in elements(expression))
+
+
+def simplify_all(expression):
+    if isinstance(expression, (list, tuple)):
+        return [sp.simplify(element) for element in expression]
+
+    return sp.simplify(expression)
+
+
+def simplify_within(expression, budget):
+    # simplify cannot be interrupted, so it runs in a child process that is terminated once the budget runs out
+    with multiprocessing.Pool(1) as pool:
+        pending = pool.apply_async(simplify_all, (expression,))
+
+        try:
+            return pending.get(budget)
+        except multiprocessing.TimeoutError:
+            log.debug("simplify gave up after %.1fs", budget)
+
+            return expression
+
+
+def calibration_expression():
+    # swept-like patch: a profile carried along a path, with the path derivative, its norm and an acos of it repeated
+    u, w = sp.symbols('u w')
+
+    derivative = sp.Matrix([1, 2 * w, 3 * w**2])
+
+    norm = sp.sqrt(derivative.dot(derivative))
+
+    angle = sp.acos(1 / norm)
+
+    return [u, w], sp.Matrix([[w + u * sp.cos(angle) * derivative[0] / norm,
+                               w**2 + u * sp.sin(angle) * derivative[1] / norm,
+                               w**3 + u**2 * derivative[2] / norm]])
+
+
+def time_backends(points=250000, repeat=3):
+    # best of repeat seconds per installed backend, after one untimed call that compiles the kernel
+    args, expression = calibration_expression()
+
+    compiled = CompiledExpression(args, expression)
+
+    values = [np.random.default_rng(i).random(points) for i in range(len(args))]
+
+    timings = {}
+
+    for name in available_backends():
+        kernel = compiled.kernel(name)
+
+        kernel(*values)
+
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            kernel(*values)
+            times.append(time.perf_counter() - start)
+
+        timings[name] = min(times)
+
+    return timings
+
+
+def calibrate(points=250000, repeat=3):
+    timings = time_backends(points, repeat)
+
+    fastest = min(timings, key=timings.get)
+
+    log.debug("backend timings %s, using %s", timings, fastest)
+
+    return fastest
+
+
+class NumExprStringPrinter(NumExprPrinter):
+    # the bare numexpr string, without the evaluate(...) call lambdify wraps around it
+    def doprint(self, expr):
+        return super(NumExprPrinter, self).doprint(expr)
+
+
+def fused_kernel_source(args, replacements, outputs):
+    # one loop over the points, every temporary a scalar local, so no intermediate arrays at all
+    printer = PythonCodePrinter({'fully_qualified_modules': True})
+
+    lines = [f"def kernel({', '.join(f'a{i}' for i in range(len(args)))}):",
+             f"    out = numpy.empty((a0.shape[0], {len(outputs)}))",
+             "    for i in range(a0.shape[0]):"]
+
+    for i, arg in enumerate(args):
+        lines.append(f"        {arg} = a{i}[i]")
+
+    for symbol, value in replacements:
+        lines.append(f"        {symbol} = {printer.doprint(value)}")
+
+    for j, output in enumerate(outputs):
+        lines.append(f"        out[i, {j}] = {printer.doprint(output)}")
+
+    lines.append("    return out")
+
+    return '\n'.join(lines)
+
+
+class CompiledExpression:
+    def __init__(self, args, expression, threshold=None, simplify_budget=None):
+        # drop-in for sp.lambdify(args, expression), returning the same shapes
+        self.threshold = CSE_THRESHOLD if threshold is None else threshold
+
+        self.simplify_budget = SIMPLIFY_BUDGET if simplify_budget is None else simplify_budget
+
+        self.args = list(args) if isinstance(args, (list, tuple)) else [args]
+
+        self.operations_before = operation_count(expression)
+
+        self.replacements = []
+
+        self.outputs = elements(expression)
+
+        # the form sp.lambdify(args, expression) returns, a matrix's shape, the sequence type, or None for a scalar
+        if isinstance(expression, sp.MatrixBase):
+            self.form = expression.shape
+        elif isinstance(expression, (list, tuple)):
+            self.form = type(expression)
+        else:
+            self.form = None
+
+        # vectorized kernels, built per backend on first use
+        self.kernels = {}
+
+        if self.operations_before < self.threshold:
+            self.operations_after = self.operations_before
+        else:
+            if self.simplify_budget > 0:
+                simplified = simplify_within(expression, self.simplify_budget)
+
+                if operation_count(simplified) < self.operations_before:
+                    expression = simplified
+
+            # shared temporaries are emitted once as locals of the generated function
+            self.replacements, reduced = sp.cse(expression, list=False)
+
+            self.operations_after = sum(sp.count_ops(value) for _, value in self.replacements) + operation_count(reduced)
+
+            self.outputs = elements(reduced)
+
+            log.debug("compiled %d operations to %d with %d temporaries", self.operations_before, self.operations_after, len(self.replacements))
+
+        # lambdified once, over the flat outputs, for both pointwise calls and the numpy kernel
+        self.function = sp.lambdify(self.args, self.outputs, cse=lambda _: (self.replacements, self.outputs))
+
+
+    def __call__(self, *args):
+        components = self.function(*args)
+
+        if self.form is None:
+            return components[0]
+
+        if not isinstance(self.form, tuple):
+            return self.form(components)
+
+        try:
+            values = np.array(components)
+        except ValueError:
+            # constant components come back as scalars beside the arrays of the varying ones
+            values = np.array(np.broadcast_arrays(*components))
+
+        return values.reshape(self.form + values.shape[1:])
+
+
+    def evaluate(self, *values):
+        # broadcast the arguments against each other, returning their shape + (number of outputs,)
+        values = np.broadcast_arrays(*[np.asarray(value, dtype=float) for value in values])
+
+        shape = values[0].shape
+
+        flat = [np.ascontiguousarray(value.ravel()) for value in values]
+
+        return self.kernel(current_backend())(*flat).reshape(shape + (len(self.outputs),))
+
+
+    def kernel(self, name):
+        if name not in self.kernels:
+            try:
+                self.kernels[name] = getattr(self, f"build_{name}")()
+            except Exception as error:
+                log.warning("%s backend unavailable (%s), falling back to numpy", name, error)
+
+                self.kernels[name] = self.kernel('numpy')
+
+        return self.kernels[name]
+
+
+    def build_numpy(self):
+        def kernel(*flat):
+            return np.stack([np.broadcast_to(component, flat[0].shape) for component in self.function(*flat)], axis=-1).astype(float)
+
+        return kernel
+
+
+    def build_numexpr(self):
+        if numexpr is None:
+            raise ImportError("numexpr is not installed")
+
+        # constants become floats, numexpr knows nothing about math.pi or rationals
+        printer = NumExprStringPrinter()
+
+        steps = [(str(symbol), printer.doprint(value.evalf())) for symbol, value in self.replacements]
+
+        outputs = [printer.doprint(sp.sympify(output).evalf()) for output in self.outputs]
+
+        names = [str(arg) for arg in self.args]
+
+        def kernel(*flat):
+            local = dict(zip(names, flat))
+
+            for name, source in steps:
+                local[name] = numexpr.evaluate(source, local_dict=local)
+
+            out = np.empty((flat[0].shape[0], len(outputs)))
+
+            for j, source in enumerate(outputs):
+                out[:, j] = numexpr.evaluate(source, local_dict=local)
+
+            return out
+
+        return kernel
+
+
+    def build_numba(self):
+        if numba is None:
+            raise ImportError("numba is not installed")
+
+        namespace = {'numpy': np, 'math': math}
+
+        exec(fused_kernel_source(self.args, self.replacements, self.outputs), namespace)
+
+        return numba.njit(namespace['kernel'])
+
+
+    def report(self):
+        return f"{self.operations_before} -> {self.operations_after} operations, {len(self.replacements)} temporaries"
+
+
+if __name__ == "__main__":
+    import matplotlib
+    matplotlib.use('Agg')
+
+    import matplotlib.pyplot as plt
+    import numpy as np
+
+    from sketchPlane import SketchPlane
+    from bezierCurve import BezierCurve
+    from sweptSurface import SweptSurface
+
+    axes = plt.figure().add_subplot(projection='3d')
+
+    pathPlane = SketchPlane('plane', 'xy', 40, sp.Matrix([[-100, -100, 0]]), sp.Matrix([[-100, 100, 0]]), sp.Matrix([[100, -100, 0]]), sp.Matrix([[100, 100, 0]]))
+
+    path = BezierCurve("path", sp.Matrix([[0, 0, 0], [1, 3, 0], [2, 0.5, 0], [3, 2, 0]]), 40, pathPlane)
+
+    curvePlane = SketchPlane('plane', 'xz', 40, sp.Matrix([[-100, 0, -100]]), sp.Matrix([[-100, 0, 100]]), sp.Matrix([[100, 0, -100]]), sp.Matrix([[100, 0, 100]]))
+
+    curve = BezierCurve("profile", sp.Matrix([[0, 0, 0], [-1, 0, 3], [-2, 0, 0.5], [-3, 0, 2]]), 40, curvePlane)
+
+    surface = SweptSurface("swept", curve, path, axes, flipped=True, numeric=False)
+
+    # the swept patch and its partial derivatives, where the repeated path terms add up
+    for label, expression in [('S', surface.S_u_w), ('S_u', sp.diff(surface.S_u_w, surface.u)), ('S_w', sp.diff(surface.S_u_w, surface.w))]:
+        compiled = CompiledExpression([surface.u, surface.w], expression)
+
+        plain = sp.lambdify([surface.u, surface.w], expression)
+
+        # pointwise, the way the symbolic surfaces call their callables
+        error = max(np.max(np.abs(np.asarray(compiled(u, w), dtype=float) - np.asarray(plain(u, w), dtype=float))) for u in np.linspace(0, 1, 7) for w in np.linspace(0, 1, 7))
+
+        print(f"{label:<4} {compiled.report()}, max difference {error:.2e}")
+
+    for name, seconds in time_backends().items():
+        print(f"{name:<8} {seconds * 1e3:8.3f} ms for 250000 points")
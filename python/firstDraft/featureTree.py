@@ -0,0 +1,203 @@
+from sketchPlane import SketchPlane
+
+from CADUtils import display_grid
+
+from diagnostics import get_logger
+from instrumentation import profiler
+
+log = get_logger(__name__)
+
+KINDS = ('sketchPlane', 'curve', 'surface')
+
+
+class Snapshot:
+    # one state of the tree: which features it held, as tuples shared with every other snapshot where that kind did not change.
+    # features are never modified once added, so holding on to them keeps their compiled callables and cached samples too
+    __slots__ = ('kinds', 'counts')
+
+    def __init__(self, kinds, counts):
+        self.kinds = kinds
+
+        self.counts = counts
+
+
+class FeatureTree:
+    def __init__(self):
+        self.sketchPlanesCount = 0
+        self.curveCount = 0
+        self.surfaceCount = 0
+
+        # ids only ever count up, so a deleted feature's id never comes back as another feature
+        self.nextId = 0
+
+        self.byId = {}
+        self.byName = {}
+
+        # one dict per kind, id -> feature in insertion order
+        self.byKind = {kind: {} for kind in KINDS}
+
+        # the last snapshot's tuple of each kind, dropped when that kind changes
+        self.frozen = {}
+
+
+    @property
+    def sketchPlanes(self):
+        return list(self.byKind['sketchPlane'].values())
+
+
+    @property
+    def curves(self):
+        return list(self.byKind['curve'].values())
+
+
+    @property
+    def surfaces(self):
+        return list(self.byKind['surface'].values())
+
+
+    def reserve(self):
+        id = self.nextId
+        self.nextId += 1
+
+        return id
+
+
+    def register(self, feature, kind):
+        # features made through construct already hold the id they were timed under
+        if getattr(feature, 'id', None) is None or feature.id in self.byId:
+            feature.id = self.reserve()
+
+        self.byId[feature.id] = feature
+        self.byKind[kind][feature.id] = feature
+
+        # names are only what the user sees, two features may share one
+        if feature.name in self.byName:
+            log.warning("%s is already the name of feature %s, look it up by id", feature.name, next(iter(self.byName[feature.name])))
+
+        self.byName.setdefault(feature.name, {})[feature.id] = feature
+
+        self.frozen.pop(kind, None)
+
+        return feature.id
+
+
+    def add_sketch_plane(self, sketchPlane:SketchPlane):
+        self.register(sketchPlane, 'sketchPlane')
+        self.sketchPlanesCount += 1
+
+
+    def add_curve(self, curve):
+        self.register(curve, 'curve')
+        self.curveCount += 1
+
+
+    def add_surface(self, surface):
+        self.register(surface, 'surface')
+        self.surfaceCount += 1
+
+
+    def remove(self, feature):
+        # counts stay as they are, they number the names of features still to come
+        feature = self.byId.pop(feature.id)
+
+        for kind, features in self.byKind.items():
+            if features.pop(feature.id, None) is not None:
+                self.frozen.pop(kind, None)
+
+        named = self.byName[feature.name]
+        named.pop(feature.id)
+
+        if not named:
+            del self.byName[feature.name]
+
+
+    def snapshot(self):
+        for kind in KINDS:
+            if kind not in self.frozen:
+                self.frozen[kind] = tuple(self.byKind[kind].values())
+
+        return Snapshot(dict(self.frozen), (self.sketchPlanesCount, self.curveCount, self.surfaceCount))
+
+
+    def restore(self, snapshot:Snapshot):
+        # only the indexes are rebuilt, out of references; nothing is constructed or evaluated again.
+        # nextId is left alone so ids stay unique across undo and redo
+        self.sketchPlanesCount, self.curveCount, self.surfaceCount = snapshot.counts
+
+        self.byKind = {kind: {feature.id: feature for feature in snapshot.kinds[kind]} for kind in KINDS}
+
+        self.byId = {}
+        self.byName = {}
+
+        for features in self.byKind.values():
+            self.byId.update(features)
+
+            for id, feature in features.items():
+                self.byName.setdefault(feature.name, {})[id] = feature
+
+        self.frozen = dict(snapshot.kinds)
+
+
+    def get(self, id):
+        return self.byId.get(id)
+
+
+    def find(self, name, kind=None):
+        # every feature with the name, in the order they were added
+        features = self.byName.get(name, {})
+
+        if kind is None:
+            return list(features.values())
+
+        return [feature for id, feature in features.items() if id in self.byKind[kind]]
+
+
+    def kind_of(self, feature):
+        for kind, features in self.byKind.items():
+            if feature.id in features:
+                return kind
+
+
+    def sketch_plane(self, id):
+        return self.byKind['sketchPlane'].get(id)
+
+
+    def curve(self, id):
+        return self.byKind['curve'].get(id)
+
+
+    def surface(self, id):
+        return self.byKind['surface'].get(id)
+
+
+    def features(self):
+        return self.sketchPlanes + self.curves + self.surfaces
+
+
+    def construct(self, feature_class, name, *args, **kwargs):
+        # construction is timed under the id the feature is about to get, kept when it is added
+        id = self.reserve()
+
+        with profiler.measure('construct', (feature_class.__name__, name, id)):
+            feature = feature_class(name, *args, **kwargs)
+
+        feature.id = id
+
+        return feature
+
+
+    def evaluate(self, feature, dtype=None):
+        # traces of any feature, curves give a single one; drawing passes its display dtype so what stays cached is that size
+        with profiler.measure('evaluate', feature):
+            if hasattr(feature, 'generate_traces'):
+                return feature.generate_traces(dtype)
+
+            return [feature.generate_trace(dtype)]
+
+
+    def evaluate_shaded(self, feature, dtype=None):
+        # positions and unit normals on the surface's own grid, for shaded drawing
+        with profiler.measure('evaluate', feature):
+            S, S_u, S_w, N = feature.evaluate_grid(derivatives=True)
+
+        return display_grid(S, dtype), display_grid(N, dtype)
@@ -0,0 +1,127 @@
+import sympy as sp
+import matplotlib.pyplot as plt
+import numpy as np
+from math import comb, factorial
+
+from CADUtils import Offset, power_basis_coefficients, evaluate_power_basis
+
+from sketchPlane import SketchPlane
+from bezierCurve import BezierCurve
+
+class ForwardDifferenceEvaluator:
+    def __init__(self, curve, chunk_size=65536):
+        self.curve = curve
+
+        self.chunk_size = chunk_size
+
+        # power basis of U * N * G, rows are u**0 .. u**n
+        self.coefficients = power_basis_coefficients(curve.P_u, curve.u)
+
+        self.degree = self.coefficients.shape[0] - 1
+
+        # delta**k of i**j at i = 0 is k! * S(j, k), S being the stirling numbers of the second kind
+        stirling = np.zeros((self.degree + 1, self.degree + 1))
+        stirling[0, 0] = 1
+        for j in range(1, self.degree + 1):
+            for k in range(1, j + 1):
+                stirling[j, k] = k * stirling[j - 1, k] + stirling[j - 1, k - 1]
+
+        self.step_differences = stirling * np.array([factorial(k) for k in range(self.degree + 1)])
+
+
+    def initial_differences(self, u0, h):
+        # taylor coefficients at u0 rescaled to integer steps, g(i) = sum_j b_j * i**j,
+        # so the table comes out exact instead of by cancelling nearly equal values
+        n = self.degree
+
+        b = np.zeros_like(self.coefficients)
+        for j in range(n + 1):
+            for m in range(j, n + 1):
+                b[j] += comb(m, j) * u0 ** (m - j) * self.coefficients[m]
+
+            b[j] *= h ** j
+
+        return self.step_differences.T @ b
+
+
+    def difference_chunk(self, differences, count):
+        # the n-th difference is constant, every lower level is a running sum of the one above
+        values = np.broadcast_to(differences[-1], (count, differences.shape[1]))
+
+        for k in range(self.degree - 1, -1, -1):
+            running = np.empty((count, differences.shape[1]))
+            running[0] = differences[k]
+            np.cumsum(values[:-1], axis=0, out=running[1:])
+            running[1:] += differences[k]
+            values = running
+
+        return np.array(values)
+
+
+    def stream(self, density=None):
+        if density is None:
+            density = self.curve.density
+
+        if density < 2:
+            yield evaluate_power_basis(self.coefficients, np.zeros(density))
+            return
+
+        h = 1 / (density - 1)
+
+        for start in range(0, density, self.chunk_size):
+            count = min(self.chunk_size, density - start)
+
+            # reseed every chunk from the exact polynomial so rounding error cannot build up
+            differences = self.initial_differences(start * h, h)
+
+            yield self.difference_chunk(differences, count)
+
+
+    def generate_trace(self, density=None):
+        return np.concatenate(list(self.stream(density)), axis=0)
+
+
+    def export(self, file_name, density=None, delimiter=','):
+        with open(file_name, 'w') as file:
+            for chunk in self.stream(density):
+                np.savetxt(file, chunk, delimiter=delimiter)
+
+
+if __name__ == "__main__":
+    p0 = sp.Matrix([[-100, 0, -100]])
+    p1 = sp.Matrix([[-100, 0, 100]])
+
+    q0 = sp.Matrix([[100, 0, -100]])
+    q1 = sp.Matrix([[100, 0, 100]])
+
+    myPlane = SketchPlane('plane', 'xz', 40, p0, p1, q0, q1)
+
+    myPlane.translate(Offset(0, 10, 0))
+
+    cps = sp.Matrix([[-20, 0, -30], [0, 0, 30], [20, 0, 0], [50, 0, 30], [60, 0, -20]])
+
+    myBezierCurve = BezierCurve("bezier 1", cps, 40, myPlane)
+
+    evaluator = ForwardDifferenceEvaluator(myBezierCurve, chunk_size=100000)
+
+    peak = 0
+    for chunk in evaluator.stream(1000000):
+        peak = max(peak, np.abs(chunk).max())
+
+    print(f"streamed 1000000 points, max coordinate {peak}")
+
+    trace = evaluator.generate_trace(200)
+
+    figure = plt.figure()
+
+    axes = figure.add_subplot(projection='3d')
+
+    axes.plot(trace[:, 0], trace[:, 1], trace[:, 2])
+
+    axes.set_xlim((-100, 100))
+
+    axes.set_ylim((-100, 100))
+
+    axes.set_zlim((-100, 100))
+
+    plt.show()
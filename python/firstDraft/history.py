@@ -0,0 +1,120 @@
+from featureTree import FeatureTree
+from diagnostics import get_logger
+
+log = get_logger(__name__)
+
+
+class History:
+    def __init__(self, featureTree:FeatureTree, limit=100):
+        # undo/redo over feature tree snapshots, each entry labelled with the change it undoes
+        self.featureTree = featureTree
+
+        self.limit = limit
+
+        self.undoStack = []
+
+        self.redoStack = []
+
+
+    def checkpoint(self, label):
+        # call right before changing the tree, the state being left is what undo goes back to
+        self.undoStack.append((label, self.featureTree.snapshot()))
+
+        if len(self.undoStack) > self.limit:
+            self.undoStack.pop(0)
+
+        self.redoStack.clear()
+
+
+    def can_undo(self):
+        return len(self.undoStack) > 0
+
+
+    def can_redo(self):
+        return len(self.redoStack) > 0
+
+
+    def undo(self):
+        # label of the change undone, None when there is nothing to undo
+        if not self.undoStack:
+            return None
+
+        label, snapshot = self.undoStack.pop()
+
+        self.redoStack.append((label, self.featureTree.snapshot()))
+
+        self.featureTree.restore(snapshot)
+
+        log.debug("undid %s", label)
+
+        return label
+
+
+    def redo(self):
+        if not self.redoStack:
+            return None
+
+        label, snapshot = self.redoStack.pop()
+
+        self.undoStack.append((label, self.featureTree.snapshot()))
+
+        self.featureTree.restore(snapshot)
+
+        log.debug("redid %s", label)
+
+        return label
+
+
+if __name__ == "__main__":
+    import time
+
+    import matplotlib
+    matplotlib.use('Agg')
+
+    import sympy as sp
+
+    from sketchPlane import SketchPlane
+    from nurbsCurve import NURBSCurve
+    from ruledSurface import RuledSurface
+
+    featureTree = FeatureTree()
+
+    history = History(featureTree)
+
+    plane = SketchPlane('Plane0', 'xz', 10, sp.Matrix([[-100, 0, -100]]), sp.Matrix([[-100, 0, 100]]), sp.Matrix([[100, 0, -100]]), sp.Matrix([[100, 0, 100]]))
+
+    featureTree.add_sketch_plane(plane)
+
+    # a model of a hundred curves and the fifty ruled surfaces between them
+    for k in range(100):
+        featureTree.add_curve(NURBSCurve(f"curve{k}", sp.Matrix([[-60, k, -20], [-20, k, 40], [20, k, -30 + k % 7], [60, k, 10]]), 3, 40, plane))
+
+    curves = featureTree.curves
+
+    start = time.perf_counter()
+    for k in range(50):
+        featureTree.add_surface(RuledSurface(f"Surface{k}", curves[2 * k], curves[2 * k + 1], 20))
+    built = time.perf_counter() - start
+
+    for feature in featureTree.features():
+        featureTree.evaluate(feature)
+
+    history.checkpoint('delete surfaces')
+
+    for surface in featureTree.surfaces:
+        featureTree.remove(surface)
+
+    start = time.perf_counter()
+    history.undo()
+    undone = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for surface in featureTree.surfaces:
+        featureTree.evaluate(surface)
+    redrawn = time.perf_counter() - start
+
+    print(f"building 50 surfaces {built * 1e3:.0f} ms, undoing their deletion {undone * 1e3:.2f} ms, evaluating them again {redrawn * 1e3:.0f} ms")
+
+    history.redo()
+
+    print(f"after redo {len(featureTree.surfaces)} surfaces, undo again gives {history.undo() and len(featureTree.surfaces)}")
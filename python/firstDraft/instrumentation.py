@@ -0,0 +1,298 @@
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+import sympy as sp
+
+from expressionCompiler import CompiledExpression
+
+
+def feature_key(feature):
+    # the key a feature's records are kept under and the (category, name) they are shown with. features are told apart
+    # by id, since names can repeat; (category, name, id) stands in for a feature still being constructed, and a
+    # (category, name) tuple for anything that is not a feature or a feature outside any tree
+    if isinstance(feature, tuple):
+        return (feature[2] if len(feature) > 2 else feature), feature[:2]
+
+    label = (type(feature).__name__, feature.name)
+
+    return getattr(feature, 'id', label), label
+
+
+def warm_up():
+    # sympy imports its printers and code generators on the first lambdify and cse, megabytes that would otherwise
+    # be charged to whichever feature happens to be constructed first
+    u, w = sp.symbols('u w')
+
+    CompiledExpression([u, w], sp.Matrix([[u, w, u * w]])).evaluate(np.zeros(2), np.zeros(2))
+
+    CompiledExpression([u, w], sp.Matrix([[sp.cos(u) * sp.sin(w) + u * w] * 3]), threshold=0)
+
+
+class FeatureProfiler:
+    def __init__(self):
+        # timing every construction and redraw costs something on each one, so it only runs when asked for
+        self.enabled = os.environ.get('CAD_PROFILE', '') not in ('', '0')
+
+        self.records = {}
+
+        # the (category, name) each key is shown with
+        self.labels = {}
+
+        # net bytes still allocated when each feature's latest measurement of a phase ended, only filled while memory
+        # accounting is on; the latest rather than a sum, since what a redraw frees happens outside any measurement
+        self.memory_records = {}
+
+        self.memory = False
+
+        # tracemalloc may already be running for someone else, only a session started here is stopped here
+        self.started_tracing = False
+
+        # open measurements, innermost last, each holding its feature key, the time and the bytes of nested measurements
+        self.stack = []
+
+        if os.environ.get('CAD_MEMORY', '') not in ('', '0'):
+            self.enable_memory()
+
+
+    def enable(self):
+        self.enabled = True
+
+
+    def disable(self):
+        self.enabled = False
+
+
+    def enable_memory(self):
+        # tracemalloc slows every allocation down, so it only runs when asked for; memory is measured with the timings
+        warm_up()
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+            self.started_tracing = True
+
+        self.memory = True
+
+        self.enabled = True
+
+
+    def disable_memory(self):
+        if self.started_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+        self.started_tracing = False
+
+        self.memory = False
+
+
+    @contextmanager
+    def measure(self, phase, feature=None):
+        if not self.enabled:
+            yield
+            return
+
+        # nested measurements without a feature (compiles inside an evaluation) belong to the enclosing one
+        if feature is not None:
+            key, label = feature_key(feature)
+
+            self.labels[key] = label
+        elif self.stack:
+            key = self.stack[-1][0]
+        else:
+            key = ('unattributed', '')
+
+            self.labels[key] = key
+
+        frame = [key, 0.0, 0]
+
+        self.stack.append(frame)
+
+        memory = self.memory and tracemalloc.is_tracing()
+
+        if memory:
+            allocated = tracemalloc.get_traced_memory()[0]
+
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+
+            self.stack.pop()
+
+            if self.stack:
+                self.stack[-1][1] += elapsed
+
+            # exclusive time, so a feature's phases add up without double counting
+            self.record(key, phase, elapsed - frame[1])
+
+            if memory:
+                retained = tracemalloc.get_traced_memory()[0] - allocated
+
+                if self.stack:
+                    self.stack[-1][2] += retained
+
+                self.memory_records.setdefault(key, {})[phase] = retained - frame[2]
+
+
+    def record(self, key, phase, seconds):
+        entry = self.records.setdefault(key, {}).setdefault(phase, [0, 0.0])
+
+        entry[0] += 1
+        entry[1] += seconds
+
+
+    def reset(self):
+        self.records = {}
+
+        self.memory_records = {}
+
+
+    def phases(self):
+        return sorted({phase for entry in self.records.values() for phase in entry})
+
+
+    def rows(self, retained=False):
+        # one row per feature: category, name, total seconds, then seconds per phase, and its retained bytes when asked for
+        phases = self.phases()
+
+        rows = []
+        for key, entry in self.records.items():
+            per_phase = [entry[phase][1] if phase in entry else 0.0 for phase in phases]
+
+            row = list(self.labels[key]) + [sum(per_phase)] + per_phase
+
+            if retained:
+                row.append(sum(self.memory_records.get(key, {}).values()))
+
+            rows.append(row)
+
+        rows.sort(key=lambda row: row[2], reverse=True)
+
+        return phases, rows
+
+
+    def memory_rows(self):
+        # retained bytes per feature, then summed per category to show which representations are heavy
+        phases = sorted({phase for entry in self.memory_records.values() for phase in entry})
+
+        rows = []
+        for key, entry in self.memory_records.items():
+            per_phase = [entry.get(phase, 0) for phase in phases]
+
+            rows.append(list(self.labels[key]) + [sum(per_phase)] + per_phase)
+
+        rows.sort(key=lambda row: row[2], reverse=True)
+
+        return phases, rows
+
+
+    def memory_by_category(self):
+        totals = {}
+
+        for key, entry in self.memory_records.items():
+            category = self.labels[key][0]
+
+            totals[category] = totals.get(category, 0) + sum(entry.values())
+
+        return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+
+    def top_allocations(self, limit=10):
+        # where the live memory sits right now, by source line, to tell sympy trees from sample arrays
+        if not tracemalloc.is_tracing():
+            return []
+
+        return tracemalloc.take_snapshot().statistics('lineno')[:limit]
+
+
+    def dump(self, stream=None):
+        if stream is None:
+            stream = sys.stdout
+
+        phases, rows = self.rows()
+
+        header = f"{'category':<22}{'name':<16}{'total ms':>12}" + ''.join(f"{phase + ' ms':>14}" for phase in phases)
+
+        stream.write(header + '\n')
+
+        for row in rows:
+            stream.write(f"{row[0]:<22}{row[1]:<16}{row[2] * 1e3:12.3f}" + ''.join(f"{seconds * 1e3:14.3f}" for seconds in row[3:]) + '\n')
+
+        if not self.memory_records:
+            return
+
+        phases, rows = self.memory_rows()
+
+        stream.write('\n' + f"{'category':<22}{'name':<16}{'total KiB':>12}" + ''.join(f"{phase + ' KiB':>14}" for phase in phases) + '\n')
+
+        for row in rows:
+            stream.write(f"{row[0]:<22}{row[1]:<16}{row[2] / 1024:12.1f}" + ''.join(f"{retained / 1024:14.1f}" for retained in row[3:]) + '\n')
+
+        stream.write('\n' + f"{'category':<38}{'retained KiB':>12}" + '\n')
+
+        for category, retained in self.memory_by_category().items():
+            stream.write(f"{category:<38}{retained / 1024:12.1f}" + '\n')
+
+
+profiler = FeatureProfiler()
+
+
+if __name__ == "__main__":
+    import matplotlib
+    matplotlib.use('Agg')
+
+    import sympy as sp
+
+    from CADUtils import Offset
+    from featureTree import FeatureTree
+    from instrumentation import profiler
+    from sketchPlane import SketchPlane
+    from bezierCurve import BezierCurve
+    from cylindricalSurface import CylindricalSurface
+    from ruledSurface import RuledSurface
+
+    # headless model: build, evaluate everything once and dump the per feature timings,
+    # through the imported module's profiler since that is the one the features report to
+    profiler.enable()
+
+    profiler.enable_memory()
+
+    featureTree = FeatureTree()
+
+    p0 = sp.Matrix([[-100, 0, -100]])
+    p1 = sp.Matrix([[-100, 0, 100]])
+
+    q0 = sp.Matrix([[100, 0, -100]])
+    q1 = sp.Matrix([[100, 0, 100]])
+
+    plane1 = featureTree.construct(SketchPlane, 'Plane0', 'xz', 10, p0, p1, q0, q1)
+    featureTree.add_sketch_plane(plane1)
+
+    plane2 = featureTree.construct(SketchPlane, 'Plane1', 'xz', 10, p0, p1, q0, q1, offset=Offset(0, 20, 0))
+    featureTree.add_sketch_plane(plane2)
+
+    curve1 = featureTree.construct(BezierCurve, 'curve0', sp.Matrix([[-20, 0, -30], [0, 0, 30], [20, 0, 0], [50, 0, 30], [60, 0, -20]]), 40, plane1)
+    featureTree.add_curve(curve1)
+
+    curve2 = featureTree.construct(BezierCurve, 'curve1', sp.Matrix([[-10, 0, -50], [0, 0, 50], [30, 0, 0]]), 40, plane2)
+    featureTree.add_curve(curve2)
+
+    featureTree.add_surface(featureTree.construct(RuledSurface, 'Surface0', curve1, curve2, 40))
+
+    featureTree.add_surface(featureTree.construct(CylindricalSurface, 'Surface1', curve1, 40))
+
+    for feature in featureTree.features():
+        featureTree.evaluate(feature)
+
+    profiler.dump()
+
+    print()
+
+    for statistic in profiler.top_allocations(5):
+        print(statistic)
@@ -3,6 +3,7 @@ import sympy as sp
 import numpy as np
 
 from CADUtils import Offset
+from diagnostics import get_logger, Pretty
 from sketchPlane import SketchPlane
 from straightLine import StraightLine
 from spline import Spline
@@ -14,6 +15,8 @@ from ruledSurface import RuledSurface
 from loftedSurface import LoftedSurface
 from sweptSurface import SweptSurface
 
+log = get_logger(__name__)
+
 
 class IntersectionCurve():
     def __init__(self, name, surface1, surface2, density, tolerance, sketchPlane: SketchPlane):
@@ -40,27 +43,29 @@ class IntersectionCurve():
 
         G_intersection = sp.Matrix([self.intersection_points[0], self.intersection_points[self.intersection_points.shape[0] // 3], self.intersection_points[(self.intersection_points.shape[0]-1) * 2 // 3], self.intersection_points[self.intersection_points.shape[0]-1]])
 
-        sp.pretty_print(G_intersection)
+        log.debug("G_intersection:%s", Pretty(G_intersection))
 
         self.curve_itself = Spline(self.name, G_intersection, 40, sketchPlane)
 
 
-    def get_intersection_points(self, tolerance):
-        # precompute all surface1 points
-        surface1_points = []
-        for u in self.u_eval:
-            for w in self.w_eval:
-                p = self.surface1.S_u_w.subs({self.u: u, self.w: w}).evalf()
-                surface1_points.append([float(p[idx]) for idx in range(3)])
-        surface1_points = np.array(surface1_points)  # shape: (n1, 3)
+    def sample_surface(self, surface):
+        if getattr(surface, 'numeric', False):
+            return surface.evaluate_grid(self.u_eval, self.w_eval).reshape(-1, 3)
 
-        # precompute all surface2 points
-        surface2_points = []
+        surface_points = []
         for u in self.u_eval:
             for w in self.w_eval:
-                p = self.surface2.S_u_w.subs({self.u: u, self.w: w}).evalf()
-                surface2_points.append([float(p[idx]) for idx in range(3)])
-        surface2_points = np.array(surface2_points)  # shape: (n2, 3)
+                p = surface.S_u_w.subs({self.u: u, self.w: w}).evalf()
+                surface_points.append([float(p[idx]) for idx in range(3)])
+
+        return np.array(surface_points)  # shape: (n, 3)
+
+
+    def get_intersection_points(self, tolerance):
+        # precompute all surface points
+        surface1_points = self.sample_surface(self.surface1)
+
+        surface2_points = self.sample_surface(self.surface2)
 
         # find intersections
         intersection_points = []
@@ -8,11 +8,15 @@ from straightLine import StraightLine
 from spline import Spline
 from bezierCurve import BezierCurve
 
-from CADUtils import Offset
+from CADUtils import Offset, display_grid, grid_traces, sample_curve, unit_normals
+from diagnostics import get_logger, Pretty
+from expressionCompiler import CompiledExpression
+
+log = get_logger(__name__)
 
 class LoftedSurface:
 
-    def __init__(self, name, curves, density=40, color='green'):
+    def __init__(self, name, curves, density=40, color='green', numeric=True):
         self.u = sp.symbols('u')
 
         self.w = sp.symbols('w')
@@ -25,11 +29,25 @@ class LoftedSurface:
 
         self.color = color
 
-        self.curves = [curve.P_u for curve in curves]
+        self.section_curves = list(curves)
 
         self.curve_count = len(curves)
 
-        print(self.curve_count)
+        self.numeric = numeric
+
+        if self.curve_count < 2:
+            raise ValueError(f"a loft needs at least 2 curves, got {self.curve_count}")
+
+        if self.numeric:
+            self.build_blend()
+        else:
+            self.build_symbolic()
+
+
+    def build_symbolic(self):
+        self.curves = [curve.P_u for curve in self.section_curves]
+
+        log.debug("lofting %s curves", self.curve_count)
 
         match self.curve_count:
             case 2:
@@ -44,41 +62,112 @@ class LoftedSurface:
             case 5:
                 self.W = sp.Matrix([[self.w**4, self.w**3, self.w**2, self.w, 1]])
                 self.Nspl = sp.Matrix([[0, 0, 0, 0, 1], [(1/4)**4, (1/4)**3, (1/4)**2, 1/4, 1], [(2/4)**4, (2/4)**3, (2/4)**2, 2/4, 1], [(3/4)**4, (3/4)**3, (3/4)**2, 3/4, 1], [1, 1, 1, 1, 1]]) ** -1
+            case _:
+                raise ValueError(f"the symbolic loft supports 2 to 5 curves, got {self.curve_count}")
 
         Gsur = sp.Matrix([curve for curve in self.curves])
 
-        sp.pretty_print(self.W)
+        log.debug("W:%s", Pretty(self.W))
 
-        sp.pretty_print(self.Nspl)
+        log.debug("Nspl:%s", Pretty(self.Nspl))
 
-        sp.pretty_print(Gsur)
+        log.debug("Gsur:%s", Pretty(Gsur))
 
         for curve in self.curves:
-            sp.pretty_print(curve)
+            log.debug("curve:%s", Pretty(curve))
 
         self.S_u_w = self.W * self.Nspl * Gsur
 
 
-    def generate_traces(self):
-        self.S_u_w_lines = []
-        self.S_u_w_callable = sp.lambdify([self.u, self.w], self.S_u_w)
-        # traces along u lines
-        for i in range(len(self.w_eval)):
-            S_u_w_line = np.empty((0, 3))
-            for j in range(len(self.u_eval)):
-                point = self.S_u_w_callable(self.w_eval[i], self.u_eval[j])
+    def build_blend(self):
+        # natural cubic spline through the sections at evenly spaced w, the same stations the symbolic loft uses
+        n = self.curve_count
+
+        self.section_w = np.linspace(0, 1, n)
+
+        self.h = 1 / (n - 1)
+
+        # second derivatives at the stations are a fixed linear map of the section positions
+        A = np.zeros((n, n))
+        D = np.zeros((n, n))
+
+        A[0, 0] = 1
+        A[-1, -1] = 1
+
+        for i in range(1, n - 1):
+            A[i, i - 1:i + 2] = [1, 4, 1]
+            D[i, i - 1:i + 2] = np.array([1, -2, 1]) * 6 / self.h ** 2
+
+        self.second_derivative_map = np.linalg.solve(A, D)
+
+
+    def blend_weights(self, w, order=0):
+        # weights of every section at each w, so a whole grid blends with one matmul
+        w = np.asarray(w, dtype=float)
+
+        n = self.curve_count
+        h = self.h
+
+        i = np.clip(np.searchsorted(self.section_w, w, side='right') - 1, 0, n - 2)
+
+        before = (w - self.section_w[i])[..., None]
+        after = (self.section_w[i + 1] - w)[..., None]
+
+        identity = np.eye(n)
+        M = self.second_derivative_map
+
+        if order == 1:
+            return (identity[i + 1] - identity[i]) / h + M[i] * (h / 6 - after ** 2 / (2 * h)) + M[i + 1] * (before ** 2 / (2 * h) - h / 6)
+
+        return (identity[i] * after / h + identity[i + 1] * before / h
+                + M[i] * (after ** 3 / (6 * h) - h * after / 6)
+                + M[i + 1] * (before ** 3 / (6 * h) - h * before / 6))
+
+
+    def evaluate_points(self, u, w, derivatives=False):
+        u = np.asarray(u, dtype=float)
+
+        # every section is sampled once through its curve's cache
+        sections = np.stack([sample_curve(curve, u) for curve in self.section_curves], axis=-2)
+
+        weights = self.blend_weights(w)
+
+        S = (weights[..., None, :] @ sections)[..., 0, :]
+
+        if not derivatives:
+            return S
+
+        section_derivatives = np.stack([sample_curve(curve, u, 1) for curve in self.section_curves], axis=-2)
+
+        S_u = (weights[..., None, :] @ section_derivatives)[..., 0, :]
+
+        S_w = (self.blend_weights(w, 1)[..., None, :] @ sections)[..., 0, :]
+
+        S_u, S_w = np.broadcast_arrays(S_u, S_w)
+
+        return S, S_u, S_w, unit_normals(S_u, S_w)
+
+
+    def evaluate_grid(self, u_eval=None, w_eval=None, derivatives=False):
+        if u_eval is None:
+            u_eval = self.u_eval
+
+        if w_eval is None:
+            w_eval = self.w_eval
+
+        return self.evaluate_points(np.asarray(u_eval)[:, None], np.asarray(w_eval)[None, :], derivatives)
+
+
+    def generate_traces(self, dtype=None):
+        if self.numeric:
+            self.S_u_w_lines = grid_traces(display_grid(self.evaluate_grid(), dtype))
 
-                S_u_w_line = np.append(S_u_w_line, point, axis=0)
-            self.S_u_w_lines.append(S_u_w_line)
+            return self.S_u_w_lines
 
-        # traces along w
-        for i in range(len(self.u_eval)):
-            S_u_w_line = np.empty((0, 3))
-            for j in range(len(self.w_eval)):
-                point = self.S_u_w_callable(self.w_eval[j], self.u_eval[i])
+        self.S_u_w_callable = CompiledExpression([self.u, self.w], self.S_u_w)
 
-                S_u_w_line = np.append(S_u_w_line, point, axis=0)
-            self.S_u_w_lines.append(S_u_w_line)
+        # the callable takes w_eval in its first slot and u_eval in its second, as the pointwise traces always did
+        self.S_u_w_lines = grid_traces(display_grid(self.S_u_w_callable.evaluate(self.w_eval[:, None], self.u_eval[None, :]), dtype))
 
         return self.S_u_w_lines
     
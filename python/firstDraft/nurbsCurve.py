@@ -0,0 +1,342 @@
+import sympy as sp
+import matplotlib.pyplot as plt
+import numpy as np
+from math import comb
+
+from CADUtils import Offset, Pose, TraceCache
+
+from sketchPlane import SketchPlane
+
+class NURBSCurve:
+    def __init__(self, name, controlPoints, degree, density, sketchPlane : SketchPlane, knots=None, weights=None, color='blue'):
+        self.name = name
+
+        self.color = color
+
+        self.density = density
+
+        self.sketch_plane = sketchPlane
+
+        self.normal_vector = sketchPlane.normal_vector
+
+        self.alpha = sketchPlane.alpha
+
+        self.beta = sketchPlane.beta
+
+        self.gamma = sketchPlane.gamma
+
+        self.offset = sketchPlane.offset
+
+        self.u = sp.symbols('u')
+
+        self.Gsl = controlPoints
+
+        num = controlPoints.rows
+
+        if degree < 1 or degree >= num:
+            raise ValueError(f"degree {degree} needs at least {degree + 1} control points, got {num}")
+
+        self.degree = degree
+
+        # clamped uniform knot vector unless one is given
+        if knots is None:
+            knots = np.concatenate([np.zeros(degree), np.linspace(0, 1, num - degree + 1), np.ones(degree)])
+
+        knots = np.asarray(knots, dtype=float)
+
+        if knots.shape[0] != num + degree + 1:
+            raise ValueError(f"expected {num + degree + 1} knots, got {knots.shape[0]}")
+
+        if np.any(np.diff(knots) < 0):
+            raise ValueError("knot vector must be non-decreasing")
+
+        # map the valid domain [knots[p], knots[n + 1]] onto u in [0, 1] like every other curve
+        self.knots = (knots - knots[degree]) / (knots[num] - knots[degree])
+
+        if weights is None:
+            weights = np.ones(num)
+
+        self.weights = np.asarray(weights, dtype=float)
+
+        if self.weights.shape[0] != num:
+            raise ValueError(f"expected {num} weights, got {self.weights.shape[0]}")
+
+        self.control_points = np.array(controlPoints.tolist(), dtype=float)
+
+        # basis rows only depend on the knots, so they survive translate/rotate
+        self.basis_cache = {}
+
+        self.basis_cache_size = 8
+
+        self.traces = {}
+
+        self.trace_cache = TraceCache(self.u)
+
+        self._P_u = None
+
+        self.P_u_overridden = False
+
+        self.translate(self.offset)
+
+        self.rotate(self.alpha, self.beta, self.gamma)
+
+
+    @property
+    def P_u(self):
+        if self._P_u is None:
+            self._P_u = self.build_P_u()
+
+        return self._P_u
+
+
+    @P_u.setter
+    def P_u(self, P_u):
+        # surfaces that move the curve symbolically take over evaluation until the next translate/rotate
+        self._P_u = P_u
+
+        self.P_u_overridden = True
+
+
+    def build_P_u(self):
+        basis = sp.bspline_basis_set(self.degree, [float(knot) for knot in self.knots], self.u)
+
+        N = sp.Matrix([basis])
+
+        Pw = sp.Matrix(self.weighted_control_points())
+
+        numerator = N * Pw[:, :3]
+
+        denominator = (N * Pw[:, 3])[0]
+
+        return numerator / denominator
+
+
+    def weighted_control_points(self):
+        return np.hstack([self.control_points * self.weights[:, None], self.weights[:, None]])
+
+
+    def find_spans(self, u_eval):
+        p = self.degree
+        n = self.control_points.shape[0] - 1
+
+        u_eval = np.clip(u_eval, self.knots[p], self.knots[n + 1])
+
+        spans = np.searchsorted(self.knots, u_eval, side='right') - 1
+
+        return np.clip(spans, p, n), u_eval
+
+
+    def basis_functions(self, u_eval, order=0):
+        # vectorized Cox-de Boor (The NURBS Book A2.3) over every sample at once
+        p = self.degree
+        U = self.knots
+
+        spans, u_eval = self.find_spans(u_eval)
+
+        m = u_eval.shape[0]
+
+        left = np.zeros((m, p + 1))
+        right = np.zeros((m, p + 1))
+
+        ndu = np.zeros((m, p + 1, p + 1))
+        ndu[:, 0, 0] = 1
+
+        for j in range(1, p + 1):
+            left[:, j] = u_eval - U[spans + 1 - j]
+            right[:, j] = U[spans + j] - u_eval
+            saved = np.zeros(m)
+
+            for r in range(j):
+                ndu[:, j, r] = right[:, r + 1] + left[:, j - r]
+                temp = ndu[:, r, j - 1] / ndu[:, j, r]
+                ndu[:, r, j] = saved + right[:, r + 1] * temp
+                saved = left[:, j - r] * temp
+
+            ndu[:, j, j] = saved
+
+        ders = np.zeros((order + 1, m, p + 1))
+        ders[0] = ndu[:, :, p]
+
+        a = np.zeros((2, m, p + 1))
+
+        for r in range(p + 1):
+            s1 = 0
+            s2 = 1
+            a[0, :, 0] = 1
+
+            for k in range(1, min(order, p) + 1):
+                d = np.zeros(m)
+                rk = r - k
+                pk = p - k
+
+                if r >= k:
+                    a[s2, :, 0] = a[s1, :, 0] / ndu[:, pk + 1, rk]
+                    d = a[s2, :, 0] * ndu[:, rk, pk]
+
+                j1 = 1 if rk >= -1 else -rk
+                j2 = k - 1 if r - 1 <= pk else p - r
+
+                for j in range(j1, j2 + 1):
+                    a[s2, :, j] = (a[s1, :, j] - a[s1, :, j - 1]) / ndu[:, pk + 1, rk + j]
+                    d = d + a[s2, :, j] * ndu[:, rk + j, pk]
+
+                if r <= pk:
+                    a[s2, :, k] = -a[s1, :, k - 1] / ndu[:, pk + 1, r]
+                    d = d + a[s2, :, k] * ndu[:, r, pk]
+
+                ders[k, :, r] = d
+
+                s1, s2 = s2, s1
+
+        factor = p
+        for k in range(1, min(order, p) + 1):
+            ders[k] *= factor
+            factor *= p - k
+
+        return spans, ders
+
+
+    def basis_matrix(self, u_eval, order=0):
+        # sparse basis: row i only has degree + 1 non-zeros, starting at column spans[i] - degree
+        u_eval = np.asarray(u_eval, dtype=float)
+
+        key = (u_eval.tobytes(), order)
+
+        if key not in self.basis_cache:
+            if len(self.basis_cache) >= self.basis_cache_size:
+                self.basis_cache.pop(next(iter(self.basis_cache)))
+
+            self.basis_cache[key] = self.basis_functions(u_eval, order)
+
+        return self.basis_cache[key]
+
+
+    def homogeneous_derivatives(self, u_eval, order=0):
+        spans, ders = self.basis_matrix(u_eval, order)
+
+        columns = spans[:, None] - self.degree + np.arange(self.degree + 1)
+
+        Pw = self.weighted_control_points()[columns]
+
+        return np.einsum('kmj,mjd->kmd', ders, Pw)
+
+
+    def sample(self, u_eval):
+        if self.P_u_overridden:
+            return self.trace_cache.sample(self.P_u, u_eval)
+
+        u_eval = np.atleast_1d(u_eval)
+
+        A = self.homogeneous_derivatives(u_eval)[0]
+
+        return A[:, :3] / A[:, 3:]
+
+
+    def sample_derivative(self, u_eval, order=1):
+        # rational derivatives from the homogeneous ones (The NURBS Book A4.2)
+        if self.P_u_overridden:
+            return self.trace_cache.sample(self.P_u, u_eval, order)
+
+        u_eval = np.atleast_1d(u_eval)
+
+        Aders = self.homogeneous_derivatives(u_eval, order)
+
+        w = Aders[:, :, 3:]
+
+        C = []
+        for k in range(order + 1):
+            v = Aders[k, :, :3]
+
+            for i in range(1, k + 1):
+                v = v - comb(k, i) * w[i] * C[k - i]
+
+            C.append(v / w[0])
+
+        return C[order]
+
+
+    def generate_trace(self, dtype=None):
+        if self.P_u_overridden:
+            return self.trace_cache.trace(self.P_u, self.density, dtype)
+
+        # traces by density and precision, drawing asks for float32 and evaluation for float64
+        key = (self.density, np.dtype(float if dtype is None else dtype))
+
+        if key not in self.traces:
+            trace = self.sample(np.linspace(0, 1, self.density)).astype(key[1], copy=False)
+            trace.flags.writeable = False
+            self.traces[key] = trace
+
+        return self.traces[key]
+
+
+    def transform_control_points(self, T):
+        T = np.asarray(T, dtype=float)
+
+        control_points_h = np.hstack([self.control_points, np.ones((self.control_points.shape[0], 1))])
+
+        self.control_points = (control_points_h @ T.T)[:, :3]
+
+        self._P_u = None
+
+        self.P_u_overridden = False
+
+        self.traces = {}
+
+
+    def translate(self, offset=Offset(0, 0, 0)):
+        T = Pose.translation(offset)
+
+        # rational curves are affinely invariant, so only the control points move
+        self.transform_control_points(T.matrix)
+
+
+    def rotate(self, alpha, beta, gamma):
+        R = Pose.rotation(alpha, beta, gamma)
+
+        self.transform_control_points(R.matrix)
+
+
+if __name__ == "__main__":
+    p0 = sp.Matrix([[-100, -100, 0]])
+    p1 = sp.Matrix([[-100, 100, 0]])
+
+    q0 = sp.Matrix([[100, -100, 0]])
+    q1 = sp.Matrix([[100, 100, 0]])
+
+    myPlane = SketchPlane('plane', 'xy', 40, p0, p1, q0, q1)
+
+    myPlane.translate(Offset(0, 0, 10))
+
+    # full circle from nine weighted control points
+    cps = sp.Matrix([[50, 0, 0], [50, 50, 0], [0, 50, 0], [-50, 50, 0], [-50, 0, 0], [-50, -50, 0], [0, -50, 0], [50, -50, 0], [50, 0, 0]])
+
+    knots = [0, 0, 0, 1/4, 1/4, 1/2, 1/2, 3/4, 3/4, 1, 1, 1]
+
+    weights = [1, np.sqrt(2)/2, 1, np.sqrt(2)/2, 1, np.sqrt(2)/2, 1, np.sqrt(2)/2, 1]
+
+    myCircle = NURBSCurve("circle", cps, 2, 200, myPlane, knots=knots, weights=weights)
+
+    myFreeform = NURBSCurve("freeform", sp.Matrix([[-80, -60, 0], [-60, 20, 0], [-20, -40, 0], [0, 40, 0], [40, 0, 0], [80, 60, 0]]), 3, 200, myPlane, color='red')
+
+    circleTrace = myCircle.generate_trace()
+
+    freeformTrace = myFreeform.generate_trace()
+
+    figure = plt.figure()
+
+    axes = figure.add_subplot(projection='3d')
+
+    axes.plot(circleTrace[:, 0], circleTrace[:, 1], circleTrace[:, 2], color=myCircle.color)
+
+    axes.plot(freeformTrace[:, 0], freeformTrace[:, 1], freeformTrace[:, 2], color=myFreeform.color)
+
+    axes.plot(myFreeform.control_points[:, 0], myFreeform.control_points[:, 1], myFreeform.control_points[:, 2], color='grey', linestyle='--')
+
+    axes.set_xlim((-100, 100))
+
+    axes.set_ylim((-100, 100))
+
+    axes.set_zlim((-100, 100))
+
+    plt.show()
@@ -0,0 +1,141 @@
+import numpy as np
+
+from mpl_toolkits.mplot3d import proj3d
+
+from spatialIndex import SpatialIndex
+
+
+class Picker:
+    def __init__(self, axes, tolerance=5):
+        # nearest drawn feature under a click on a 3d axes, tolerance in pixels
+        self.axes = axes
+
+        self.tolerance = tolerance
+
+        self.clear()
+
+
+    def clear(self):
+        self.features = []
+
+        self.traces = []
+
+        # everything below is rebuilt lazily, the points when features change and the screen positions when the view does
+        self.points = None
+
+        self.owners = None
+
+        self.screen = None
+
+        self.index = None
+
+        self.view = None
+
+
+    def add(self, feature, traces):
+        # the traces exactly as drawn, the features' own cached samples at display precision, so picking never
+        # re-evaluates or copies anything
+        self.features.append(feature)
+
+        self.traces.append([np.asarray(trace).reshape(-1, 3) for trace in traces])
+
+        self.points = None
+
+
+    def gather(self):
+        # one (n, 3) array of every drawn point and the feature each belongs to
+        counts = [sum(trace.shape[0] for trace in traces) for traces in self.traces]
+
+        self.points = np.concatenate([trace for traces in self.traces for trace in traces] or [np.empty((0, 3))])
+
+        self.owners = np.repeat(np.arange(len(self.features)), counts)
+
+        self.view = None
+
+
+    def project(self):
+        # every point to display pixels in one pass: mplot3d's projection, then the axes' data transform
+        x, y, _ = proj3d.proj_transform(self.points[:, 0], self.points[:, 1], self.points[:, 2], self.axes.get_proj())
+
+        return self.axes.transData.transform(np.column_stack([x, y]))
+
+
+    def prepare(self):
+        # points, screen positions and index for the current view; the ui calls this once a view settles, so a click
+        # finds them ready, and pick falls back on it when the view moved without one (a resize)
+        if self.points is None:
+            self.gather()
+
+        if self.points.shape[0] == 0:
+            return
+
+        # rotating, zooming or resizing moves every point on screen
+        view = (self.axes.get_proj().tobytes(), self.axes.transData.get_matrix().tobytes())
+
+        if view != self.view:
+            self.screen = self.project()
+
+            self.index = SpatialIndex(self.screen)
+
+            self.view = view
+
+
+    def pick(self, x, y):
+        # x, y in display pixels, as matplotlib mouse events give them; None when nothing is close enough
+        self.prepare()
+
+        if self.points.shape[0] == 0:
+            return None
+
+        indices, distances = self.index.nearest([[x, y]])
+
+        if distances[0] > self.tolerance:
+            return None
+
+        return self.features[self.owners[indices[0]]]
+
+
+if __name__ == "__main__":
+    import time
+
+    import matplotlib
+    matplotlib.use('Agg')
+
+    import matplotlib.pyplot as plt
+
+    axes = plt.figure().add_subplot(projection='3d')
+
+    axes.set_xlim((-100, 100))
+    axes.set_ylim((-100, 100))
+    axes.set_zlim((-100, 100))
+
+    # fifty helices of a thousand points each, standing in for fifty drawn features
+    t = np.linspace(0, 4 * np.pi, 1000)
+
+    picker = Picker(axes)
+
+    for k in range(50):
+        picker.add(f"helix{k}", [np.stack([80 * np.cos(t + k), 80 * np.sin(t + k), 80 * (t / (2 * np.pi) - 1) + k], axis=-1)])
+
+    picker.gather()
+
+    target = picker.project()[31234]
+
+    # what the ui does once a view settles, before any click comes
+    start = time.perf_counter()
+    picker.prepare()
+    prepared = time.perf_counter() - start
+
+    start = time.perf_counter()
+    first = picker.pick(*target)
+    elapsed = time.perf_counter() - start
+
+    # a new view is prepared again, here by the click itself
+    axes.view_init(10, 20)
+
+    start = time.perf_counter()
+    again = picker.pick(*picker.project()[31234])
+    unprepared = time.perf_counter() - start
+
+    print(f"picked {first} of {picker.points.shape[0]} points in {elapsed * 1e3:.2f} ms, {prepared * 1e3:.1f} ms preparing the view beforehand, "
+          f"{unprepared * 1e3:.1f} ms for a click in a view that was not prepared; same pick {again == first}")
@@ -0,0 +1,237 @@
+import numpy as np
+
+from CADUtils import sample_curve
+from diagnostics import get_logger
+from spatialIndex import SpatialIndex
+
+log = get_logger(__name__)
+
+
+class PointInversion:
+    def __init__(self, feature, tolerance=1e-9, max_iterations=20, seed_density=None):
+        # closest (u) on a curve or (u, w) on a numeric surface for batches of 3d points
+        self.feature = feature
+
+        self.tolerance = tolerance
+
+        self.max_iterations = max_iterations
+
+        self.surface = hasattr(feature, 'evaluate_points')
+
+        if self.surface:
+            if not getattr(feature, 'numeric', False):
+                raise ValueError(f"{feature.name} is on the symbolic path and has no numeric evaluation to invert")
+
+            # seeds come from the same grid the surface draws, evaluated from the curves' cached samples;
+            # folded or self-overlapping surfaces may need a denser one to start in the right basin
+            u_eval = feature.u_eval if seed_density is None else np.linspace(0, 1, seed_density)
+            w_eval = feature.w_eval if seed_density is None else np.linspace(0, 1, seed_density)
+
+            u, w = np.meshgrid(u_eval, w_eval, indexing='ij')
+
+            self.parameters = np.stack([u, w], axis=-1).reshape(-1, 2)
+
+            samples = feature.evaluate_grid(u_eval, w_eval)
+        else:
+            if not hasattr(feature, 'sample_derivative'):
+                raise ValueError(f"{feature.name} cannot be sampled at arbitrary parameters")
+
+            if seed_density is None:
+                self.parameters = np.linspace(0, 1, feature.density)[:, None]
+
+                samples = feature.generate_trace()
+            else:
+                self.parameters = np.linspace(0, 1, seed_density)[:, None]
+
+                samples = sample_curve(feature, self.parameters[:, 0])
+
+        self.index = SpatialIndex(samples)
+
+
+    def invert(self, points):
+        # parameters ((n,) on curves, (n, 2) on surfaces), closest points and distances
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+
+        seeds, _ = self.index.nearest(points)
+
+        parameters = self.parameters[seeds].copy()
+
+        if self.surface:
+            parameters = self.refine_surface(points, parameters)
+
+            closest = self.feature.evaluate_points(parameters[:, 0], parameters[:, 1])
+        else:
+            parameters = self.refine_curve(points, parameters[:, 0])
+
+            closest = sample_curve(self.feature, parameters)
+
+        return parameters, closest, np.linalg.norm(points - closest, axis=-1)
+
+
+    def refine_curve(self, points, u):
+        # newton on C'(u).(C(u) - P) = 0, gauss-newton where the curve bends away from the point
+        active = np.arange(u.shape[0])
+
+        for iteration in range(self.max_iterations):
+            C = sample_curve(self.feature, u[active])
+            C_u = sample_curve(self.feature, u[active], 1)
+            C_uu = sample_curve(self.feature, u[active], 2)
+
+            r = C - points[active]
+
+            f = np.sum(C_u * r, axis=-1)
+
+            speed = np.sum(C_u * C_u, axis=-1)
+
+            df = np.sum(C_uu * r, axis=-1) + speed
+
+            df = np.where(df > 1e-12 * speed, df, speed)
+
+            step = -f / np.where(df > 0, df, 1)
+
+            updated = self.backtrack(points[active], u[active], np.clip(u[active] + step, 0, 1), np.linalg.norm(r, axis=-1), lambda u: sample_curve(self.feature, u))
+
+            moved = np.abs(updated - u[active]) * np.sqrt(speed)
+
+            u[active] = updated
+
+            active = active[moved > self.tolerance]
+
+            if active.shape[0] == 0:
+                break
+        else:
+            log.debug("%d of %d curve inversions still moving after %d iterations", active.shape[0], u.shape[0], self.max_iterations)
+
+        return u
+
+
+    def refine_surface(self, points, parameters, h=1e-6):
+        # newton on the squared distance; surfaces only give first derivatives, so the second come from differencing those
+        active = np.arange(parameters.shape[0])
+
+        for iteration in range(self.max_iterations):
+            current = parameters[active]
+
+            S, S_u, S_w, N = self.feature.evaluate_points(current[:, 0], current[:, 1], derivatives=True)
+
+            # forward steps, backward ones against the far edge
+            step_u = np.where(current[:, 0] < 0.5, h, -h)[:, None]
+            step_w = np.where(current[:, 1] < 0.5, h, -h)[:, None]
+
+            _, S_u_u, S_w_u, _ = self.feature.evaluate_points(current[:, 0] + step_u[:, 0], current[:, 1], derivatives=True)
+            _, S_u_w, S_w_w, _ = self.feature.evaluate_points(current[:, 0], current[:, 1] + step_w[:, 0], derivatives=True)
+
+            S_uu = (S_u_u - S_u) / step_u
+            S_uw = (S_w_u - S_w) / step_u
+            S_ww = (S_w_w - S_w) / step_w
+
+            r = points[active] - S
+
+            J = np.stack([S_u, S_w], axis=-1)
+
+            gradient = np.einsum('nki,nk->ni', J, r)
+
+            JtJ = np.einsum('nki,nkj->nij', J, J)
+
+            curvature = np.stack([np.stack([np.sum(r * S_uu, -1), np.sum(r * S_uw, -1)], -1),
+                                  np.stack([np.sum(r * S_uw, -1), np.sum(r * S_ww, -1)], -1)], -2)
+
+            H = JtJ - curvature
+
+            # newton along a single parameter wherever its own curvature allows, gauss-newton otherwise
+            diagonal = np.diagonal(H, axis1=1, axis2=2)
+
+            diagonal = np.where(diagonal > 0, diagonal, np.diagonal(JtJ, axis1=1, axis2=2)) + 1e-300
+
+            # gauss-newton where the full hessian is not positive definite, far from the surface on its concave side
+            indefinite = (np.linalg.det(H) <= 0) | (np.trace(H, axis1=1, axis2=2) <= 0)
+
+            H[indefinite] = JtJ[indefinite]
+
+            # a touch of damping keeps degenerate edges (poles of revolved surfaces) solvable
+            H += (1e-12 * np.trace(H, axis1=1, axis2=2) + 1e-300)[:, None, None] * np.eye(2)
+
+            step = np.linalg.solve(H, gradient[..., None])[..., 0]
+
+            # a parameter at its bound with descent pointing outward is held there, and the other solved for alone
+            blocked = ((current <= 0) & (gradient < 0)) | ((current >= 1) & (gradient > 0))
+
+            step = np.where(np.any(blocked, axis=1)[:, None], np.where(blocked, 0, gradient / diagonal), step)
+
+            updated = self.backtrack(points[active], current, np.clip(current + step, 0, 1), np.linalg.norm(r, axis=-1), lambda p: self.feature.evaluate_points(p[:, 0], p[:, 1]))
+
+            moved = np.linalg.norm(np.einsum('nki,ni->nk', J, updated - current), axis=-1)
+
+            parameters[active] = updated
+
+            active = active[moved > self.tolerance]
+
+            if active.shape[0] == 0:
+                break
+        else:
+            log.debug("%d of %d surface inversions still moving after %d iterations", active.shape[0], parameters.shape[0], self.max_iterations)
+
+        return parameters
+
+
+    def backtrack(self, points, current, updated, distances, evaluate, halvings=8):
+        # halve the steps that end up further from their point, both newton variants overshoot on tight bends
+        for halving in range(halvings):
+            worse = np.linalg.norm(points - evaluate(updated), axis=-1) > distances + self.tolerance
+
+            if not np.any(worse):
+                break
+
+            updated[worse] = (current[worse] + updated[worse]) / 2
+
+        return updated
+
+
+if __name__ == "__main__":
+    import sympy as sp
+
+    from CADUtils import Offset
+    from sketchPlane import SketchPlane
+    from nurbsCurve import NURBSCurve
+    from ruledSurface import RuledSurface
+
+    p0 = sp.Matrix([[-100, 0, -100]])
+    p1 = sp.Matrix([[-100, 0, 100]])
+
+    q0 = sp.Matrix([[100, 0, -100]])
+    q1 = sp.Matrix([[100, 0, 100]])
+
+    plane1 = SketchPlane('Plane0', 'xz', 10, p0, p1, q0, q1)
+
+    plane2 = SketchPlane('Plane1', 'xz', 10, p0, p1, q0, q1)
+    plane2.translate(Offset(0, 40, 0))
+
+    curve1 = NURBSCurve('curve0', sp.Matrix([[-60, 0, -20], [-20, 0, 40], [20, 0, -30], [60, 0, 10]]), 3, 40, plane1)
+
+    curve2 = NURBSCurve('curve1', sp.Matrix([[-60, 0, 10], [-20, 0, -30], [20, 0, 40], [60, 0, -20]]), 3, 40, plane2)
+
+    surface = RuledSurface('Surface0', curve1, curve2, 40)
+
+    rng = np.random.default_rng(0)
+
+    # points scattered off the surface at known parameters, along the normal
+    truth = rng.uniform(0.05, 0.95, (1000, 2))
+
+    S, S_u, S_w, N = surface.evaluate_points(truth[:, 0], truth[:, 1], derivatives=True)
+
+    points = S + rng.uniform(-2, 2, (1000, 1)) * N
+
+    parameters, closest, distances = PointInversion(surface).invert(points)
+
+    print(f"surface: max parameter error {np.max(np.abs(parameters - truth)):.2e}")
+
+    # a curve against a dense brute force search
+    queries = rng.uniform([-60, -10, -40], [60, 10, 40], (1000, 3))
+
+    u, closest, distances = PointInversion(curve1).invert(queries)
+
+    dense = curve1.sample(np.linspace(0, 1, 20001))
+
+    brute = np.min(np.linalg.norm(queries[:, None, :] - dense[None, :, :], axis=-1), axis=1)
+
+    print(f"curve: newton is never further than the dense search by more than {np.max(distances - brute):.2e}")
@@ -0,0 +1,252 @@
+import os
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from matplotlib.collections import LineCollection
+from matplotlib.colors import to_rgb
+from mpl_toolkits.mplot3d import proj3d
+from mpl_toolkits.mplot3d.art3d import Line3DCollection, Poly3DCollection
+
+# which coordinates a 2d sketch view shows
+PLANE_COLUMNS = {'xy': (0, 1), 'yz': (1, 2), 'xz': (0, 2)}
+
+PRECISIONS = {'single': np.float32, 'double': np.float64}
+
+display_dtype = np.float32
+
+
+def set_display_precision(precision):
+    # what the artists keep and the drawing traces and grids features cache for them, through the dtype drawing passes
+    # to FeatureTree.evaluate; evaluation itself and its sample caches stay float64
+    global display_dtype
+
+    if precision not in PRECISIONS:
+        raise ValueError(f"unknown precision {precision}, expected one of {tuple(PRECISIONS)}")
+
+    display_dtype = PRECISIONS[precision]
+
+
+def current_display_dtype():
+    return display_dtype
+
+
+# CAD_DISPLAY_PRECISION=double keeps the drawn segments, quads and display traces in float64
+set_display_precision(os.environ.get('CAD_DISPLAY_PRECISION', 'single'))
+
+
+def pack_segments(traces, columns=None, dtype=None):
+    # every trace into one contiguous (n_segments, 2, d) array, without segments bridging two traces
+    traces = [np.asarray(trace) for trace in traces if len(trace) > 1]
+
+    if not traces:
+        return np.empty((0, 2, 3 if columns is None else len(columns)), dtype=dtype)
+
+    points = np.concatenate(traces, axis=0, dtype=dtype)
+
+    if columns is not None:
+        points = points[:, list(columns)]
+
+    ends = np.cumsum([trace.shape[0] for trace in traces])
+
+    starts = np.ones(points.shape[0] - 1, dtype=bool)
+    starts[ends[:-1] - 1] = False
+
+    index = np.nonzero(starts)[0]
+
+    return np.stack([points[index], points[index + 1]], axis=1)
+
+
+def grid_quads(grid):
+    # (n_u, n_w, d) grid to (n_faces, 4, d) quads, corners going round each cell
+    quads = np.stack([grid[:-1, :-1], grid[1:, :-1], grid[1:, 1:], grid[:-1, 1:]], axis=2)
+
+    return quads.reshape(-1, 4, grid.shape[-1])
+
+
+def face_normals(quads, normals=None):
+    # mean of the analytic corner normals where the surface gives them, the diagonal cross product elsewhere
+    diagonal = np.cross(quads[:, 2] - quads[:, 0], quads[:, 3] - quads[:, 1])
+
+    if normals is None:
+        N = diagonal
+    else:
+        N = grid_quads(normals).mean(axis=1)
+
+        degenerate = np.linalg.norm(N, axis=-1) < 1e-6
+
+        N[degenerate] = diagonal[degenerate]
+
+    magnitudes = np.linalg.norm(N, axis=-1, keepdims=True)
+
+    return N / np.where(magnitudes > 0, magnitudes, 1)
+
+
+def view_direction(elev, azim):
+    # unit vector from the scene towards the camera for an mplot3d elevation and azimuth
+    elev = np.radians(elev)
+    azim = np.radians(azim)
+
+    return np.array([np.cos(elev) * np.cos(azim), np.cos(elev) * np.sin(azim), np.sin(elev)])
+
+
+class Renderer:
+    def __init__(self, axes):
+        self.axes = axes
+
+        self.three_d = hasattr(axes, 'get_zlim')
+
+        # shaded collections with the quads and normals they were built from, so a new view only re-culls and relights them
+        self.shaded = []
+
+
+    def clear(self):
+        self.shaded = []
+
+
+    def line_collection(self, segments, color='C0', alpha=None, linewidth=None):
+        if self.three_d:
+            return Line3DCollection(segments, colors=color, alpha=alpha, linewidths=linewidth)
+
+        return LineCollection(segments, colors=color, alpha=alpha, linewidths=linewidth)
+
+
+    def draw_traces(self, traces, color='C0', alpha=None, linewidth=None, columns=None):
+        # one artist for all the traces instead of one Line2D/Line3D per trace
+        if not self.three_d and columns is None:
+            columns = (0, 1)
+
+        segments = pack_segments(traces, columns, display_dtype)
+
+        if segments.shape[0] == 0:
+            return None
+
+        collection = self.line_collection(segments, color, alpha, linewidth)
+
+        if self.three_d:
+            self.axes.add_collection3d(collection)
+        else:
+            self.axes.add_collection(collection)
+
+        return collection
+
+
+    def update_traces(self, collection, traces, columns=None):
+        # new segments for an artist draw_traces made, so a preview that keeps changing keeps its artist
+        if not self.three_d and columns is None:
+            columns = (0, 1)
+
+        collection.set_segments(pack_segments(traces, columns, display_dtype))
+
+
+    def front_facing(self, quads, normals):
+        # the winding each quad has on screen against the side its normal is on, which holds under perspective and any aspect
+        x, y, _ = proj3d.proj_transform(quads[..., 0].ravel(), quads[..., 1].ravel(), quads[..., 2].ravel(), self.axes.get_proj())
+
+        screen = np.stack([x, y], axis=-1).reshape(quads.shape[0], 4, 2)
+
+        d1 = screen[:, 2] - screen[:, 0]
+        d2 = screen[:, 3] - screen[:, 1]
+
+        area = d1[:, 0] * d2[:, 1] - d1[:, 1] * d2[:, 0]
+
+        winding = np.einsum('ni,ni->n', np.cross(quads[:, 2] - quads[:, 0], quads[:, 3] - quads[:, 1]), normals)
+
+        return area * winding > 0
+
+
+    def visible_faces(self, quads, normals, cull_back_faces=False):
+        keep = np.ones(quads.shape[0], dtype=bool)
+
+        if cull_back_faces:
+            keep &= self.front_facing(quads, normals)
+
+        # frustum culling against the axes box: a face goes when all its corners are past the same limit
+        lower = np.array([self.axes.get_xlim()[0], self.axes.get_ylim()[0], self.axes.get_zlim()[0]])
+        upper = np.array([self.axes.get_xlim()[1], self.axes.get_ylim()[1], self.axes.get_zlim()[1]])
+
+        outside = np.any(np.all(quads < lower, axis=1), axis=-1) | np.any(np.all(quads > upper, axis=1), axis=-1)
+
+        return keep & ~outside
+
+
+    def shade(self, collection, quads, N, color, cull_back_faces, ambient):
+        # cull and light for the axes' current view, a headlight from the camera
+        view = view_direction(self.axes.elev, self.axes.azim)
+
+        keep = self.visible_faces(quads, N, cull_back_faces)
+
+        # both sides are lit the same when back faces are kept
+        intensity = ambient + (1 - ambient) * np.abs(N[keep] @ view)
+
+        collection.set_verts(quads[keep])
+        collection.set_facecolor(np.clip(intensity[:, None] * np.array(to_rgb(color)), 0, 1))
+
+
+    def draw_shaded(self, grid, normals=None, color='green', alpha=None, cull_back_faces=False, ambient=0.3):
+        # one Poly3DCollection of the grid's quads; culling is off by default since open sheets vanish from behind
+        quads = grid_quads(np.asarray(grid, dtype=display_dtype))
+
+        N = face_normals(quads, normals)
+
+        collection = Poly3DCollection([], edgecolors='none', alpha=alpha)
+
+        self.axes.add_collection3d(collection)
+
+        shaded = (collection, quads, N, color, cull_back_faces, ambient)
+
+        self.shade(*shaded)
+
+        self.shaded.append(shaded)
+
+        return collection
+
+
+    def refresh_shaded(self):
+        # after the view turns, True when there was anything to redo
+        for shaded in self.shaded:
+            self.shade(*shaded)
+
+        return len(self.shaded) > 0
+
+
+if __name__ == "__main__":
+    figure = plt.figure()
+
+    axes = figure.add_subplot(projection='3d')
+
+    u = np.linspace(0, 1, 40)
+
+    # a 40 x 40 wireframe: 80 traces, one artist
+    traces = [np.stack([u * 100 - 50, np.full(40, v * 100 - 50), 20 * np.sin(6 * u + v)], axis=1) for v in u]
+    traces += [trace[:, [1, 0, 2]] for trace in traces]
+
+    axes.set_xlim((-100, 100))
+
+    axes.set_ylim((-100, 100))
+
+    axes.set_zlim((-100, 100))
+
+    renderer = Renderer(axes)
+
+    renderer.draw_traces(traces, color='green')
+
+    # the same sheet shaded, only the faces turned towards the camera
+    grid = np.stack([traces[i] for i in range(40)], axis=1) + np.array([0, 0, -60])
+
+    collection = renderer.draw_shaded(grid, color='orange', cull_back_faces=True)
+
+    figure.canvas.draw()
+
+    faces = len(collection.get_paths())
+
+    # from underneath the sheet shows its back, culled until the view is turned back
+    axes.view_init(-30, -60)
+
+    renderer.refresh_shaded()
+
+    figure.canvas.draw()
+
+    print(f"{faces} faces facing the default view, {len(collection.get_paths())} from below")
+
+    plt.show()
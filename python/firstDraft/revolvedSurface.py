@@ -8,91 +8,151 @@ from straightLine import StraightLine
 from spline import Spline
 from bezierCurve import BezierCurve
 
-from CADUtils import Offset
+from CADUtils import Offset, Pose, display_grid, grid_traces, lambdify_curve, sample_curve, unit_normals
+from diagnostics import get_logger, Pretty
+from expressionCompiler import CompiledExpression
+
+log = get_logger(__name__)
 
 class RevolvedSurface:
-    def __init__(self, name, curve, axis, rotation_degrees, axes, density=40, color='green'):
+    def __init__(self, name, curve, axis, rotation_degrees, axes=None, density=40, color='green', numeric=True):
         self.u = sp.symbols('u')
 
         self.w = sp.symbols('w')
 
-        self.u_eval = np.linspace(0, 1, density)
-
-        self.w_eval = np.linspace(0, rotation_degrees/60, density)
-
-        print(self.w_eval)
-
         self.name = name
 
         self.curve = curve
 
+        self.axis = axis
+
         self.color = color
 
         self.offset = self.curve.offset
 
         self.normal_vector = curve.normal_vector
 
-        self.u = sp.symbols('u')
+        self.rotation_degrees = rotation_degrees
 
-        self.w = sp.symbols('w')
+        self.numeric = numeric
 
-        self.P_u = self.curve.P_u - sp.Matrix([[self.offset.x, self.offset.y, self.offset.z]])
+        self.u_eval = np.linspace(0, 1, density)
 
-        self.axis = axis
+        if self.numeric:
+            # w runs over [0, 1] and is scaled onto the requested angle
+            self.w_eval = np.linspace(0, 1, density)
 
-        old_axis_offset = Offset(self.axis.offset.x, self.axis.offset.y, self.axis.offset.z)
+            self.build_axis()
 
-        old_axis_offset.print()
+            self.cos_table, self.sin_table = self.angle_table(self.w_eval)
+        else:
+            self.w_eval = np.linspace(0, rotation_degrees/60, density)
 
-        old_P_u_offset = Offset(self.curve.offset.x, self.curve.offset.y, self.curve.offset.z)
+            self.build_symbolic(axes)
 
-        old_P_u_offset.print()
 
-        sp.pretty_print(self.axis.Gsl)
+    def build_symbolic(self, axes):
+        self.P_u = self.curve.P_u - sp.Matrix([[self.offset.x, self.offset.y, self.offset.z]])
+
+        log.debug("offset: %s", self.axis.offset)
+
+        log.debug("offset: %s", self.curve.offset)
+
+        log.debug("Gsl:%s", Pretty(self.axis.Gsl))
 
         p_u_debug_trace1 = self.curve.generate_trace()
 
         axes.plot(p_u_debug_trace1[:, 0], p_u_debug_trace1[:, 1], p_u_debug_trace1[:, 2], label='p_u debug trace 1')
 
-        self.axis.P_u = self.translate(self.axis.P_u, Offset(-1 * self.axis.offset.x, -1 * self.axis.offset.y, -1 * self.axis.offset.z))
+        # the axis and curve are shared with the feature tree and its undo snapshots, so they are moved as copies of their P_u
+        axis_P_u = self.translate(self.axis.P_u, Offset(-1 * self.axis.offset.x, -1 * self.axis.offset.y, -1 * self.axis.offset.z))
 
-        self.axis.P_u = self.translate(self.axis.P_u, Offset(-1 * self.axis.Gsl[0, 0], -1 * self.axis.Gsl[0, 1], -1 * self.axis.Gsl[0, 2]))
+        axis_P_u = self.translate(axis_P_u, Offset(-1 * self.axis.Gsl[0, 0], -1 * self.axis.Gsl[0, 1], -1 * self.axis.Gsl[0, 2]))
 
-        self.curve.P_u = self.translate(self.curve.P_u, Offset(-1 * self.curve.offset.x, -1 * self.curve.offset.y, -1 * self.axis.offset.z))
+        curve_P_u = self.translate(self.curve.P_u, Offset(-1 * self.curve.offset.x, -1 * self.curve.offset.y, -1 * self.axis.offset.z))
 
-        self.curve.P_u = self.translate(self.curve.P_u, Offset(-1 * self.curve.Gsl[0, 0], -1 * self.curve.Gsl[0, 1], -1 * self.curve.Gsl[0, 2]))
+        curve_P_u = self.translate(curve_P_u, Offset(-1 * self.curve.Gsl[0, 0], -1 * self.curve.Gsl[0, 1], -1 * self.curve.Gsl[0, 2]))
 
-        sp.pretty_print(self.axis.Gsl)
+        log.debug("Gsl:%s", Pretty(self.axis.Gsl))
 
-        axis_debug_trace2 = self.axis.generate_trace()
+        axis_debug_trace2 = lambdify_curve(self.u, axis_P_u)(np.linspace(0, 1, self.axis.density))
 
-        p_u_debug_trace2 = self.curve.generate_trace()
+        p_u_debug_trace2 = lambdify_curve(self.u, curve_P_u)(np.linspace(0, 1, self.curve.density))
 
         axes.plot(axis_debug_trace2[:, 0], axis_debug_trace2[:, 1], axis_debug_trace2[:, 2], label='axis debug trace 2')
 
         axes.plot(p_u_debug_trace2[:, 0], p_u_debug_trace2[:, 1], p_u_debug_trace2[:, 2], label='p_u debug trace 2')
 
-        self.S_u_w = self.revolve(self.curve.P_u, self.axis.P_u)
+        self.S_u_w = self.revolve(curve_P_u, axis_P_u)
 
-        self.axis.P_u = self.translate(self.axis.P_u, Offset(self.axis.Gsl[0, 0], self.axis.Gsl[0, 1], self.axis.Gsl[0, 2]))
-    
-        self.axis.P_u = self.translate(self.axis.P_u, old_axis_offset)
-    
-        sp.pretty_print(self.axis.Gsl)
 
-        self.curve.P_u = self.translate(self.curve.P_u, old_P_u_offset)
+    def build_axis(self):
+        # axis line through its two end points
+        ends = self.axis.sample(np.array([0.0, 1.0]))
+
+        self.axis_origin = ends[0]
+
+        direction = ends[1] - ends[0]
+
+        length = np.linalg.norm(direction)
+
+        if length == 0:
+            raise ValueError(f"axis {self.axis.name} has zero length")
+
+        self.axis_direction = direction / length
+
 
-        self.curve.P_u = self.translate(self.curve.P_u, Offset(self.curve.Gsl[0, 0], self.curve.Gsl[0, 1], self.curve.Gsl[0, 2]))
+    def angle_table(self, w_eval):
+        angles = np.asarray(w_eval, dtype=float) * np.radians(self.rotation_degrees)
 
-        axis_debug_trace3 = self.axis.generate_trace()
+        return np.cos(angles), np.sin(angles)
 
-        p_u_debug_trace3 = self.curve.generate_trace()
 
-        # axes.plot(axis_debug_trace3[:, 0], axis_debug_trace3[:, 1], axis_debug_trace3[:, 2], label='debug trace 3')
+    def rotate_about_axis(self, v, cos_w, sin_w):
+        # rodrigues rotation of every vector about the axis, broadcast against the angle table
+        k = self.axis_direction
 
-        axes.plot(p_u_debug_trace3[:, 0], p_u_debug_trace3[:, 1], p_u_debug_trace3[:, 2], label='p_u debug trace 3')
+        k_cross_v = np.cross(k, v)
 
-        # self.S_u_w = self.translate(self.S_u_w, old_P_u_offset)
+        k_dot_v = (v @ k)[..., None] * k
+
+        return v * cos_w + k_cross_v * sin_w + k_dot_v * (1 - cos_w)
+
+
+    def evaluate_points(self, u, w, cos_w=None, sin_w=None, derivatives=False):
+        u = np.asarray(u, dtype=float)
+
+        if cos_w is None:
+            cos_w, sin_w = self.angle_table(w)
+
+        cos_w = cos_w[..., None]
+        sin_w = sin_w[..., None]
+
+        rotated = self.rotate_about_axis(sample_curve(self.curve, u) - self.axis_origin, cos_w, sin_w)
+
+        S = self.axis_origin + rotated
+
+        if not derivatives:
+            return S
+
+        # the profile tangent turns with the profile, and points sweep round the axis at a fixed angular rate
+        S_u = self.rotate_about_axis(sample_curve(self.curve, u, 1), cos_w, sin_w)
+
+        S_w = np.radians(self.rotation_degrees) * np.cross(self.axis_direction, rotated)
+
+        return S, S_u, S_w, unit_normals(S_u, S_w)
+
+
+    def evaluate_grid(self, u_eval=None, w_eval=None, derivatives=False):
+        if u_eval is None:
+            u_eval = self.u_eval
+
+        if w_eval is None:
+            cos_w, sin_w = self.cos_table, self.sin_table
+        else:
+            cos_w, sin_w = self.angle_table(w_eval)
+
+        return self.evaluate_points(np.asarray(u_eval)[:, None], None, cos_w[None, :], sin_w[None, :], derivatives)
 
 
     def revolve(self, P_u, axis):
@@ -102,83 +162,33 @@ class RevolvedSurface:
         
         S_u_w = P_u * W_rotation
 
-        sp.pretty_print(S_u_w)
+        log.debug("S_u_w:%s", Pretty(S_u_w))
 
         return S_u_w
     
 
     def translate(self, curve, offset=Offset(0, 0, 0)):
-        # translation matrices
-
-        self.Tx = sp.Matrix([[1, 0, 0, offset.x],
-                        [0, 1, 0, 0],
-                        [0, 0, 1, 0],
-                        [0, 0, 0, 1]])
-        
-        self.Ty = sp.Matrix([[1, 0, 0, 0],
-                        [0, 1, 0, offset.y],
-                        [0, 0, 1, 0],
-                        [0, 0, 0, 1]])
-        
-        self.Tz = sp.Matrix([[1, 0, 0, 0],
-                        [0, 1, 0, 0],
-                        [0, 0, 1, offset.z],
-                        [0, 0, 0, 1]])
+        T = Pose.translation(offset)
         
-        curve_h = curve.T.row_insert(curve.T.rows, sp.Matrix([1]))
-
-        curve_h_transformed = self.Tx * self.Ty * self.Tz * curve_h
-
-        curve_transformed = curve_h_transformed[:-1, :].T
-
-        return curve_transformed
+        return T.apply(curve)
     
 
     def rotate(self, curve, alpha, beta, gamma):
-        self.Trx = sp.Matrix([[1, 0, 0, 0],
-                        [0, np.cos(np.radians(alpha)), -np.sin(np.radians(alpha)), 0],
-                        [0, np.sin(np.radians(alpha)), np.cos(np.radians(alpha)), 0],
-                        [0, 0, 0, 1]])
+        R = Pose.rotation(alpha, beta, gamma, order='xyz')
         
-        self.Try = sp.Matrix([[np.cos(np.radians(beta)), 0, -np.sin(np.radians(beta)), 0],
-                              [0, 1, 0, 0],
-                              [np.sin(np.radians(beta)), 0, np.cos(np.radians(beta)), 0],
-                              [0, 0, 0, 1]])
-
-        self.Trz = sp.Matrix([[np.cos(np.radians(gamma)), -np.sin(np.radians(gamma)), 0, 0],
-                         [np.sin(np.radians(gamma)), np.cos(np.radians(gamma)), 0, 0],
-                         [0, 0, 1, 0],
-                         [0, 0, 0, 1]])
-        
-        curve_h = curve.P_u.T.row_insert(curve.P_u.T.rows, sp.Matrix([1]))
+        return R.apply(curve.P_u)
+    
 
-        curve_h_transformed = self.Trx * self.Try * self.Trz * curve_h
+    def generate_traces(self, dtype=None):
+        if self.numeric:
+            self.S_u_w_lines = grid_traces(display_grid(self.evaluate_grid(), dtype))
 
-        curve_transformed = curve_h_transformed[:-1, :].T
+            return self.S_u_w_lines
 
-        return curve_transformed
-    
+        self.S_u_w_callable = CompiledExpression([self.u, self.w], self.S_u_w)
 
-    def generate_traces(self):
-        self.S_u_w_lines = []
-        self.S_u_w_callable = sp.lambdify([self.u, self.w], self.S_u_w)
-        # traces along u lines
-        for i in range(len(self.w_eval)):
-            S_u_w_line = np.empty((0, 3))
-            for j in range(len(self.u_eval)):
-                point = self.S_u_w_callable(self.w_eval[i], self.u_eval[j])
-
-                S_u_w_line = np.append(S_u_w_line, point, axis=0)
-            self.S_u_w_lines.append(S_u_w_line)
-
-        # traces along w
-        for i in range(len(self.u_eval)):
-            S_u_w_line = np.empty((0, 3))
-            for j in range(len(self.w_eval)):
-                point = self.S_u_w_callable(self.w_eval[j], self.u_eval[i])
-
-                S_u_w_line = np.append(S_u_w_line, point, axis=0)
-            self.S_u_w_lines.append(S_u_w_line)
+        # the callable takes w_eval in its first slot and u_eval in its second, as the pointwise traces always did
+        self.S_u_w_lines = grid_traces(display_grid(self.S_u_w_callable.evaluate(self.w_eval[:, None], self.u_eval[None, :]), dtype))
 
         return self.S_u_w_lines
         
@@ -8,10 +8,14 @@ from straightLine import StraightLine
 from spline import Spline
 from bezierCurve import BezierCurve
 
-from CADUtils import Offset
+from CADUtils import Offset, display_grid, grid_traces, sample_curve, unit_normals
+from diagnostics import get_logger
+from expressionCompiler import CompiledExpression
+
+log = get_logger(__name__)
 
 class RuledSurface:
-    def __init__(self, name, curve1, curve2, density=40, color='green'):
+    def __init__(self, name, curve1, curve2, density=40, color='green', numeric=True):
         self.u = sp.symbols('u')
 
         self.w = sp.symbols('w')
@@ -20,8 +24,6 @@ class RuledSurface:
 
         self.w_eval = np.linspace(0, 1, density)
 
-        print(self.w_eval)
-
         self.name = name
 
         self.curve1 = curve1
@@ -32,29 +34,95 @@ class RuledSurface:
 
         self.color = color
 
-        self.S_u_w = (1 - self.w) * self.curve1.P_u + self.w * self.curve2.P_u
+        self.numeric = numeric
 
-    
-    def generate_traces(self):
-        self.S_u_w_lines = []
-        self.S_u_w_callable = sp.lambdify([self.u, self.w], self.S_u_w)
-        # traces along u lines
-        for i in range(len(self.w_eval)):
-            S_u_w_line = np.empty((0, 3))
-            for j in range(len(self.u_eval)):
-                point = self.S_u_w_callable(self.w_eval[i], self.u_eval[j])
-
-                S_u_w_line = np.append(S_u_w_line, point, axis=0)
-            self.S_u_w_lines.append(S_u_w_line)
-
-        # traces along w
-        for i in range(len(self.u_eval)):
-            S_u_w_line = np.empty((0, 3))
-            for j in range(len(self.w_eval)):
-                point = self.S_u_w_callable(self.w_eval[j], self.u_eval[i])
-
-                S_u_w_line = np.append(S_u_w_line, point, axis=0)
-            self.S_u_w_lines.append(S_u_w_line)
+        self.boundary_cached = False
+
+        if self.numeric:
+            # when the surface asks for the density both curves are drawn at, it reuses their traces as its u samples
+            if curve1.density == density and curve2.density == density:
+                self.boundary_cached = True
+        else:
+            log.debug("w samples: %s", self.w_eval)
+
+            self.S_u_w = (1 - self.w) * self.curve1.P_u + self.w * self.curve2.P_u
+
+
+    def boundary_traces(self, u_eval=None):
+        if u_eval is None and self.boundary_cached:
+            return self.curve1.generate_trace(), self.curve2.generate_trace()
+
+        if u_eval is None:
+            u_eval = self.u_eval
+
+        return sample_curve(self.curve1, u_eval), sample_curve(self.curve2, u_eval)
+
+
+    def blend(self, c1, c2, w):
+        # (1 - w) * c1 + w * c2 lands exactly on both curves at w = 0 and w = 1
+        w = np.asarray(w, dtype=float)[..., None]
+
+        return (1 - w) * c1 + w * c2
+
+
+    def evaluate_points(self, u, w, derivatives=False):
+        c1, c2 = sample_curve(self.curve1, u), sample_curve(self.curve2, u)
+
+        S = self.blend(c1, c2, w)
+
+        if not derivatives:
+            return S
+
+        S_u = self.blend(sample_curve(self.curve1, u, 1), sample_curve(self.curve2, u, 1), w)
+
+        S_w = np.broadcast_to(c2 - c1, S.shape)
+
+        return S, S_u, S_w, unit_normals(S_u, S_w)
+
+
+    def evaluate_grid(self, u_eval=None, w_eval=None, derivatives=False):
+        if w_eval is None:
+            w_eval = self.w_eval
+
+        w = np.asarray(w_eval)[None, :]
+
+        c1, c2 = self.boundary_traces(u_eval)
+
+        S = self.blend(c1[:, None, :], c2[:, None, :], w)
+
+        if not derivatives:
+            return S
+
+        if u_eval is None:
+            u_eval = self.u_eval
+
+        d1, d2 = sample_curve(self.curve1, u_eval, 1), sample_curve(self.curve2, u_eval, 1)
+
+        S_u = self.blend(d1[:, None, :], d2[:, None, :], w)
+
+        S_w = np.broadcast_to((c2 - c1)[:, None, :], S.shape)
+
+        return S, S_u, S_w, unit_normals(S_u, S_w)
+
+
+    def generate_traces(self, dtype=None):
+        if self.numeric:
+            grid = display_grid(self.evaluate_grid(), dtype)
+
+            self.S_u_w_lines = grid_traces(grid)
+
+            # the w = 0 and w = 1 iso-lines are the boundary curves themselves, so hand out their cached traces
+            if self.boundary_cached:
+                self.S_u_w_lines[grid.shape[0]] = self.curve1.generate_trace(dtype)
+
+                self.S_u_w_lines[-1] = self.curve2.generate_trace(dtype)
+
+            return self.S_u_w_lines
+
+        self.S_u_w_callable = CompiledExpression([self.u, self.w], self.S_u_w)
+
+        # the callable takes w_eval in its first slot and u_eval in its second, as the pointwise traces always did
+        self.S_u_w_lines = grid_traces(display_grid(self.S_u_w_callable.evaluate(self.w_eval[:, None], self.u_eval[None, :]), dtype))
 
         return self.S_u_w_lines
     
@@ -2,10 +2,14 @@ import sympy as sp
 import matplotlib.pyplot as plt
 import numpy as np
 
-from CADUtils import Offset
+from CADUtils import Offset, Pose, display_grid, grid_traces, unit_normals
+from diagnostics import get_logger, Pretty
+from expressionCompiler import CompiledExpression
+
+log = get_logger(__name__)
 
 class SketchPlane:
-    def __init__(self, name, initial_orientation, density, p0:sp.Matrix, p1:sp.Matrix, q0:sp.Matrix, q1:sp.Matrix, alpha=0, beta=0, gamma=0, offset=Offset(0, 0, 0), color='blue'):
+    def __init__(self, name, initial_orientation, density, p0:sp.Matrix, p1:sp.Matrix, q0:sp.Matrix, q1:sp.Matrix, alpha=0, beta=0, gamma=0, offset=Offset(0, 0, 0), color='blue', numeric=True):
         self.name = name
         self.initial_orientation = initial_orientation
         self.density = density
@@ -17,6 +21,10 @@ class SketchPlane:
 
         self.color = color
 
+        self.numeric = numeric
+
+        self.corner_source = None
+
         self.u = sp.symbols('u')
         self.w = sp.symbols('w')
 
@@ -42,7 +50,7 @@ class SketchPlane:
         
         self.normal_vector = U * self.Nsl * self.Gsl_normal_vector
 
-        sp.pretty_print(self.normal_vector)
+        log.debug("normal_vector:%s", Pretty(self.normal_vector))
         
         self.Gsl1 = sp.Matrix([p0, p1])
 
@@ -51,10 +59,10 @@ class SketchPlane:
         self.P_u = U * self.Nsl * self.Gsl1
         self.Q_u = U * self.Nsl * self.Gsl2
 
-        self.P_u_callable = sp.lambdify(self.u, self.P_u)
+        self.P_u_callable = CompiledExpression(self.u, self.P_u)
         self.P_eval = self.evaluate(self.P_u_callable)
 
-        self.Q_u_callable = sp.lambdify(self.u, self.Q_u)
+        self.Q_u_callable = CompiledExpression(self.u, self.Q_u)
         self.Q_eval = self.evaluate(self.Q_u_callable)
 
         self.S_u_w = (1 - self.w) * self.P_u + self.w * self.Q_u
@@ -62,37 +70,69 @@ class SketchPlane:
         self.translate(self.offset)
         self.rotate(self.alpha, self.beta, self.gamma)
          
-        self.S_u_w_callable = sp.lambdify([self.u, self.w], self.S_u_w)
+        self.S_u_w_callable = CompiledExpression([self.u, self.w], self.S_u_w)
 
         self.S_u_w_lines = []
     
 
-    def generate_traces(self):
-        self.S_u_w_lines = []
-        self.S_u_w_callable = sp.lambdify([self.u, self.w], self.S_u_w)
-        # traces along u lines
-        for i in range(len(self.w_eval)):
-            S_u_w_line = np.empty((0, 3))
-            for j in range(len(self.u_eval)):
-                point = self.S_u_w_callable(self.w_eval[i], self.u_eval[j])
+    def corners(self):
+        # the plane is bilinear in u and w, so its four corners describe it exactly; refreshed whenever S_u_w is replaced
+        if self.corner_source is not self.S_u_w:
+            corner = lambda u, w: np.array(self.S_u_w.subs({self.u: u, self.w: w}).tolist(), dtype=float)[0]
+
+            self.corner_points = np.array([[corner(0, 0), corner(0, 1)], [corner(1, 0), corner(1, 1)]])
+
+            self.corner_source = self.S_u_w
+
+        return self.corner_points
+
+
+    def evaluate_points(self, u, w, derivatives=False):
+        u = np.asarray(u, dtype=float)[..., None]
+        w = np.asarray(w, dtype=float)[..., None]
+
+        c = self.corners()
+
+        S_u = (1 - w) * (c[1, 0] - c[0, 0]) + w * (c[1, 1] - c[0, 1])
+
+        S = (1 - w) * c[0, 0] + w * c[0, 1] + u * S_u
+
+        if not derivatives:
+            return S
+
+        S_w = (1 - u) * (c[0, 1] - c[0, 0]) + u * (c[1, 1] - c[1, 0])
+
+        S_u, S_w = np.broadcast_arrays(S_u, S_w)
+
+        return S, S_u, S_w, unit_normals(S_u, S_w)
+
 
-                S_u_w_line = np.append(S_u_w_line, point, axis=0)
-            self.S_u_w_lines.append(S_u_w_line)
+    def evaluate_grid(self, u_eval=None, w_eval=None, derivatives=False):
+        if u_eval is None:
+            u_eval = self.u_eval
 
-        # traces along w
-        for i in range(len(self.u_eval)):
-            S_u_w_line = np.empty((0, 3))
-            for j in range(len(self.w_eval)):
-                point = self.S_u_w_callable(self.w_eval[j], self.u_eval[i])
+        if w_eval is None:
+            w_eval = self.w_eval
 
-                S_u_w_line = np.append(S_u_w_line, point, axis=0)
-            self.S_u_w_lines.append(S_u_w_line)
+        return self.evaluate_points(np.asarray(u_eval)[:, None], np.asarray(w_eval)[None, :], derivatives)
+
+
+    def generate_traces(self, dtype=None):
+        if self.numeric:
+            self.S_u_w_lines = grid_traces(display_grid(self.evaluate_grid(), dtype))
+
+            return self.S_u_w_lines
+
+        self.S_u_w_callable = CompiledExpression([self.u, self.w], self.S_u_w)
+
+        # the callable takes w_eval in its first slot and u_eval in its second, as the pointwise traces always did
+        self.S_u_w_lines = grid_traces(display_grid(self.S_u_w_callable.evaluate(self.w_eval[:, None], self.u_eval[None, :]), dtype))
 
         return self.S_u_w_lines
     
 
     def generate_normal_vector_trace(self, magnitude):
-        Psl_normal_vector_callable = sp.lambdify(self.u, self.normal_vector)
+        Psl_normal_vector_callable = CompiledExpression(self.u, self.normal_vector)
         
         Psl_normal_vector_eval = self.evaluate(Psl_normal_vector_callable)
 
@@ -112,34 +152,11 @@ class SketchPlane:
 
     def translate(self, offset=Offset(0, 0, 0)):
         offset = offset.subtract(self.offset)
-        # translation matrices
-
-        self.Tx = sp.Matrix([[1, 0, 0, offset.x],
-                        [0, 1, 0, 0],
-                        [0, 0, 1, 0],
-                        [0, 0, 0, 1]])
-        
-        self.Ty = sp.Matrix([[1, 0, 0, 0],
-                        [0, 1, 0, offset.y],
-                        [0, 0, 1, 0],
-                        [0, 0, 0, 1]])
-        
-        self.Tz = sp.Matrix([[1, 0, 0, 0],
-                        [0, 1, 0, 0],
-                        [0, 0, 1, offset.z],
-                        [0, 0, 0, 1]])
-        
-        S_u_w_h = self.S_u_w.T.row_insert(self.S_u_w.T.rows, sp.Matrix([1]))
+        T = Pose.translation(offset)
 
-        S_u_w_h_transformed = self.Tx * self.Ty * self.Tz * S_u_w_h
+        self.S_u_w = T.apply(self.S_u_w)
 
-        self.S_u_w = S_u_w_h_transformed[:-1, :].T
-
-        normal_vector_h = self.normal_vector.T.row_insert(self.normal_vector.T.rows, sp.Matrix([1]))
-
-        normal_vector_h_transformed = self.Tx * self.Ty * self.Tz * normal_vector_h
-
-        self.normal_vector = normal_vector_h_transformed[:-1, :].T
+        self.normal_vector = T.apply(self.normal_vector)
 
         self.offset = self.offset.add(offset)
 
@@ -153,35 +170,13 @@ class SketchPlane:
         self.beta += beta
         self.gamma += gamma
 
-        # rotation matrices
-        self.Trx = sp.Matrix([[1, 0, 0, 0],
-                        [0, np.cos(np.radians(alpha)), -np.sin(np.radians(alpha)), 0],
-                        [0, np.sin(np.radians(alpha)), np.cos(np.radians(alpha)), 0],
-                        [0, 0, 0, 1]])
-        
-        self.Try = sp.Matrix([[np.cos(np.radians(beta)), 0, -np.sin(np.radians(beta)), 0],
-                              [0, 1, 0, 0],
-                              [np.sin(np.radians(beta)), 0, np.cos(np.radians(beta)), 0],
-                              [0, 0, 0, 1]])
-
-        self.Trz = sp.Matrix([[np.cos(np.radians(gamma)), -np.sin(np.radians(gamma)), 0, 0],
-                         [np.sin(np.radians(gamma)), np.cos(np.radians(gamma)), 0, 0],
-                         [0, 0, 1, 0],
-                         [0, 0, 0, 1]])
-        
-        S_u_w_h = self.S_u_w.T.row_insert(self.S_u_w.T.rows, sp.Matrix([1]))
+        R = Pose.rotation(alpha, beta, gamma)
 
-        S_u_w_h_transformed = self.Trz * self.Try * self.Trx * S_u_w_h
-        
-        self.S_u_w = S_u_w_h_transformed[:-1, :].T
+        self.S_u_w = R.apply(self.S_u_w)
 
         # normal vector
 
-        normal_vector_h = self.normal_vector.T.row_insert(self.normal_vector.T.rows, sp.Matrix([1]))
-
-        normal_vector_h_transformed = self.Trz * self.Try * self.Trx * normal_vector_h
-
-        self.normal_vector = normal_vector_h_transformed[:-1, :].T
+        self.normal_vector = R.apply(self.normal_vector)
 
     
 if __name__ == "__main__":
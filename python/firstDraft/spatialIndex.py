@@ -0,0 +1,229 @@
+import numpy as np
+
+
+class SpatialIndex:
+    def __init__(self, points, cell_size=None):
+        # uniform grid over sample points, sorted by cell so each cell is one contiguous run; 3d samples or 2d screen positions
+        points = np.asarray(points, dtype=float)
+
+        self.points = points.reshape(-1, points.shape[-1])
+
+        self.lower = self.points.min(axis=0)
+
+        if cell_size is None:
+            # samples lie on curves and surfaces (or fill the screen), so spread them over an area, aiming at a few dozen per cell
+            extent = np.linalg.norm(self.points.max(axis=0) - self.lower)
+
+            cell_size = max(4 * extent / np.sqrt(self.points.shape[0]), 1e-9)
+
+        self.cell_size = cell_size
+
+        cells = np.floor((self.points - self.lower) / cell_size).astype(int)
+
+        self.order = np.lexsort(cells.T[::-1])
+
+        sorted_cells = cells[self.order]
+
+        # one entry per occupied cell: where its run starts, how long it is and its flattened grid coordinate
+        boundaries = np.ones(sorted_cells.shape[0], dtype=bool)
+        boundaries[1:] = np.any(sorted_cells[1:] != sorted_cells[:-1], axis=1)
+
+        self.cell_starts = np.nonzero(boundaries)[0]
+
+        self.cell_counts = np.diff(np.append(self.cell_starts, sorted_cells.shape[0]))
+
+        self.grid_shape = cells.max(axis=0) + 1
+
+        self.cell_centres = self.lower + (sorted_cells[self.cell_starts] + 0.5) * cell_size
+
+        # an actual point per cell, whose distance bounds the nearest from above before any cell is scanned in full
+        self.cell_representatives = self.points[self.order[self.cell_starts]]
+
+        # lexsorted cells flatten to increasing keys, so a cell is found with one searchsorted
+        self.cell_keys = np.ravel_multi_index(sorted_cells[self.cell_starts].T, self.grid_shape)
+
+        # rounding room for the distance bounds, a cell whose bound only just misses is still visited
+        self.slack = 1e-9 * (np.max(np.abs(self.points)) + cell_size)
+
+        # offsets of the cells exactly r cells away, by r
+        self.shells = {}
+
+
+    def nearest(self, queries, chunk=256):
+        # index and distance of the nearest stored point for every query, exact
+        queries = np.asarray(queries, dtype=float).reshape(-1, self.points.shape[1])
+
+        indices = np.empty(queries.shape[0], dtype=int)
+        distances = np.empty(queries.shape[0])
+
+        for start in range(0, queries.shape[0], chunk):
+            indices[start:start + chunk], distances[start:start + chunk] = self.nearest_block(queries[start:start + chunk])
+
+        return indices, distances
+
+
+    def shell(self, r):
+        # every cell offset whose largest component is r, cut to what can still land inside the grid
+        if r not in self.shells:
+            spans = [np.arange(-min(r, extent - 1), min(r, extent - 1) + 1) for extent in self.grid_shape]
+
+            box = np.stack(np.meshgrid(*spans, indexing='ij'), axis=-1).reshape(-1, len(spans))
+
+            self.shells[r] = box[np.max(np.abs(box), axis=1) == r]
+
+        return self.shells[r]
+
+
+    def nearest_block(self, queries):
+        # rings of cells around each query's cell (the nearest grid cell for a query off the grid), widened until
+        # nothing further out can beat the closest point found
+        cells = np.clip(np.floor((queries - self.lower) / self.cell_size).astype(int), 0, self.grid_shape - 1)
+
+        indices = np.full(queries.shape[0], -1)
+        distances = np.full(queries.shape[0], np.inf)
+
+        active = np.arange(queries.shape[0])
+
+        r = 0
+
+        while active.shape[0] > 0:
+            self.search_ring(queries, cells, active, r, indices, distances)
+
+            active = active[distances[active] > self.beyond(queries[active], cells[active], r) - self.slack]
+
+            r += 1
+
+        return indices, distances
+
+
+    def beyond(self, queries, cells, r):
+        # least distance from each query to a grid cell more than r rings from its cell, inf once none is left.
+        # those cells fill up to two slabs of the grid per axis, below and above the ring
+        lower = self.lower
+        upper = self.lower + self.grid_shape * self.cell_size
+
+        # how far outside the whole grid the query is along each axis, the slabs span the grid along the other axes
+        outside = np.maximum(np.maximum(lower - queries, queries - upper), 0) ** 2
+
+        others = outside.sum(axis=1, keepdims=True) - outside
+
+        below = np.maximum(np.maximum(lower - queries, queries - (lower + (cells - r) * self.cell_size)), 0)
+        above = np.maximum(np.maximum(lower + (cells + r + 1) * self.cell_size - queries, queries - upper), 0)
+
+        below = np.where(cells - r >= 1, np.sqrt(others + below ** 2), np.inf)
+        above = np.where(cells + r + 1 <= self.grid_shape - 1, np.sqrt(others + above ** 2), np.inf)
+
+        return np.minimum(below.min(axis=1), above.min(axis=1))
+
+
+    def search_ring(self, queries, cells, group, r, indices, distances):
+        # the occupied cells r rings around each query of the group, keeping any point closer than the query's best so far
+        neighbours = (cells[group][:, None, :] + self.shell(r)[None, :, :]).reshape(-1, cells.shape[1])
+
+        owners = np.repeat(group, self.shell(r).shape[0])
+
+        inside = np.all((neighbours >= 0) & (neighbours < self.grid_shape), axis=1)
+
+        neighbours = neighbours[inside]
+        owners = owners[inside]
+
+        # cells that cannot beat a point found in an earlier ring are not looked up at all
+        gaps = np.linalg.norm(np.maximum(np.abs(queries[owners] - self.lower - (neighbours + 0.5) * self.cell_size) - self.cell_size / 2, 0), axis=-1)
+
+        near = gaps <= distances[owners] + self.slack
+
+        neighbours = neighbours[near]
+        owners = owners[near]
+
+        keys = np.ravel_multi_index(neighbours.T, self.grid_shape)
+
+        slots = np.minimum(np.searchsorted(self.cell_keys, keys), self.cell_keys.shape[0] - 1)
+
+        occupied = self.cell_keys[slots] == keys
+
+        found = slots[occupied]
+        owners = owners[occupied]
+
+        if found.shape[0] == 0:
+            return
+
+        # a cell is only scanned if its closest possible point beats a point already known, from this ring or an earlier one
+        bound = distances.copy()
+
+        np.minimum.at(bound, owners, np.linalg.norm(self.cell_representatives[found] - queries[owners], axis=-1))
+
+        gaps = np.linalg.norm(np.maximum(np.abs(queries[owners] - self.cell_centres[found]) - self.cell_size / 2, 0), axis=-1)
+
+        kept = gaps <= bound[owners] + self.slack
+
+        found = found[kept]
+        owners = owners[kept]
+
+        counts = self.cell_counts[found]
+
+        # flatten every (query, candidate point) pair into one array
+        owners = np.repeat(owners, counts)
+
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+        candidates = self.order[np.repeat(self.cell_starts[found], counts) + offsets]
+
+        candidate_distances = np.linalg.norm(self.points[candidates] - queries[owners], axis=-1)
+
+        # owners come out grouped by query, so the closest candidate is a segmented minimum over each run
+        new_run = np.ones(owners.shape[0], dtype=bool)
+        new_run[1:] = owners[1:] != owners[:-1]
+
+        runs = np.cumsum(new_run) - 1
+
+        minima = np.minimum.reduceat(candidate_distances, np.nonzero(new_run)[0])
+
+        hits = np.nonzero(candidate_distances == minima[runs])[0]
+
+        _, first = np.unique(runs[hits], return_index=True)
+
+        winners = hits[first]
+
+        closer = candidate_distances[winners] < distances[owners[winners]]
+
+        winners = winners[closer]
+
+        indices[owners[winners]] = candidates[winners]
+        distances[owners[winners]] = candidate_distances[winners]
+
+
+    def brute_force(self, queries, chunk=256):
+        indices = np.empty(queries.shape[0], dtype=int)
+        distances = np.empty(queries.shape[0])
+
+        for start in range(0, queries.shape[0], chunk):
+            block = np.linalg.norm(queries[start:start + chunk, None, :] - self.points[None, :, :], axis=-1)
+
+            indices[start:start + chunk] = np.argmin(block, axis=1)
+            distances[start:start + chunk] = block[np.arange(block.shape[0]), indices[start:start + chunk]]
+
+        return indices, distances
+
+
+if __name__ == "__main__":
+    import time
+
+    rng = np.random.default_rng(0)
+
+    # a wavy 200 x 200 sheet and queries scattered around it
+    u, w = np.meshgrid(np.linspace(0, 100, 200), np.linspace(0, 100, 200), indexing='ij')
+
+    points = np.stack([u, w, 10 * np.sin(u / 10) * np.cos(w / 15)], axis=-1).reshape(-1, 3)
+
+    queries = rng.uniform([0, 0, -15], [100, 100, 15], (5000, 3))
+
+    start = time.perf_counter()
+    index = SpatialIndex(points)
+    indices, distances = index.nearest(queries)
+    elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    reference, reference_distances = index.brute_force(queries)
+    brute = time.perf_counter() - start
+
+    print(f"grid {elapsed * 1e3:.1f} ms, brute force {brute * 1e3:.1f} ms, max distance difference {np.max(np.abs(distances - reference_distances)):.2e}")
@@ -8,10 +8,14 @@ from straightLine import StraightLine
 from spline import Spline
 from bezierCurve import BezierCurve
 
-from CADUtils import Offset
+from CADUtils import Offset, Pose, display_grid, grid_traces, lambdify_curve, sample_curve, unit_normals
+from diagnostics import get_logger, Pretty
+from expressionCompiler import CompiledExpression
+
+log = get_logger(__name__)
 
 class SweptSurface:
-    def __init__(self, name, curve, path_curve, axes, flipped, density=40, color='green'):
+    def __init__(self, name, curve, path_curve, axes, flipped, density=40, color='green', numeric=True, frame_density=100):
         self.u = sp.symbols('u')
 
         self.w = sp.symbols('w')
@@ -30,31 +34,200 @@ class SweptSurface:
 
         self.path_curve = path_curve
 
-        old_curve_offset = Offset(self.curve.offset.x, self.curve.offset.y, self.curve.offset.z)
+        self.numeric = numeric
+
+        if self.numeric:
+            # frames are integrated numerically, so there is no closed form; callers of S_u_w check numeric first
+            self.S_u_w = None
+
+            self.build_frames(frame_density)
+        else:
+            self.build_symbolic(axes)
+
 
+    def build_symbolic(self, axes):
         old_path_offset = Offset(self.path_curve.offset.x, self.path_curve.offset.y, self.path_curve.offset.z)
 
-        self.curve.P_u = self.translate(self.curve.P_u, Offset(-1 * self.curve.offset.x, -1 * self.curve.offset.y, -1 * self.curve.offset.z))
+        # the curves are shared with the feature tree and its undo snapshots, so they are moved as copies of their P_u
+        curve_P_u = self.translate(self.curve.P_u, Offset(-1 * self.curve.offset.x, -1 * self.curve.offset.y, -1 * self.curve.offset.z))
 
-        self.path_curve.P_u = self.translate(self.path_curve.P_u, Offset(-1 * self.path_curve.offset.x, -1 * self.path_curve.offset.y, -1 * self.path_curve.offset.z))
+        path_P_u = self.translate(self.path_curve.P_u, Offset(-1 * self.path_curve.offset.x, -1 * self.path_curve.offset.y, -1 * self.path_curve.offset.z))
 
         # after translating to origin
 
-        curve_at_0 = self.curve.generate_trace()
+        curve_at_0 = lambdify_curve(self.u, curve_P_u)(np.linspace(0, 1, self.curve.density))
 
-        path_at_0 = self.path_curve.generate_trace()
+        path_at_0 = lambdify_curve(self.u, path_P_u)(np.linspace(0, 1, self.path_curve.density))
 
         axes.plot(curve_at_0[:, 0], curve_at_0[:, 1], curve_at_0[:, 2], color='purple', label='curve at 0')
 
         axes.plot(path_at_0[:, 0], path_at_0[:, 1], path_at_0[:, 2], color='red', label='path at 0')
 
-        self.S_u_w = self.sweep(self.curve.P_u, self.path_curve.P_u, self.flipped)
+        self.S_u_w = self.sweep(curve_P_u, path_P_u, self.flipped)
 
         self.S_u_w = self.translate(self.S_u_w, old_path_offset)
 
-        self.curve.P_u = self.translate(self.curve.P_u, old_curve_offset)
 
-        self.path_curve.P_u = self.translate(self.path_curve.P_u, old_path_offset)
+    def build_frames(self, frame_density):
+        # the profile is carried relative to its sketch plane origin, like the symbolic sweep
+        self.profile_origin = np.array([self.curve.offset.x, self.curve.offset.y, self.curve.offset.z], dtype=float)
+
+        # sample the path and its derivative once
+        self.frame_w = np.linspace(0, 1, frame_density)
+
+        self.frame_points = sample_curve(self.path_curve, self.frame_w)
+
+        self.frame_tangents = self.unit_tangents(sample_curve(self.path_curve, self.frame_w, 1))
+
+        extent = max(np.ptp(self.frame_points, axis=0).max(), 1)
+
+        self.step_tolerance = (1e-10 * extent) ** 2
+
+        # rotation minimizing frames by double reflection, every step's reflections built in one batch
+        steps = self.double_reflection(self.frame_points[:-1], self.frame_tangents[:-1], self.frame_points[1:], self.frame_tangents[1:])
+
+        self.frames = np.empty((frame_density, 3, 3))
+        self.frames[0] = self.starting_frame(self.frame_tangents[0])
+
+        for k in range(frame_density - 1):
+            self.frames[k + 1] = steps[k] @ self.frames[k]
+
+        self.mirror = self.flip_mirror(self.frame_tangents[0]) if self.flipped else np.eye(3)
+
+
+    def profile_normal(self, tangent):
+        # unit normal of the profile's sketch plane on the side of the path tangent, None for a curve without a plane
+        sketch_plane = getattr(self.curve, 'sketch_plane', None)
+
+        if sketch_plane is None:
+            return None
+
+        corners = sketch_plane.corners()
+
+        normal = self.unit_tangents(np.cross(corners[1, 0] - corners[0, 0], corners[0, 1] - corners[0, 0]))
+
+        # a plane's normal has no preferred side, the one nearer the tangent turns the profile least
+        if normal @ tangent < 0:
+            normal = -normal
+
+        return normal
+
+
+    def flip_mirror(self, tangent):
+        # the symbolic sweep's flipped flag turns the profile by +theta instead of -theta about the path plane normal,
+        # which is the unflipped sweep seen in a mirror through the profile normal and that axis; its mirror normal is the
+        # part of the start tangent across the profile normal
+        normal = self.profile_normal(tangent)
+
+        if normal is None:
+            return np.eye(3)
+
+        return self.reflections(tangent - (tangent @ normal) * normal, 1e-24)
+
+
+    def starting_frame(self, tangent):
+        # the symbolic sweep turns the profile so its sketch plane faces along the path, the frames start from that same
+        # orientation: the smallest rotation taking the profile plane's normal onto the path tangent at w = 0
+        normal = self.profile_normal(tangent)
+
+        if normal is None:
+            return np.eye(3)
+
+        # reflecting across n + t sends n to -t, reflecting across t brings it back to t
+        return self.reflections(tangent, 0) @ self.reflections(normal + tangent, 1e-24)
+
+
+    def unit_tangents(self, derivatives):
+        magnitudes = np.linalg.norm(derivatives, axis=-1, keepdims=True)
+
+        return derivatives / np.where(magnitudes > 0, magnitudes, 1)
+
+
+    def reflections(self, normals, tolerance):
+        dots = np.einsum('...i,...i->...', normals, normals)
+
+        valid = dots > tolerance
+
+        H = np.eye(3) - 2 * normals[..., :, None] * normals[..., None, :] / np.where(valid, dots, 1)[..., None, None]
+
+        return np.where(valid[..., None, None], H, np.eye(3))
+
+
+    def double_reflection(self, x0, t0, x1, t1):
+        v1 = x1 - x0
+
+        # coincident samples reflect along the tangent, the limit of the chord direction
+        short = np.einsum('...i,...i->...', v1, v1) <= self.step_tolerance
+
+        v1 = np.where(short[..., None], t0, v1)
+
+        H1 = self.reflections(v1, 0)
+
+        t0_reflected = (H1 @ t0[..., None])[..., 0]
+
+        H2 = self.reflections(t1 - t0_reflected, 1e-24)
+
+        return H2 @ H1
+
+
+    def frames_at(self, w):
+        # step from the nearest precomputed frame below each w with one more double reflection
+        k = np.clip(np.searchsorted(self.frame_w, w, side='right') - 1, 0, self.frame_w.shape[0] - 1)
+
+        points = sample_curve(self.path_curve, w)
+
+        tangents = self.unit_tangents(sample_curve(self.path_curve, w, 1))
+
+        steps = self.double_reflection(self.frame_points[k], self.frame_tangents[k], points, tangents)
+
+        # flipped frames are the mirror images of the unflipped ones, an identity mirror otherwise
+        return self.mirror @ steps @ self.frames[k] @ self.mirror, points
+
+
+    def evaluate_points(self, u, w, derivatives=False):
+        u = np.asarray(u, dtype=float)
+        w = np.asarray(w, dtype=float)
+
+        profile = sample_curve(self.curve, u) - self.profile_origin
+
+        frames, path_points = self.frames_at(w)
+
+        carried = (frames @ profile[..., None])[..., 0]
+
+        S = path_points + carried
+
+        if not derivatives:
+            return S
+
+        S_u = (frames @ sample_curve(self.curve, u, 1)[..., None])[..., 0]
+
+        # a rotation minimizing frame only turns about the binormal, at angular velocity t x P'' / |P'|
+        path_d1 = sample_curve(self.path_curve, w, 1)
+        path_d2 = sample_curve(self.path_curve, w, 2)
+
+        speed = np.linalg.norm(path_d1, axis=-1, keepdims=True)
+
+        omega = np.cross(self.unit_tangents(path_d1), path_d2) / np.where(speed > 0, speed, 1)
+
+        # mirrored frames turn the other way, about the mirrored axis
+        if self.flipped:
+            omega = -omega @ self.mirror.T
+
+        S_w = path_d1 + np.cross(omega, carried)
+
+        S_u, S_w = np.broadcast_arrays(S_u, S_w)
+
+        return S, S_u, S_w, unit_normals(S_u, S_w)
+
+
+    def evaluate_grid(self, u_eval=None, w_eval=None, derivatives=False):
+        if u_eval is None:
+            u_eval = self.u_eval
+
+        if w_eval is None:
+            w_eval = self.w_eval
+
+        return self.evaluate_points(np.asarray(u_eval)[:, None], np.asarray(w_eval)[None, :], derivatives)
 
 
     def sweep(self, curve, path, flipped):
@@ -76,82 +249,32 @@ class SweptSurface:
 
         S_u_w = sp.Matrix([T_theta * curve.T]).T + path
 
-        sp.pretty_print(S_u_w)
+        log.debug("S_u_w:%s", Pretty(S_u_w))
 
         return S_u_w
 
 
     def translate(self, curve, offset=Offset(0, 0, 0)):
-        # translation matrices
-
-        self.Tx = sp.Matrix([[1, 0, 0, offset.x],
-                        [0, 1, 0, 0],
-                        [0, 0, 1, 0],
-                        [0, 0, 0, 1]])
-        
-        self.Ty = sp.Matrix([[1, 0, 0, 0],
-                        [0, 1, 0, offset.y],
-                        [0, 0, 1, 0],
-                        [0, 0, 0, 1]])
-        
-        self.Tz = sp.Matrix([[1, 0, 0, 0],
-                        [0, 1, 0, 0],
-                        [0, 0, 1, offset.z],
-                        [0, 0, 0, 1]])
+        T = Pose.translation(offset)
         
-        curve_h = curve.T.row_insert(curve.T.rows, sp.Matrix([1]))
-
-        curve_h_transformed = self.Tx * self.Ty * self.Tz * curve_h
-
-        curve_transformed = curve_h_transformed[:-1, :].T
-
-        return curve_transformed
+        return T.apply(curve)
     
 
     def rotate(self, curve, alpha, beta, gamma):
-        self.Trx = sp.Matrix([[1, 0, 0, 0],
-                        [0, np.cos(np.radians(alpha)), -np.sin(np.radians(alpha)), 0],
-                        [0, np.sin(np.radians(alpha)), np.cos(np.radians(alpha)), 0],
-                        [0, 0, 0, 1]])
-        
-        self.Try = sp.Matrix([[np.cos(np.radians(beta)), 0, -np.sin(np.radians(beta)), 0],
-                              [0, 1, 0, 0],
-                              [np.sin(np.radians(beta)), 0, np.cos(np.radians(beta)), 0],
-                              [0, 0, 0, 1]])
-
-        self.Trz = sp.Matrix([[np.cos(np.radians(gamma)), -np.sin(np.radians(gamma)), 0, 0],
-                         [np.sin(np.radians(gamma)), np.cos(np.radians(gamma)), 0, 0],
-                         [0, 0, 1, 0],
-                         [0, 0, 0, 1]])
+        R = Pose.rotation(alpha, beta, gamma, order='xyz')
         
-        curve_h = curve.P_u.T.row_insert(curve.P_u.T.rows, sp.Matrix([1]))
+        return R.apply(curve.P_u)
+    
+    def generate_traces(self, dtype=None):
+        if self.numeric:
+            self.S_u_w_lines = grid_traces(display_grid(self.evaluate_grid(), dtype))
 
-        curve_h_transformed = self.Trx * self.Try * self.Trz * curve_h
+            return self.S_u_w_lines
 
-        curve_transformed = curve_h_transformed[:-1, :].T
+        self.S_u_w_callable = CompiledExpression([self.u, self.w], self.S_u_w)
 
-        return curve_transformed
-    
-    def generate_traces(self):
-        self.S_u_w_lines = []
-        self.S_u_w_callable = sp.lambdify([self.u, self.w], self.S_u_w)
-        # traces along u lines
-        for i in range(len(self.w_eval)):
-            S_u_w_line = np.empty((0, 3))
-            for j in range(len(self.u_eval)):
-                point = self.S_u_w_callable(self.w_eval[i], self.u_eval[j])
-
-                S_u_w_line = np.append(S_u_w_line, point, axis=0)
-            self.S_u_w_lines.append(S_u_w_line)
-
-        # traces along w
-        for i in range(len(self.u_eval)):
-            S_u_w_line = np.empty((0, 3))
-            for j in range(len(self.w_eval)):
-                point = self.S_u_w_callable(self.w_eval[j], self.u_eval[i])
-
-                S_u_w_line = np.append(S_u_w_line, point, axis=0)
-            self.S_u_w_lines.append(S_u_w_line)
+        # the callable takes w_eval in its first slot and u_eval in its second, as the pointwise traces always did
+        self.S_u_w_lines = grid_traces(display_grid(self.S_u_w_callable.evaluate(self.w_eval[:, None], self.u_eval[None, :]), dtype))
 
         return self.S_u_w_lines
     
@@ -187,6 +310,21 @@ if __name__ == "__main__":
 
     mySweptSurface = SweptSurface("surface 1", myCurve, myPath, axes, flipped=True)
 
+    # the numeric engine against the symbolic sweep it replaces, for both flags
+    u_check = np.linspace(0, 1, 9)
+    w_check = np.linspace(0, 1, 9)
+
+    for flipped in (False, True):
+        numeric = SweptSurface("numeric", myCurve, myPath, axes, flipped=flipped)
+
+        symbolic = SweptSurface("symbolic", myCurve, myPath, axes, flipped=flipped, numeric=False)
+
+        symbolic_callable = sp.lambdify([symbolic.u, symbolic.w], symbolic.S_u_w)
+
+        expected = np.array([[np.ravel(symbolic_callable(u, w)) for w in w_check] for u in u_check], dtype=float)
+
+        print(f"flipped={flipped}: numeric and symbolic sweeps differ by at most {np.max(np.abs(numeric.evaluate_grid(u_check, w_check) - expected)):.1e}")
+
     sweptSurfaceEval = mySweptSurface.generate_traces()
 
     curveFromSurf = mySweptSurface.curve.generate_trace()
@@ -0,0 +1,315 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+import numpy as np
+import sympy as sp
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from featureTree import FeatureTree
+from sketchPlane import SketchPlane
+from straightLine import StraightLine
+from bezierCurve import BezierCurve
+from revolvedSurface import RevolvedSurface
+from renderer import Renderer, pack_segments, current_display_dtype
+from diagnostics import get_logger
+
+log = get_logger(__name__)
+
+
+def model_bounds(packet):
+    # centre and half width of a cube around everything the model draws, so no model is cropped by fixed limits
+    points = [segments.reshape(-1, 3) for _, _, segments in packet['lines']] + [S.reshape(-1, 3) for _, S, _ in packet['shaded']]
+
+    points = np.concatenate(points) if points else np.zeros((1, 3))
+
+    lower = points.min(axis=0)
+    upper = points.max(axis=0)
+
+    half = max(np.max(upper - lower) / 2, 1) * (1 + packet['margin'])
+
+    return (lower + upper) / 2, half
+
+
+def render_packet(packet):
+    # only arrays and plain values arrive here, never sympy expressions or lambdified closures
+    paths = []
+
+    centre, half = model_bounds(packet)
+
+    for index, (elev, azim) in enumerate(packet['views']):
+        figure = Figure(figsize=(packet['size'] / packet['dpi'], packet['size'] / packet['dpi']), dpi=packet['dpi'])
+        FigureCanvasAgg(figure)
+
+        axes = figure.add_subplot(projection='3d')
+        axes.view_init(elev, azim)
+        axes.set_axis_off()
+
+        axes.set_xlim((centre[0] - half, centre[0] + half))
+        axes.set_ylim((centre[1] - half, centre[1] + half))
+        axes.set_zlim((centre[2] - half, centre[2] + half))
+
+        renderer = Renderer(axes)
+
+        for color, alpha, segments in packet['lines']:
+            if segments.shape[0] > 0:
+                axes.add_collection3d(renderer.line_collection(segments, color, alpha))
+
+        for color, S, N in packet['shaded']:
+            renderer.draw_shaded(S, N, color=color, cull_back_faces=packet['cull_back_faces'])
+
+        path = os.path.join(packet['output_dir'], f"{packet['name']}_view{index}.png")
+
+        figure.savefig(path)
+
+        paths.append(path)
+
+    return paths
+
+
+def model_packet(settings, name, featureTree: FeatureTree):
+    # packed segments and grids at display precision, everything render_packet needs
+    lines = []
+    shaded = []
+
+    dtype = settings['dtype']
+
+    for sketchPlane in featureTree.sketchPlanes:
+        lines.append((sketchPlane.color, 0.3, pack_segments(featureTree.evaluate(sketchPlane, dtype), dtype=dtype)))
+
+    for curve in featureTree.curves:
+        lines.append((curve.color, None, pack_segments(featureTree.evaluate(curve, dtype), dtype=dtype)))
+
+    for surface in featureTree.surfaces:
+        if settings['shaded'] and getattr(surface, 'numeric', False):
+            S, N = featureTree.evaluate_shaded(surface, dtype)
+
+            shaded.append((surface.color, np.ascontiguousarray(S), np.ascontiguousarray(N)))
+        else:
+            lines.append((surface.color, None, pack_segments(featureTree.evaluate(surface, dtype), dtype=dtype)))
+
+    return dict(settings, name=name, lines=lines, shaded=shaded)
+
+
+def render_model(settings, name, build):
+    # runs in a worker: the model is built and evaluated here, since a built tree holds closures that cannot be pickled
+    return render_packet(model_packet(settings, name, build()))
+
+
+class ThumbnailRenderer:
+    def __init__(self, views, output_dir, workers=None, size=160, dpi=100, shaded=False, cull_back_faces=False, margin=0.05):
+        # views are (elevation, azimuth) pairs in degrees, one image per view
+        self.views = [tuple(view) for view in views]
+
+        self.output_dir = output_dir
+
+        self.workers = workers
+
+        self.size = size
+
+        self.dpi = dpi
+
+        self.shaded = shaded
+
+        self.cull_back_faces = cull_back_faces
+
+        # the limits are fitted to each model, with this much room around it
+        self.margin = margin
+
+        # names of the models the last render_models could not draw
+        self.failed = []
+
+        os.makedirs(output_dir, exist_ok=True)
+
+
+    def settings(self):
+        return {
+            'views': self.views,
+            'output_dir': self.output_dir,
+            'size': self.size,
+            'dpi': self.dpi,
+            'margin': self.margin,
+            'shaded': self.shaded,
+            'cull_back_faces': self.cull_back_faces,
+            'dtype': current_display_dtype(),
+        }
+
+
+    def render(self, name, featureTree: FeatureTree):
+        # single model already built, rendered in this process
+        return render_packet(model_packet(self.settings(), name, featureTree))
+
+
+    def render_models(self, models):
+        # models is any iterable of (name, build), build a picklable callable returning the model's FeatureTree
+        # (a module level function or a functools.partial of one); consumed lazily so only a few are in flight at once.
+        # a model that fails, or takes its worker down with it, is logged and recorded in failed, the rest of the batch carries on
+        workers = self.workers or os.cpu_count() or 1
+
+        settings = self.settings()
+
+        models = iter(models)
+
+        paths = {}
+
+        self.failed = []
+
+        # future to (name, build, alone), alone for a model rerun by itself after a worker died while it was in flight
+        pending = {}
+
+        # models in flight when a worker died, each rerun alone to find the one that kills its worker
+        suspects = []
+
+        # models that could not be submitted to a pool that had just died, they never ran
+        unsent = []
+
+        executor = ProcessPoolExecutor(workers)
+
+        try:
+            while True:
+                broken = False
+
+                isolating = len(suspects) > 0 or any(alone for _, _, alone in pending.values())
+
+                while len(pending) < (1 if isolating else 2 * workers):
+                    alone = len(suspects) > 0
+
+                    if alone:
+                        name, build = suspects.pop(0)
+                    elif unsent:
+                        name, build = unsent.pop(0)
+                    else:
+                        model = next(models, None)
+
+                        if model is None:
+                            break
+
+                        name, build = model
+
+                    try:
+                        pending[executor.submit(render_model, settings, name, build)] = (name, build, alone)
+                    except BrokenProcessPool:
+                        (suspects if alone else unsent).insert(0, (name, build))
+
+                        broken = True
+
+                        break
+
+                    isolating = isolating or alone
+
+                if not pending:
+                    if not broken:
+                        break
+
+                    executor = self.restart(executor, workers)
+
+                    continue
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+                lost = []
+
+                for future in done:
+                    name, build, _ = pending.pop(future)
+
+                    if not self.collect(future, name, paths):
+                        lost.append((name, build))
+
+                if not lost and not broken:
+                    continue
+
+                # the rest went down with the pool too, they all fail at once, though a result that came in just before is still kept
+                done, _ = wait(pending)
+
+                for future in done:
+                    name, build, _ = pending.pop(future)
+
+                    if not self.collect(future, name, paths):
+                        lost.append((name, build))
+
+                if len(lost) == 1:
+                    # alone in flight, so it is the one that killed the worker
+                    log.error("thumbnail of %s failed, its worker died", lost[0][0])
+
+                    self.failed.append(lost[0][0])
+                else:
+                    suspects.extend(lost)
+
+                executor = self.restart(executor, workers)
+        finally:
+            executor.shutdown()
+
+        return paths
+
+
+    def restart(self, executor, workers):
+        log.warning("a thumbnail worker died, restarting the pool")
+
+        executor.shutdown(wait=False)
+
+        return ProcessPoolExecutor(workers)
+
+
+    def collect(self, future, name, paths):
+        # False when the pool died under the model, which then has to be run again
+        try:
+            paths[name] = future.result()
+        except BrokenProcessPool:
+            return False
+        except Exception:
+            log.exception("thumbnail of %s failed", name)
+
+            self.failed.append(name)
+
+        return True
+
+
+def demo_model(k):
+    featureTree = FeatureTree()
+
+    p0 = sp.Matrix([[-100, 0, -100]])
+    p1 = sp.Matrix([[-100, 0, 100]])
+
+    q0 = sp.Matrix([[100, 0, -100]])
+    q1 = sp.Matrix([[100, 0, 100]])
+
+    plane = SketchPlane('Plane0', 'xz', 10, p0, p1, q0, q1)
+
+    featureTree.add_sketch_plane(plane)
+
+    curve = BezierCurve('curve0', sp.Matrix([[20, 0, -60], [60 + 10 * k, 0, 0], [30, 0, 60]]), 40, plane)
+
+    featureTree.add_curve(curve)
+
+    axis = StraightLine('axis', sp.Matrix([[0, 0, -50]]), sp.Matrix([[0, 0, 50]]), 10, plane)
+
+    featureTree.add_surface(RevolvedSurface('Surface0', curve, axis, 90 * (k + 1)))
+
+    return featureTree
+
+
+def demo_broken():
+    raise ValueError("a model that fails to build")
+
+
+def demo_crashed():
+    # a worker that dies outright, the way a segfault in a native library would take it down
+    os._exit(1)
+
+
+if __name__ == "__main__":
+    thumbnails = ThumbnailRenderer([(30, -60), (0, 0), (90, -90)], 'thumbnails', shaded=True, workers=2)
+
+    # the demo builders live at module level so spawned workers can import them.
+    # one model raises and one kills its worker, the others still get their thumbnails
+    models = [(f"model{k}", partial(demo_model, k)) for k in range(4)]
+
+    paths = thumbnails.render_models(models[:2] + [('broken', demo_broken), ('crashed', demo_crashed)] + models[2:])
+
+    for name, files in paths.items():
+        print(name, files)
+
+    print("failed", thumbnails.failed)
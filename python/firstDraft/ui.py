@@ -1,6 +1,7 @@
 import PyQt6 as qt
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QTimer
 import PyQt6.QtWidgets as wdg
+from PyQt6.QtGui import QShortcut, QKeySequence
 from PyQt6.uic import loadUi
 import os
 import sys
@@ -16,6 +17,7 @@ import sympy as sp
 import numpy as np
 
 from CADUtils import Offset
+from diagnostics import get_logger, Pretty
 from sketchPlane import SketchPlane
 from straightLine import StraightLine
 from spline import Spline
@@ -29,33 +31,19 @@ from sweptSurface import SweptSurface
 
 from intersectionCurve import IntersectionCurve
 
+from featureTree import FeatureTree
+from instrumentation import profiler
+from renderer import Renderer, PLANE_COLUMNS, current_display_dtype
+from picker import Picker
+from history import History
 
-class FeatureTree:
-    def __init__(self):
-        self.sketchPlanesCount = 0
-        self.sketchCount = 0
-        self.curveCount = 0
-        self.surfaceCount = 0
-
-        self.sketchPlanes = []
-        self.sketches = []
-        self.curves = []
-        self.surfaces = []
-
-    
-    def add_sketch_plane(self, sketchPlane:SketchPlane):
-        self.sketchPlanes.append(sketchPlane)
-        self.sketchPlanesCount += 1
-
+log = get_logger(__name__)
 
-    def add_curve(self, curve):
-        self.curves.append(curve)
-        self.curveCount += 1
+# list items carry their feature's id under this role, the text is only the name shown
+ID_ROLE = Qt.ItemDataRole.UserRole
 
-    
-    def add_surface(self, surface):
-        self.surfaces.append(surface)
-        self.surfaceCount += 1
+# milliseconds the extrusion depth field has to stay unchanged before the preview follows it
+EXTRUSION_PREVIEW_DELAY = 150
 
 
 class MplCanvas3d(FigureCanvasQTAgg):
@@ -92,9 +80,31 @@ class MainWindow(wdg.QDialog):
         # feature tree
         self.featureTree = FeatureTree()
 
+        # undo/redo of everything added to or deleted from the tree
+        self.history = History(self.featureTree)
+
         # temp sketch plane
         self.tempSketchPlane = None
 
+        # colours of highlighted features by id, kept here since the tree's features are shared with its undo snapshots
+        self.highlights = {}
+
+        # extrusion previews by curve and the artists drawing them, kept while the extrusion dialogue is open
+        self.extrusionPreviews = {}
+        self.extrusionArtists = {}
+
+        # the depth field previews once typing pauses, not on every keystroke
+        self.extrusionTimer = QTimer(self)
+        self.extrusionTimer.setSingleShot(True)
+        self.extrusionTimer.setInterval(EXTRUSION_PREVIEW_DELAY)
+        self.extrusionTimer.timeout.connect(self.preview_extrusion)
+
+        self.pendingExtrusion = None
+
+        # surface display
+        self.shaded = False
+        self.cull_back_faces = False
+
         # state flags
         self.sketch_displayed = False
         self.sketch_plane_dialogue_displayed = False
@@ -102,6 +112,10 @@ class MainWindow(wdg.QDialog):
         self.surface_dialogue_displayed = False
         self.intersection_dialogue_displayed = False
 
+        # canvas picking, where the left button went down and what the last click selected
+        self.press = None
+        self.selectedFeature = None
+
         # setup plot
         self.setup_3d_plot()
 
@@ -114,17 +128,32 @@ class MainWindow(wdg.QDialog):
         self.sketchButton: wdg.QPushButton
         self.surfaceButton: wdg.QPushButton
         self.surfaceIntersectionButton: wdg.QPushButton
+        self.statsButton: wdg.QPushButton
+        self.shadedBox: wdg.QCheckBox
+        self.cullBox: wdg.QCheckBox
 
         # setup callback functions
         self.sketchPlaneButton.clicked.connect(self.sketch_plane_dialogue)
         self.sketchButton.clicked.connect(self.sketch_dialogue)
         self.surfaceButton.clicked.connect(self.surface_dialogue)
         self.surfaceIntersectionButton.clicked.connect(self.intersection_dialogue)
+        self.statsButton.clicked.connect(self.stats_dialogue)
+        self.shadedBox.toggled.connect(self.shaded_toggled)
+        self.cullBox.toggled.connect(self.cull_toggled)
+
+        # undo/redo shortcuts, ctrl+z and ctrl+y (or the platform's equivalents)
+        QShortcut(QKeySequence.StandardKey.Undo, self).activated.connect(self.undo)
+        QShortcut(QKeySequence.StandardKey.Redo, self).activated.connect(self.redo)
 
 
     def setup_3d_plot(self):
         self.clear_mpl_container()
         self.sc = MplCanvas3d()
+        self.renderer = Renderer(self.sc.axes)
+        self.picker = Picker(self.sc.axes)
+
+        self.sc.mpl_connect('button_press_event', self.canvas_pressed)
+        self.sc.mpl_connect('button_release_event', self.canvas_released)
         
         self.set_labels_3d()
         self.set_limits_3d()
@@ -137,6 +166,7 @@ class MainWindow(wdg.QDialog):
     def setup_2d_plot(self, initial_orientation : str):
         self.clear_mpl_container()
         self.sc = MplCanvas()
+        self.renderer = Renderer(self.sc.axes)
 
         self.set_labels_2d(initial_orientation)
         self.set_limits_2d()
@@ -163,11 +193,11 @@ class MainWindow(wdg.QDialog):
         if self.intersection_dialogue_displayed == True:
             return
         
-        self.color_all_sketchplanes_blue()
+        self.unhighlight_sketch_planes()
 
-        self.color_all_curves_blue()
+        self.unhighlight_curves()
 
-        self.color_all_surfaces_green()
+        self.unhighlight_surfaces()
 
         self.setup_3d_plot()
 
@@ -183,10 +213,10 @@ class MainWindow(wdg.QDialog):
         surfaceLabel2 = wdg.QLabel("select surface 2")
         surfaceList2 = wdg.QListWidget()
 
-        names = [curve.name for curve in self.featureTree.surfaces]
+        surfaces = self.featureTree.surfaces
 
-        surfaceList1.addItems(names)
-        surfaceList2.addItems(names)
+        self.fill_list(surfaceList1, surfaces)
+        self.fill_list(surfaceList2, surfaces)
 
         layout.addWidget(surfaceLabel1, 1, 0, 1, 4)
         layout.addWidget(surfaceList1, 2, 0, 1, 4)
@@ -222,17 +252,114 @@ class MainWindow(wdg.QDialog):
         self.optionLayout.addWidget(self.intersectionContainer)
 
 
+    def stats_dialogue(self):
+        self.clear_option_layout()
+
+        self.statsContainer = wdg.QWidget()
+        layout = wdg.QGridLayout(self.statsContainer)
+
+        statsLabel = wdg.QLabel("time per feature (ms), click a header to sort")
+
+        self.statsTable = wdg.QTableWidget()
+
+        statsProfileBox = wdg.QCheckBox("profile features (slower)")
+        statsProfileBox.setChecked(profiler.enabled)
+
+        statsMemoryBox = wdg.QCheckBox("track memory (slower)")
+        statsMemoryBox.setChecked(profiler.memory)
+
+        statsRefreshButton = wdg.QPushButton("Refresh")
+        statsResetButton = wdg.QPushButton("Reset")
+        statsEscapeButton = wdg.QPushButton("Close")
+
+        layout.addWidget(statsLabel, 0, 0, 1, 3)
+        layout.addWidget(self.statsTable, 1, 0, 1, 3)
+        layout.addWidget(statsProfileBox, 3, 0, 1, 3)
+        layout.addWidget(statsMemoryBox, 4, 0, 1, 3)
+        layout.addWidget(statsEscapeButton, 2, 0)
+        layout.addWidget(statsRefreshButton, 2, 1)
+        layout.addWidget(statsResetButton, 2, 2)
+
+        statsRefreshButton.clicked.connect(self.fill_stats_table)
+        statsResetButton.clicked.connect(self.reset_stats)
+        statsProfileBox.toggled.connect(lambda checked: self.profiling_toggled(checked, statsMemoryBox))
+        statsMemoryBox.toggled.connect(lambda checked: self.memory_tracking_toggled(checked, statsProfileBox))
+        statsEscapeButton.clicked.connect(lambda: self.escape_container(self.statsContainer))
+
+        self.fill_stats_table()
+
+        self.optionLayout.addWidget(self.statsContainer)
+
+
+    def fill_stats_table(self):
+        # retained bytes per feature when memory accounting has been on
+        retained = len(profiler.memory_records) > 0
+
+        phases, rows = profiler.rows(retained)
+
+        headers = ['category', 'name', 'total'] + phases
+
+        # numbers go in as data so columns sort numerically
+        if retained:
+            headers.append('retained KiB')
+
+            rows = [row[:2] + [round(seconds * 1e3, 3) for seconds in row[2:-1]] + [round(row[-1] / 1024, 1)] for row in rows]
+        else:
+            rows = [row[:2] + [round(seconds * 1e3, 3) for seconds in row[2:]] for row in rows]
+
+        # sorting has to be off while filling or rows get shuffled mid-insert
+        self.statsTable.setSortingEnabled(False)
+        self.statsTable.clear()
+        self.statsTable.setColumnCount(len(headers))
+        self.statsTable.setRowCount(len(rows))
+        self.statsTable.setHorizontalHeaderLabels(headers)
+
+        for i, row in enumerate(rows):
+            for j, value in enumerate(row):
+                item = wdg.QTableWidgetItem()
+                item.setData(Qt.ItemDataRole.DisplayRole, value)
+
+                self.statsTable.setItem(i, j, item)
+
+        self.statsTable.setSortingEnabled(True)
+        self.statsTable.sortItems(2, Qt.SortOrder.DescendingOrder)
+
+
+    def profiling_toggled(self, checked, statsMemoryBox):
+        if checked:
+            profiler.enable()
+            return
+
+        # memory is only measured alongside the timings, so it stops with them
+        statsMemoryBox.setChecked(False)
+
+        profiler.disable()
+
+
+    def memory_tracking_toggled(self, checked, statsProfileBox):
+        if checked:
+            profiler.enable_memory()
+
+            statsProfileBox.setChecked(True)
+        else:
+            profiler.disable_memory()
+
+
+    def reset_stats(self):
+        profiler.reset()
+
+        self.fill_stats_table()
+
+
     def deleteSurface(self, selectedItems):
-        selectedSurface = None
         if len(selectedItems) == 0:
             return
         
-        for surface in self.featureTree.surfaces:
-            if surface.name == selectedItems[0].text():
-                selectedSurface = surface
+        selectedSurface = self.featureTree.surface(selectedItems[0].data(ID_ROLE))
     
         if selectedSurface is not None:
-            self.featureTree.surfaces.remove(selectedSurface)
+            self.history.checkpoint(f"delete {selectedSurface.name}")
+            self.featureTree.remove(selectedSurface)
 
         self.setup_3d_plot()
 
@@ -240,28 +367,13 @@ class MainWindow(wdg.QDialog):
 
 
     def surface_highlighted(self, selectedItems1, selectedItems2):
-        orangeSurfaces = []
-        purpleSurfaces = []
-        if len(selectedItems1) != 0:
-            for surface in self.featureTree.surfaces:
-                if surface.name == selectedItems1[0].text():
-                    orangeSurfaces.append(surface)
-
-        if len(selectedItems2) != 0:
-            for surface in self.featureTree.surfaces:
-                if surface.name == selectedItems2[0].text():
-                    purpleSurfaces.append(surface)
+        self.unhighlight_surfaces()
 
-        greenSurfaces = list(set(self.featureTree.surfaces) - set(orangeSurfaces) - set(purpleSurfaces))
+        for surface in self.selected(selectedItems1[:1], self.featureTree.surface):
+            self.highlight(surface, 'orange')
 
-        for surface in orangeSurfaces:
-            surface.color = 'orange'
-
-        for surface in purpleSurfaces:
-            surface.color = 'purple'
-
-        for surface in greenSurfaces:
-            surface.color = 'green'
+        for surface in self.selected(selectedItems2[:1], self.featureTree.surface):
+            self.highlight(surface, 'purple')
 
         self.setup_3d_plot()
 
@@ -276,20 +388,17 @@ class MainWindow(wdg.QDialog):
         sketchPlane = SketchPlane(f"Plane{self.featureTree.sketchPlanesCount}", 'xy', 10, p0, p1, q0, q1, color='blue')
 
         if len(selectedItems1) == 0:
-            print('no selected first surface')
+            log.warning('no selected first surface')
             return
         
         if len(selectedItems2) == 0:
-            print('no selected second surface')
+            log.warning('no selected second surface')
             return
         
-        for surface in self.featureTree.surfaces:
-            if surface.name == selectedItems1[0].text():
-                selectedSurface1 = surface
-            elif surface.name == selectedItems2[0].text():
-                selectedSurface2 = surface
+        selectedSurface1 = self.featureTree.surface(selectedItems1[0].data(ID_ROLE))
+        selectedSurface2 = self.featureTree.surface(selectedItems2[0].data(ID_ROLE))
 
-        if selectedSurface1 is None or selectedSurface1 is None:
+        if selectedSurface1 is None or selectedSurface2 is None:
             return
         
         intersectionCurve = IntersectionCurve(f"curve{self.featureTree.curveCount}", selectedSurface1, selectedSurface2, 100, 1, sketchPlane)
@@ -301,7 +410,7 @@ class MainWindow(wdg.QDialog):
 
         self.setup_3d_plot()
 
-        self.sc.axes.plot(intersectionCurveTrace[:, 0], intersectionCurveTrace[:, 1], intersectionCurveTrace[:, 2])
+        self.renderer.draw_traces([intersectionCurveTrace])
 
         self.sc.figure.canvas.draw()
 
@@ -316,36 +425,34 @@ class MainWindow(wdg.QDialog):
         sketchPlane = SketchPlane(f"Plane{self.featureTree.sketchPlanesCount}", 'xy', 10, p0, p1, q0, q1, color='blue')
 
         if len(selectedItems1) == 0:
-            print('no selected first surface')
+            log.warning('no selected first surface')
             return
         
         if len(selectedItems2) == 0:
-            print('no selected second surface')
+            log.warning('no selected second surface')
             return
         
-        for surface in self.featureTree.surfaces:
-            if surface.name == selectedItems1[0].text():
-                selectedSurface1 = surface
-            elif surface.name == selectedItems2[0].text():
-                selectedSurface2 = surface
+        selectedSurface1 = self.featureTree.surface(selectedItems1[0].data(ID_ROLE))
+        selectedSurface2 = self.featureTree.surface(selectedItems2[0].data(ID_ROLE))
 
-        if selectedSurface1 is None or selectedSurface1 is None:
+        if selectedSurface1 is None or selectedSurface2 is None:
             return
         
-        intersectionCurve = IntersectionCurve(f"curve{self.featureTree.curveCount}", selectedSurface1, selectedSurface2, 100, 1, sketchPlane)
+        intersectionCurve = self.featureTree.construct(IntersectionCurve, f"curve{self.featureTree.curveCount}", selectedSurface1, selectedSurface2, 100, 1, sketchPlane)
     
         if intersectionCurve is None:
             return
 
+        self.history.checkpoint('intersection')
         self.featureTree.add_curve(intersectionCurve.curve_itself)
 
         self.draw_features()
 
-        self.color_all_sketchplanes_blue()
+        self.unhighlight_sketch_planes()
 
-        self.color_all_curves_blue()
+        self.unhighlight_curves()
         
-        self.color_all_surfaces_green()
+        self.unhighlight_surfaces()
 
         self.setup_3d_plot()
 
@@ -360,11 +467,11 @@ class MainWindow(wdg.QDialog):
         if self.surface_dialogue_displayed == True: 
             return
 
-        self.color_all_sketchplanes_blue()
+        self.unhighlight_sketch_planes()
 
-        self.color_all_curves_blue()
+        self.unhighlight_curves()
 
-        self.color_all_surfaces_green()
+        self.unhighlight_surfaces()
         
         self.setup_3d_plot()
 
@@ -398,21 +505,12 @@ class MainWindow(wdg.QDialog):
         curveLabel2 = wdg.QLabel("Select Curve")
         curveList2 = wdg.QListWidget()
 
-        curveLabel3 = wdg.QLabel("Select Curve")
-        curveList3 = wdg.QListWidget()
-
-        curveLabel4 = wdg.QLabel("Select Curve")
-        curveList4 = wdg.QListWidget()
-
-        curveLabel5 = wdg.QLabel("Select Curve")
-        curveList5 = wdg.QListWidget()
-
         curveList1.setSelectionMode(wdg.QAbstractItemView.SelectionMode.ExtendedSelection)
         curveList2.setSelectionMode(wdg.QAbstractItemView.SelectionMode.ExtendedSelection)
 
         cylindricalButton.clicked.connect(lambda: self.cylindricalCalled(layout, depthLabel, depthField, curveLabel1, curveList1))
         ruledButton.clicked.connect(lambda: self.ruledCalled(layout, curveLabel1, curveList1, curveLabel2, curveList2))
-        loftButton.clicked.connect(lambda: self.loftCalled(curveLabel1, curveLabel2, curveLabel3, curveLabel4, curveLabel5, curveList1, curveList2, curveList3, curveList4, curveList5))
+        loftButton.clicked.connect(lambda: self.loftCalled())
         sweptButton.clicked.connect(lambda: self.sweptCalled(layout, curveLabel1, curveList1, curveLabel2, curveList2))
 
         deleteCurvesButton.clicked.connect(lambda: self.deleteCurvesCalled(layout, curveLabel1, curveList1))
@@ -443,10 +541,10 @@ class MainWindow(wdg.QDialog):
 
 
     def deleteCurvesCalled(self, layout, curveLabel1, curveList1):
-        names = [curve.name for curve in self.featureTree.curves]
+        curves = self.featureTree.curves
 
         curveLabel1.setText("select curves for deletion")
-        curveList1.addItems(names)
+        self.fill_list(curveList1, curves)
 
         curveList1.setSelectionMode(wdg.QAbstractItemView.SelectionMode.ExtendedSelection)
 
@@ -466,270 +564,111 @@ class MainWindow(wdg.QDialog):
         if len(selectedItems) == 0:
             return
         
-        forDeletion = []
-        for curve in self.featureTree.curves:
-            for item in selectedItems:
-                if curve.name == item.text():
-                    forDeletion.append(curve)
+        self.history.checkpoint('delete curves')
 
-        self.featureTree.curves = list(set(self.featureTree.curves) - set(forDeletion))
+        for curve in self.selected(selectedItems, self.featureTree.curve):
+            self.featureTree.remove(curve)
 
         self.setup_3d_plot()
 
         self.draw_features()
 
 
-    def loftCalled(self, curveLabel1, curveLabel2, curveLabel3, curveLabel4, curveLabel5, curveList1, curveList2, curveList3, curveList4, curveList5):
+    def loftCalled(self):
         self.clear_option_layout()
         
         self.surfaceContainer = wdg.QWidget()
         layout = wdg.QGridLayout(self.surfaceContainer)
 
+        # a loft takes any number of sections, up to every curve in the tree
         numberOfCurvesLabel = wdg.QLabel("Select number of curves:")
         numberOfCurvesDropdown = wdg.QComboBox()
-        numberOfCurvesDropdown.addItems(['2', '3', '4', '5'])
+        numberOfCurvesDropdown.addItems([str(count) for count in range(2, max(len(self.featureTree.curves), 2) + 1)])
         acceptNumberOfCurvesButton = wdg.QPushButton("Accept")
 
         layout.addWidget(numberOfCurvesLabel, 1, 0, 1, 1)
         layout.addWidget(numberOfCurvesDropdown, 1, 1, 1, 1)
         layout.addWidget(acceptNumberOfCurvesButton, 1, 2, 1, 1)
 
-        self.color_all_sketchplanes_blue()
+        self.unhighlight_sketch_planes()
 
-        self.color_all_curves_blue()
+        self.unhighlight_curves()
 
-        self.color_all_surfaces_green()
+        self.unhighlight_surfaces()
 
         self.setup_3d_plot()
 
-        acceptNumberOfCurvesButton.clicked.connect(lambda: self.loftCurveNumberAccepted(numberOfCurvesDropdown, curveLabel1, curveLabel2, curveLabel3, curveLabel4, curveLabel5, curveList1, curveList2, curveList3, curveList4, curveList5))
+        acceptNumberOfCurvesButton.clicked.connect(lambda: self.loftCurveNumberAccepted(numberOfCurvesDropdown))
 
         self.optionLayout.addWidget(self.surfaceContainer)
 
     
-    def loftCurveNumberAccepted(self, numberOfCurvesDropdown, curveLabel1, curveLabel2, curveLabel3, curveLabel4, curveLabel5, curveList1, curveList2, curveList3, curveList4, curveList5):        
+    def loftCurveNumberAccepted(self, numberOfCurvesDropdown):        
         numberOfCurves = int(numberOfCurvesDropdown.currentText())
 
         self.clear_option_layout()
         self.surfaceContainer = wdg.QWidget()
         layout = wdg.QGridLayout(self.surfaceContainer)
 
-        match numberOfCurves:
-            case 2:
-                curveList1.setSelectionMode(wdg.QAbstractItemView.SelectionMode.SingleSelection)
-                curveList2.setSelectionMode(wdg.QAbstractItemView.SelectionMode.SingleSelection)
-                layout.addWidget(curveLabel1, 0, 0, 1, 3)
-                layout.addWidget(curveList1, 1, 0, 1, 3)
-                layout.addWidget(curveLabel2, 2, 0, 1, 3)
-                layout.addWidget(curveList2, 3, 0, 1, 3)
-                
-                names = [curve.name for curve in self.featureTree.curves]
-
-                curveList1.addItems(names)
-                curveList2.addItems(names)
-
-            case 3:
-                curveList1.setSelectionMode(wdg.QAbstractItemView.SelectionMode.SingleSelection)
-                curveList2.setSelectionMode(wdg.QAbstractItemView.SelectionMode.SingleSelection)
-                curveList3.setSelectionMode(wdg.QAbstractItemView.SelectionMode.SingleSelection)
-                layout.addWidget(curveLabel1, 0, 0, 1, 3)
-                layout.addWidget(curveList1, 1, 0, 1, 3)
-                layout.addWidget(curveLabel2, 2, 0, 1, 3)
-                layout.addWidget(curveList2, 3, 0, 1, 3)
-                layout.addWidget(curveLabel3, 4, 0, 1, 3)
-                layout.addWidget(curveList3, 5, 0, 1, 3)
-
-                names = [curve.name for curve in self.featureTree.curves]
-
-                curveList1.addItems(names)
-                curveList2.addItems(names)
-                curveList3.addItems(names)
-
-            case 4:
-                curveList1.setSelectionMode(wdg.QAbstractItemView.SelectionMode.SingleSelection)
-                curveList2.setSelectionMode(wdg.QAbstractItemView.SelectionMode.SingleSelection)
-                curveList3.setSelectionMode(wdg.QAbstractItemView.SelectionMode.SingleSelection)
-                curveList4.setSelectionMode(wdg.QAbstractItemView.SelectionMode.SingleSelection)
-                layout.addWidget(curveLabel1, 0, 0, 1, 3)
-                layout.addWidget(curveList1, 1, 0, 1, 3)
-                layout.addWidget(curveLabel2, 2, 0, 1, 3)
-                layout.addWidget(curveList2, 3, 0, 1, 3)
-                layout.addWidget(curveLabel3, 4, 0, 1, 3)
-                layout.addWidget(curveList3, 5, 0, 1, 3)
-                layout.addWidget(curveLabel4, 6, 0, 1, 3)
-                layout.addWidget(curveList4, 7, 0, 1, 3)
-
-                names = [curve.name for curve in self.featureTree.curves]
-
-                curveList1.addItems(names)
-                curveList2.addItems(names)
-                curveList3.addItems(names)
-                curveList4.addItems(names)
-
-            case 5:
-                curveList1.setSelectionMode(wdg.QAbstractItemView.SelectionMode.SingleSelection)
-                curveList2.setSelectionMode(wdg.QAbstractItemView.SelectionMode.SingleSelection)
-                curveList3.setSelectionMode(wdg.QAbstractItemView.SelectionMode.SingleSelection)
-                curveList4.setSelectionMode(wdg.QAbstractItemView.SelectionMode.SingleSelection)
-                curveList5.setSelectionMode(wdg.QAbstractItemView.SelectionMode.SingleSelection)
-                layout.addWidget(curveLabel1, 0, 0, 1, 3)
-                layout.addWidget(curveList1, 1, 0, 1, 3)
-                layout.addWidget(curveLabel2, 2, 0, 1, 3)
-                layout.addWidget(curveList2, 3, 0, 1, 3)
-                layout.addWidget(curveLabel3, 4, 0, 1, 3)
-                layout.addWidget(curveList3, 5, 0, 1, 3)
-                layout.addWidget(curveLabel4, 6, 0, 1, 3)
-                layout.addWidget(curveList4, 7, 0, 1, 3)
-                layout.addWidget(curveLabel5, 8, 0, 1, 3)
-                layout.addWidget(curveList5, 9, 0, 1, 3)
-
-                names = [curve.name for curve in self.featureTree.curves]
-
-                curveList1.addItems(names)
-                curveList2.addItems(names)
-                curveList3.addItems(names)
-                curveList4.addItems(names)
-                curveList5.addItems(names)
+        curves = self.featureTree.curves
 
-        cancelButton = wdg.QPushButton("Cancel")
-        previewButton = wdg.QPushButton("Preview")
-        acceptButton = wdg.QPushButton("Accept")
+        # one single-selection list per section, in loft order
+        curveLists = []
 
-        layout.addWidget(cancelButton, 10, 0, 1, 1)
-        layout.addWidget(previewButton, 10, 1, 1, 1)
-        layout.addWidget(acceptButton, 10, 2, 1, 1)
+        for k in range(numberOfCurves):
+            curveLabel = wdg.QLabel(f"Select Curve {k + 1}")
+            curveList = wdg.QListWidget()
 
-        # callbacks
-        curveList1.itemPressed.connect(lambda: self.loft_curves_highlighted(numberOfCurves, curveList1.selectedItems(), curveList2.selectedItems(), curveList3.selectedItems(), curveList4.selectedItems(), curveList5.selectedItems()))
-        curveList2.itemPressed.connect(lambda: self.loft_curves_highlighted(numberOfCurves, curveList1.selectedItems(), curveList2.selectedItems(), curveList3.selectedItems(), curveList4.selectedItems(), curveList5.selectedItems()))
-        curveList3.itemPressed.connect(lambda: self.loft_curves_highlighted(numberOfCurves, curveList1.selectedItems(), curveList2.selectedItems(), curveList3.selectedItems(), curveList4.selectedItems(), curveList5.selectedItems()))
-        curveList4.itemPressed.connect(lambda: self.loft_curves_highlighted(numberOfCurves, curveList1.selectedItems(), curveList2.selectedItems(), curveList3.selectedItems(), curveList4.selectedItems(), curveList5.selectedItems()))
-        curveList5.itemPressed.connect(lambda: self.loft_curves_highlighted(numberOfCurves, curveList1.selectedItems(), curveList2.selectedItems(), curveList3.selectedItems(), curveList4.selectedItems(), curveList5.selectedItems()))
+            curveList.setSelectionMode(wdg.QAbstractItemView.SelectionMode.SingleSelection)
 
-        cancelButton.clicked.connect(lambda: self.escape_container(self.surfaceContainer))
-        previewButton.clicked.connect(lambda: self.preview_loft(numberOfCurves, curveLabel1, curveLabel2, curveLabel3, curveLabel4, curveLabel5, curveList1, curveList2, curveList3, curveList4, curveList5))
-        acceptButton.clicked.connect(lambda: self.accept_loft(numberOfCurves, curveLabel1, curveLabel2, curveLabel3, curveLabel4, curveLabel5, curveList1, curveList2, curveList3, curveList4, curveList5))
+            layout.addWidget(curveLabel, 2 * k, 0, 1, 3)
+            layout.addWidget(curveList, 2 * k + 1, 0, 1, 3)
 
-        self.optionLayout.addWidget(self.surfaceContainer)
+            self.fill_list(curveList, curves)
 
+            curveLists.append(curveList)
 
-    def preview_loft(self, numberOfCurves, curveLabel1, curveLabel2, curveLabel3, curveLabel4, curveLabel5, curveList1, curveList2, curveList3, curveList4, curveList5):
-        
-        selectedCurves = []
-        match numberOfCurves:
-            case 2:
-                if len(curveList1.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                if len(curveList2.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList1.selectedItems()[0].text():
-                        selectedCurves.append(curve)
-
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList2.selectedItems()[0].text():
-                        selectedCurves.append(curve)
-            case 3:
-                if len(curveList1.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                
-                if len(curveList2.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                
-                if len(curveList3.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList1.selectedItems()[0].text():
-                        selectedCurves.append(curve)
+        cancelButton = wdg.QPushButton("Cancel")
+        previewButton = wdg.QPushButton("Preview")
+        acceptButton = wdg.QPushButton("Accept")
 
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList2.selectedItems()[0].text():
-                        selectedCurves.append(curve)
+        layout.addWidget(cancelButton, 2 * numberOfCurves, 0, 1, 1)
+        layout.addWidget(previewButton, 2 * numberOfCurves, 1, 1, 1)
+        layout.addWidget(acceptButton, 2 * numberOfCurves, 2, 1, 1)
 
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList3.selectedItems()[0].text():
-                        selectedCurves.append(curve)
+        # callbacks
+        for curveList in curveLists:
+            curveList.itemPressed.connect(lambda: self.loft_curves_highlighted(curveLists))
 
-            case 4:
-                if len(curveList1.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                
-                if len(curveList2.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                
-                if len(curveList3.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                
-                if len(curveList4.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList1.selectedItems()[0].text():
-                        selectedCurves.append(curve)
+        cancelButton.clicked.connect(lambda: self.escape_container(self.surfaceContainer))
+        previewButton.clicked.connect(lambda: self.preview_loft(curveLists))
+        acceptButton.clicked.connect(lambda: self.accept_loft(curveLists))
 
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList2.selectedItems()[0].text():
-                        selectedCurves.append(curve)
+        # many sections make the dialogue taller than the panel
+        scrollArea = wdg.QScrollArea()
+        scrollArea.setWidgetResizable(True)
+        scrollArea.setWidget(self.surfaceContainer)
 
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList3.selectedItems()[0].text():
-                        selectedCurves.append(curve)
+        # escaping the dialogue deletes the scroll area and the lists with it
+        self.surfaceContainer = scrollArea
 
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList4.selectedItems()[0].text():
-                        selectedCurves.append(curve)
+        self.optionLayout.addWidget(self.surfaceContainer)
 
-            case 5:
-                if len(curveList1.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                
-                if len(curveList2.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                
-                if len(curveList3.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                
-                if len(curveList4.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                
-                if len(curveList5.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList1.selectedItems()[0].text():
-                        selectedCurves.append(curve)
 
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList2.selectedItems()[0].text():
-                        selectedCurves.append(curve)
+    def loft_selection(self, curveLists):
+        # the selected curve of every list, None while any list has no selection
+        if any(len(curveList.selectedItems()) == 0 for curveList in curveLists):
+            log.warning('no curves')
+            return None
 
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList3.selectedItems()[0].text():
-                        selectedCurves.append(curve)
+        return [self.featureTree.curve(curveList.selectedItems()[0].data(ID_ROLE)) for curveList in curveLists]
 
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList4.selectedItems()[0].text():
-                        selectedCurves.append(curve)
 
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList5.selectedItems()[0].text():
-                        selectedCurves.append(curve)
+    def preview_loft(self, curveLists):
+        selectedCurves = self.loft_selection(curveLists)
+
+        if selectedCurves is None:
+            return
 
         loftedSurface = LoftedSurface(f"loft{self.featureTree.surfaceCount}", selectedCurves, 40)
 
@@ -737,131 +676,20 @@ class MainWindow(wdg.QDialog):
 
         self.setup_3d_plot()
 
-        for trace in loftedSurfaceTraces:
-            self.sc.axes.plot(trace[:, 0], trace[:, 1], trace[:, 2], color=loftedSurface.color)
+        self.renderer.draw_traces(loftedSurfaceTraces, color=loftedSurface.color)
 
         self.sc.figure.canvas.draw()
     
 
-    def accept_loft(self, numberOfCurves, curveLabel1, curveLabel2, curveLabel3, curveLabel4, curveLabel5, curveList1, curveList2, curveList3, curveList4, curveList5):
-        selectedCurves = []
-        match numberOfCurves:
-            case 2:
-                if len(curveList1.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                if len(curveList2.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList1.selectedItems()[0].text():
-                        selectedCurves.append(curve)
-
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList2.selectedItems()[0].text():
-                        selectedCurves.append(curve)
-            case 3:
-                if len(curveList1.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                
-                if len(curveList2.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                
-                if len(curveList3.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList1.selectedItems()[0].text():
-                        selectedCurves.append(curve)
-
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList2.selectedItems()[0].text():
-                        selectedCurves.append(curve)
-
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList3.selectedItems()[0].text():
-                        selectedCurves.append(curve)
-
-            case 4:
-                if len(curveList1.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                
-                if len(curveList2.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                
-                if len(curveList3.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                
-                if len(curveList4.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList1.selectedItems()[0].text():
-                        selectedCurves.append(curve)
-
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList2.selectedItems()[0].text():
-                        selectedCurves.append(curve)
-
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList3.selectedItems()[0].text():
-                        selectedCurves.append(curve)
-
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList4.selectedItems()[0].text():
-                        selectedCurves.append(curve)
-
-            case 5:
-                if len(curveList1.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                
-                if len(curveList2.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                
-                if len(curveList3.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                
-                if len(curveList4.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                
-                if len(curveList5.selectedItems()) == 0:
-                    print('no curves')
-                    return
-                
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList1.selectedItems()[0].text():
-                        selectedCurves.append(curve)
-
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList2.selectedItems()[0].text():
-                        selectedCurves.append(curve)
-
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList3.selectedItems()[0].text():
-                        selectedCurves.append(curve)
-
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList4.selectedItems()[0].text():
-                        selectedCurves.append(curve)
+    def accept_loft(self, curveLists):
+        selectedCurves = self.loft_selection(curveLists)
 
-                for curve in self.featureTree.curves:
-                    if curve.name == curveList5.selectedItems()[0].text():
-                        selectedCurves.append(curve)
+        if selectedCurves is None:
+            return
 
-        loftedSurface = LoftedSurface(f"loft{self.featureTree.surfaceCount}", selectedCurves, 40)
+        loftedSurface = self.featureTree.construct(LoftedSurface, f"loft{self.featureTree.surfaceCount}", selectedCurves, 40)
 
+        self.history.checkpoint('loft')
         self.featureTree.add_surface(loftedSurface)
 
         self.clear_mpl_container()
@@ -870,95 +698,102 @@ class MainWindow(wdg.QDialog):
 
 
     def preview_surface(self, curveList1, curveList2, extrusion_depth, surface_type):
-        print(curveList1.selectedItems())
-        print(curveList2.selectedItems())
+        log.debug("%s", curveList1.selectedItems())
+        log.debug("%s", curveList2.selectedItems())
 
         match surface_type:
             case 'cylindrical':
                 if len(curveList1.selectedItems()) == 0:
-                    print('no curves')
+                    log.warning('no curves')
                     return
                 
-                print(curveList1.selectedItems()[0].text())
+                log.debug("%s", curveList1.selectedItems()[0].text())
             
-                selectedCurves = []
-
-                for curve in self.featureTree.curves:
-                    for item in curveList1.selectedItems():
-                        if curve.name == item.text():
-                            selectedCurves.append(curve)
+                selectedCurves = self.selected(curveList1.selectedItems(), self.featureTree.curve)
 
                 if selectedCurves is None:
-                    print('no selected curve')
+                    log.warning('no selected curve')
                     return
                 
                 if extrusion_depth is None or extrusion_depth == '':
-                    print('no extrusion depth')
+                    log.warning('no extrusion depth')
                     return
 
-                surfaces = []
+                surfaces = {}
                 for curve in selectedCurves:
-                    surface = CylindricalSurface(f"Surface{self.featureTree.surfaceCount}", curve, 10)
+                    # reuse the preview surface so a new depth only redoes the extrusion broadcast
+                    if curve not in self.extrusionPreviews:
+                        self.extrusionPreviews[curve] = CylindricalSurface(f"Surface{self.featureTree.surfaceCount}", curve, 10)
+
+                    surface = self.extrusionPreviews[curve]
                     surface.scale_q(float(extrusion_depth))
 
-                    surfaces.append(surface)
+                    surfaces[curve] = surface
 
-                print("inside preview surface")
+                log.debug("inside preview surface")
 
-                print(float(extrusion_depth))
+                log.debug("%s", float(extrusion_depth))
 
-                self.setup_3d_plot()
+                # the canvas and the features on it stay, only the preview artists are replaced or given new segments
+                for curve, collection in list(self.extrusionArtists.items()):
+                    drawn = collection in self.sc.axes.collections
 
-                surface_traces_list = []
-                for surface in surfaces:
-                    surface_traces = surface.generate_traces()
-                    surface_traces_list.append(surface_traces)
+                    if drawn and curve not in surfaces:
+                        collection.remove()
 
-                for surface_traces in surface_traces_list:
-                    for trace in surface_traces:
-                        self.sc.axes.plot(trace[:, 0], trace[:, 1], trace[:, 2], color=surface.color, alpha=0.4)
+                    if not drawn or curve not in surfaces:
+                        del self.extrusionArtists[curve]
 
-                self.sc.figure.canvas.draw()
+                dtype = current_display_dtype()
+
+                for curve, surface in surfaces.items():
+                    surface_traces = surface.generate_traces(dtype)
+
+                    if curve in self.extrusionArtists:
+                        self.renderer.update_traces(self.extrusionArtists[curve], surface_traces)
+
+                        continue
+
+                    collection = self.renderer.draw_traces(surface_traces, color=surface.color, alpha=0.4)
+
+                    if collection is not None:
+                        self.extrusionArtists[curve] = collection
+
+                self.sc.figure.canvas.draw_idle()
             case 'ruled':
                 selectedCurves1 = []
                 selectedCurves2 = []
                 if len(curveList1.selectedItems()) == 0:
-                    print('no first curves')
+                    log.warning('no first curves')
                     return
                 
                 else:
-                    print(curveList1.selectedItems()[0].text())
+                    log.debug("%s", curveList1.selectedItems()[0].text())
                 
                 if len(curveList2.selectedItems()) == 0:
-                    print('no second curves')
+                    log.warning('no second curves')
                     return
                 
                 else:
-                    print(curveList2.selectedItems()[0].text)
+                    log.debug("%s", curveList2.selectedItems()[0].text())
                 
-                for curve in self.featureTree.curves:
-                    for item in curveList1.selectedItems():
-                        if curve.name == item.text():
-                            selectedCurves1.append(curve)
-
-                    for item in curveList2.selectedItems():
-                        if curve.name == item.text():
-                            selectedCurves2.append(curve)
+                selectedCurves1 = self.selected(curveList1.selectedItems(), self.featureTree.curve)
+                selectedCurves2 = self.selected(curveList2.selectedItems(), self.featureTree.curve)
 
                 if selectedCurves1 is None:
-                    print('no selected first curve')
+                    log.warning('no selected first curve')
                     return
                 
                 if selectedCurves2 is None:
-                    print('no selected second curve')
+                    log.warning('no selected second curve')
                     return
 
                 if selectedCurves1 == selectedCurves2:
-                    print('cannot select the same curve')
+                    log.warning('cannot select the same curve')
                     return
                 
                 if len(selectedCurves1) != len(selectedCurves2):
-                    print("Same amount of curves not selected")
+                    log.warning("Same amount of curves not selected")
                     return
                 
                 surface_traces_list = []
@@ -971,8 +806,7 @@ class MainWindow(wdg.QDialog):
                 self.setup_3d_plot()
 
                 for surf_traces in surface_traces_list:
-                    for trace in surf_traces:
-                        self.sc.axes.plot(trace[:, 0], trace[:, 1], trace[:, 2], color=mySurface.color)
+                    self.renderer.draw_traces(surf_traces, color=mySurface.color)
 
                 self.sc.figure.canvas.draw()
 
@@ -980,34 +814,31 @@ class MainWindow(wdg.QDialog):
                 selectedCurves1 = []
                 selectedCurves2 = []
                 if len(curveList1.selectedItems()) == 0:
-                    print('no first curves')
+                    log.warning('no first curves')
                     return
                 
                 else:
-                    print(curveList1.selectedItems()[0].text())
+                    log.debug("%s", curveList1.selectedItems()[0].text())
                 
                 if len(curveList2.selectedItems()) == 0:
-                    print('no path curves')
+                    log.warning('no path curves')
                     return
                 
                 else:
-                    print(curveList2.selectedItems()[0].text)
+                    log.debug("%s", curveList2.selectedItems()[0].text())
                 
-                for curve in self.featureTree.curves:
-                    for item in curveList1.selectedItems():
-                        if curve.name == item.text():
-                            selectedCurves1.append(curve)
+                selectedCurves1 = self.selected(curveList1.selectedItems(), self.featureTree.curve)
+
+                pathCurves = self.selected(curveList2.selectedItems(), self.featureTree.curve)
 
-                    for item in curveList2.selectedItems():
-                        if curve.name == item.text():
-                            selectedPathCurve = curve
+                selectedPathCurve = pathCurves[-1] if pathCurves else None
 
                 if selectedCurves1 is None:
-                    print('no selected first curve')
+                    log.warning('no selected first curve')
                     return
                 
                 if selectedPathCurve is None:
-                    print('no selected path curve')
+                    log.warning('no selected path curve')
                     return
                 
                 surface_traces_list = []
@@ -1020,8 +851,7 @@ class MainWindow(wdg.QDialog):
                 self.setup_3d_plot()
 
                 for surf_traces in surface_traces_list:
-                    for trace in surf_traces:
-                        self.sc.axes.plot(trace[:, 0], trace[:, 1], trace[:, 2], color=mySurface.color)
+                    self.renderer.draw_traces(surf_traces, color=mySurface.color)
 
                 self.sc.figure.canvas.draw()
 
@@ -1033,14 +863,9 @@ class MainWindow(wdg.QDialog):
                 if len(curveList1.selectedItems()) == 0:
                     return
                 
-                print(curveList1.selectedItems()[0].text())
+                log.debug("%s", curveList1.selectedItems()[0].text())
             
-                selectedCurves = []
-
-                for curve in self.featureTree.curves:
-                    for item in curveList1.selectedItems():
-                        if curve.name == item.text():
-                            selectedCurves.append(curve)
+                selectedCurves = self.selected(curveList1.selectedItems(), self.featureTree.curve)
 
                 if selectedCurves is None:
                     return
@@ -1048,12 +873,14 @@ class MainWindow(wdg.QDialog):
                 if extrusion_depth is None or extrusion_depth == '':
                     return
 
+                self.history.checkpoint('extrude')
+
                 for curve in selectedCurves:
-                    surface = CylindricalSurface(f"Surface{self.featureTree.surfaceCount}", curve, 10)
+                    surface = self.featureTree.construct(CylindricalSurface, f"Surface{self.featureTree.surfaceCount}", curve, 10)
                     surface.scale_q(float(extrusion_depth))
                     self.featureTree.add_surface(surface)
 
-                print(float(extrusion_depth))
+                log.debug("%s", float(extrusion_depth))
 
                 self.clear_mpl_container()
 
@@ -1062,46 +889,42 @@ class MainWindow(wdg.QDialog):
                 selectedCurves1 = []
                 selectedCurves2 = []
                 if len(curveList1.selectedItems()) == 0:
-                    print('no first curves')
+                    log.warning('no first curves')
                     return
                 
                 else:
-                    print(curveList1.selectedItems()[0].text())
+                    log.debug("%s", curveList1.selectedItems()[0].text())
                 
                 if len(curveList2.selectedItems()) == 0:
-                    print('no second curves')
+                    log.warning('no second curves')
                     return
                 
                 else:
-                    print(curveList2.selectedItems()[0].text)
+                    log.debug("%s", curveList2.selectedItems()[0].text())
                 
-                for curve in self.featureTree.curves:
-                    for item in curveList1.selectedItems():
-                        if curve.name == item.text():
-                            selectedCurves1.append(curve)
-
-                    for item in curveList2.selectedItems():
-                        if curve.name == item.text():
-                            selectedCurves2.append(curve)
+                selectedCurves1 = self.selected(curveList1.selectedItems(), self.featureTree.curve)
+                selectedCurves2 = self.selected(curveList2.selectedItems(), self.featureTree.curve)
 
                 if selectedCurves1 is None:
-                    print('no selected first curve')
+                    log.warning('no selected first curve')
                     return
                 
                 if selectedCurves2 is None:
-                    print('no selected second curve')
+                    log.warning('no selected second curve')
                     return
 
                 if selectedCurves1 == selectedCurves2:
-                    print('cannot select the same curve')
+                    log.warning('cannot select the same curve')
                     return
                 
                 if len(selectedCurves1) != len(selectedCurves2):
-                    print("Same amount of curves not selected")
+                    log.warning("Same amount of curves not selected")
                     return
 
+                self.history.checkpoint('ruled surface')
+
                 for i in range(len(selectedCurves1)):
-                    mySurface = RuledSurface(f"Surface{self.featureTree.surfaceCount}", selectedCurves1[i], selectedCurves2[i], 10)
+                    mySurface = self.featureTree.construct(RuledSurface, f"Surface{self.featureTree.surfaceCount}", selectedCurves1[i], selectedCurves2[i], 10)
                     self.featureTree.add_surface(mySurface)
 
                 self.clear_mpl_container()
@@ -1112,38 +935,37 @@ class MainWindow(wdg.QDialog):
                 selectedCurves1 = []
                 selectedCurves2 = []
                 if len(curveList1.selectedItems()) == 0:
-                    print('no first curves')
+                    log.warning('no first curves')
                     return
                 
                 else:
-                    print(curveList1.selectedItems()[0].text())
+                    log.debug("%s", curveList1.selectedItems()[0].text())
                 
                 if len(curveList2.selectedItems()) == 0:
-                    print('no path curves')
+                    log.warning('no path curves')
                     return
                 
                 else:
-                    print(curveList2.selectedItems()[0].text)
+                    log.debug("%s", curveList2.selectedItems()[0].text())
                 
-                for curve in self.featureTree.curves:
-                    for item in curveList1.selectedItems():
-                        if curve.name == item.text():
-                            selectedCurves1.append(curve)
+                selectedCurves1 = self.selected(curveList1.selectedItems(), self.featureTree.curve)
 
-                    for item in curveList2.selectedItems():
-                        if curve.name == item.text():
-                            selectedPathCurve = curve
+                pathCurves = self.selected(curveList2.selectedItems(), self.featureTree.curve)
+
+                selectedPathCurve = pathCurves[-1] if pathCurves else None
 
                 if selectedCurves1 is None:
-                    print('no selected first curve')
+                    log.warning('no selected first curve')
                     return
                 
                 if selectedPathCurve is None:
-                    print('no selected path curve')
+                    log.warning('no selected path curve')
                     return
 
+                self.history.checkpoint('swept surface')
+
                 for i in range(len(selectedCurves1)):
-                    mySurface = SweptSurface(f"Surface{self.featureTree.surfaceCount}", selectedCurves1[i], selectedPathCurve, self.sc.axes, False, 10)
+                    mySurface = self.featureTree.construct(SweptSurface, f"Surface{self.featureTree.surfaceCount}", selectedCurves1[i], selectedPathCurve, self.sc.axes, False, 10)
                     self.featureTree.add_surface(mySurface)
 
                 self.clear_mpl_container()
@@ -1157,44 +979,62 @@ class MainWindow(wdg.QDialog):
         layout.addWidget(depthLabel, 8, 1)
         layout.addWidget(depthField, 8, 2)
 
-        self.color_all_sketchplanes_blue()
+        self.unhighlight_sketch_planes()
 
-        self.color_all_curves_blue()
+        self.unhighlight_curves()
 
-        self.color_all_surfaces_green()
+        self.unhighlight_surfaces()
 
         self.setup_3d_plot()
 
-        names = [curve.name for curve in self.featureTree.curves]
+        curves = self.featureTree.curves
 
-        curveList.addItems(names)
+        self.fill_list(curveList, curves)
 
         layout.addWidget(curveLabel, 1, 0, 1, 2)
         layout.addWidget(curveList, 2, 0, 1, 4)
 
         # callbacks
         curveList.itemPressed.connect(lambda: self.cylindrical_curves_highlighted(curveList.selectedItems()))
+        depthField.textEdited.connect(lambda text: self.extrusion_depth_edited(curveList, text))
+
+        self.extrusionPreviews = {}
+        self.extrusionArtists = {}
 
         self.surface_type = 'cylindrical'
 
+
+    def extrusion_depth_edited(self, curveList, extrusion_depth):
+        try:
+            float(extrusion_depth)
+        except ValueError:
+            return
+
+        self.pendingExtrusion = (curveList, extrusion_depth)
+
+        self.extrusionTimer.start()
+
+
+    def preview_extrusion(self):
+        # the dialogue may have closed while the timer ran
+        if self.pendingExtrusion is None or not self.surface_dialogue_displayed or self.surface_type != 'cylindrical':
+            return
+
+        curveList, extrusion_depth = self.pendingExtrusion
+
+        self.pendingExtrusion = None
+
+        self.preview_surface(curveList, curveList, extrusion_depth, 'cylindrical')
+
     
     def cylindrical_curves_highlighted(self, selectedItems):
         if len(selectedItems) == 0:
             return
         
-        orangeCurves = []
-        for curve in self.featureTree.curves:
-            for item in selectedItems:
-                if curve.name == item.text():
-                    orangeCurves.append(curve)
+        self.unhighlight_curves()
 
-        blueCurves = list(set(self.featureTree.curves) - set(orangeCurves))
-            
-        for curve in orangeCurves:
-            curve.color = 'orange'
-
-        for curve in blueCurves:
-            curve.color = 'blue'
+        for curve in self.selected(selectedItems, self.featureTree.curve):
+            self.highlight(curve, 'orange')
 
         self.setup_3d_plot()
 
@@ -1204,10 +1044,10 @@ class MainWindow(wdg.QDialog):
 
         curveLabel2.setText("Select Second Curve")
 
-        names = [curve.name for curve in self.featureTree.curves]
+        curves = self.featureTree.curves
 
-        curveList1.addItems(names)
-        curveList2.addItems(names)
+        self.fill_list(curveList1, curves)
+        self.fill_list(curveList2, curves)
 
         layout.addWidget(curveLabel1, 1, 0, 1, 4)
         layout.addWidget(curveList1, 2, 0, 1, 4)
@@ -1225,129 +1065,25 @@ class MainWindow(wdg.QDialog):
         if len(selectedItems1) == 0 and len(selectedItems2):
             return
         
-        orangeCurves = []
-        for curve in self.featureTree.curves:
-            for item in selectedItems1:
-                if curve.name == item.text():
-                    orangeCurves.append(curve)
+        self.unhighlight_curves()
 
-        greenCurves = []
-        for curve in self.featureTree.curves:
-            for item in selectedItems2:
-                if curve.name == item.text():
-                    greenCurves.append(curve)
-
-        blueCurves = list(set(self.featureTree.curves) - set(orangeCurves) - set(greenCurves))
-            
-        for curve in orangeCurves:
-            curve.color = 'orange'
+        for curve in self.selected(selectedItems1, self.featureTree.curve):
+            self.highlight(curve, 'orange')
 
-        for curve in greenCurves:
-            curve.color = 'green'
-
-        for curve in blueCurves:
-            curve.color = 'blue'
+        for curve in self.selected(selectedItems2, self.featureTree.curve):
+            self.highlight(curve, 'green')
 
         self.setup_3d_plot()
 
     
-    def loft_curves_highlighted(self, numberOfCurves, selectedItems1, selectedItems2, selectedItems3, selectedItems4, selectedItems5):
-        
-        print(selectedItems1)
-        print(selectedItems2)
-
-        orangeCurves = []
-        greenCurves = []
-        purpleCurves = []
-        yellowCurves = []
-        redCurves = []
-        match numberOfCurves:
-            case 2:
-                if len(selectedItems1) != 0:
-                    for curve in self.featureTree.curves:
-                        if curve.name == selectedItems1[0].text():
-                            orangeCurves.append(curve)
-                if len(selectedItems2) != 0:
-                    for curve in self.featureTree.curves:
-                        if curve.name == selectedItems2[0].text():
-                            greenCurves.append(curve)
-            case 3:
-                if len(selectedItems1) != 0:
-                    for curve in self.featureTree.curves:
-                        if curve.name == selectedItems1[0].text():
-                            orangeCurves.append(curve)
-                if len(selectedItems2) != 0:
-                    for curve in self.featureTree.curves:
-                        if curve.name == selectedItems2[0].text():
-                            greenCurves.append(curve)
-
-                if len(selectedItems3) != 0:
-                    for curve in self.featureTree.curves:
-                        if curve.name == selectedItems3[0].text():
-                            purpleCurves.append(curve)
-            case 4:
-                if len(selectedItems1) != 0:
-                    for curve in self.featureTree.curves:
-                        if curve.name == selectedItems1[0].text():
-                            orangeCurves.append(curve)
-                if len(selectedItems2) != 0:
-                    for curve in self.featureTree.curves:
-                        if curve.name == selectedItems2[0].text():
-                            greenCurves.append(curve)
-
-                if len(selectedItems3) != 0:
-                    for curve in self.featureTree.curves:
-                        if curve.name == selectedItems3[0].text():
-                            purpleCurves.append(curve)
-
-                if len(selectedItems4):
-                    for curve in self.featureTree.curves:
-                        if curve.name == selectedItems4[0].text():
-                            yellowCurves.append(curve)
-            case 5:
-                if len(selectedItems1) != 0:
-                    for curve in self.featureTree.curves:
-                        if curve.name == selectedItems1[0].text():
-                            orangeCurves.append(curve)
-                if len(selectedItems2) != 0:
-                    for curve in self.featureTree.curves:
-                        if curve.name == selectedItems2[0].text():
-                            greenCurves.append(curve)
-
-                if len(selectedItems3) != 0:
-                    for curve in self.featureTree.curves:
-                        if curve.name == selectedItems3[0].text():
-                            purpleCurves.append(curve)
-
-                if len(selectedItems4):
-                    for curve in self.featureTree.curves:
-                        if curve.name == selectedItems4[0].text():
-                            yellowCurves.append(curve)
-
-                if len(selectedItems5) != 0:
-                    for curve in self.featureTree.curves:
-                        if curve.name == selectedItems5[0].text():
-                            redCurves.append(curve)
-
-        blueCurves = list(set(self.featureTree.curves) - set(orangeCurves) - set(greenCurves) - set(purpleCurves) - set(yellowCurves) - set(redCurves))
-            
-        for curve in orangeCurves:
-            curve.color = 'orange'
-
-        for curve in greenCurves:
-            curve.color = 'green'
-
-        for curve in purpleCurves:
-            curve.color = 'purple'
-
-        for curve in yellowCurves:
-            curve.color = 'yellow'
+    def loft_curves_highlighted(self, curveLists):
+        self.unhighlight_curves()
 
-        for curve in redCurves:
-            curve.color = 'red'
+        colors = ['orange', 'green', 'purple', 'yellow', 'red']
 
-        for curve in blueCurves:
-            curve.color = 'blue'
+        for k, curveList in enumerate(curveLists):
+            for curve in self.selected(curveList.selectedItems()[:1], self.featureTree.curve):
+                self.highlight(curve, colors[k % len(colors)])
 
         self.setup_3d_plot()
 
@@ -1357,10 +1093,10 @@ class MainWindow(wdg.QDialog):
 
         curveLabel2.setText("Select Path Curve")
 
-        names = [curve.name for curve in self.featureTree.curves]
+        curves = self.featureTree.curves
 
-        curveList1.addItems(names)
-        curveList2.addItems(names)
+        self.fill_list(curveList1, curves)
+        self.fill_list(curveList2, curves)
 
         layout.addWidget(curveLabel1, 1, 0, 1, 4)
         layout.addWidget(curveList1, 2, 0, 1, 4)
@@ -1378,28 +1114,13 @@ class MainWindow(wdg.QDialog):
         if len(selectedItems1) == 0 and len(selectedItems2):
             return
         
-        orangeCurves = []
-        for curve in self.featureTree.curves:
-            for item in selectedItems1:
-                if curve.name == item.text():
-                    orangeCurves.append(curve)
-
-        greenCurves = []
-        for curve in self.featureTree.curves:
-            for item in selectedItems2:
-                if curve.name == item.text():
-                    greenCurves.append(curve)
-
-        blueCurves = list(set(self.featureTree.curves) - set(orangeCurves) - set(greenCurves))
-            
-        for curve in orangeCurves:
-            curve.color = 'orange'
+        self.unhighlight_curves()
 
-        for curve in greenCurves:
-            curve.color = 'green'
+        for curve in self.selected(selectedItems1, self.featureTree.curve):
+            self.highlight(curve, 'orange')
 
-        for curve in blueCurves:
-            curve.color = 'blue'
+        for curve in self.selected(selectedItems2, self.featureTree.curve):
+            self.highlight(curve, 'green')
 
         self.setup_3d_plot()
 
@@ -1408,11 +1129,11 @@ class MainWindow(wdg.QDialog):
         if self.sketch_dialogue_displayed == True: 
             return
 
-        self.color_all_sketchplanes_blue()
+        self.unhighlight_sketch_planes()
 
-        self.color_all_curves_blue()
+        self.unhighlight_curves()
 
-        self.color_all_surfaces_green()
+        self.unhighlight_surfaces()
 
         self.setup_3d_plot()
         
@@ -1425,9 +1146,7 @@ class MainWindow(wdg.QDialog):
         sketchPlaneListLabel = wdg.QLabel("Select sketch plane")
         sketchPlaneList = wdg.QListWidget()
 
-        names = [plane.name for plane in self.featureTree.sketchPlanes]
-
-        sketchPlaneList.addItems(names)
+        self.fill_list(sketchPlaneList, self.featureTree.sketchPlanes)
 
         sketchPlaneList.itemPressed.connect(lambda: self.sketch_plane_highlighted(sketchPlaneList.selectedItems()))
 
@@ -1454,24 +1173,15 @@ class MainWindow(wdg.QDialog):
 
 
     def curve_highlighted(self, selectedItems):
-        print("curve highlighted")
+        log.debug("curve highlighted")
         if len(selectedItems) == 0:
             return
         
-        orangeCurves = []
-        for item in selectedItems:
-            print(item.text())
-            for curve in self.featureTree.curves:
-                if curve.name == item.text():
-                    orangeCurves.append(curve)
-
-        blueCurves = list(set(self.featureTree.curves) - set(orangeCurves))
-            
-        for curve in orangeCurves:
-            curve.color = 'orange'
+        self.unhighlight_curves()
 
-        for curve in blueCurves:
-            curve.color = 'blue'
+        for curve in self.selected(selectedItems, self.featureTree.curve):
+            log.debug("%s", curve.name)
+            self.highlight(curve, 'orange')
 
         self.setup_3d_plot()
 
@@ -1480,11 +1190,10 @@ class MainWindow(wdg.QDialog):
         if len(selectedItem) == 0:
             return
         
-        for sketchPlane in self.featureTree.sketchPlanes:
-            if sketchPlane.name == selectedItem[0].text():
-                sketchPlane.color = 'orange'
-            
-            else: sketchPlane.color = 'blue'
+        self.unhighlight_sketch_planes()
+
+        for sketchPlane in self.selected(selectedItem[:1], self.featureTree.sketch_plane):
+            self.highlight(sketchPlane, 'orange')
 
         self.setup_3d_plot()
 
@@ -1493,13 +1202,13 @@ class MainWindow(wdg.QDialog):
         if len(selectedItem) == 0:
             return
         
-        selectedSketchPlane = [sketchPlane for sketchPlane in self.featureTree.sketchPlanes if sketchPlane.name == selectedItem[0].text()][0]
+        selectedSketchPlane = self.featureTree.sketch_plane(selectedItem[0].data(ID_ROLE))
 
-        print(selectedSketchPlane.name)
+        log.debug("%s", selectedSketchPlane.name)
 
         selectedSketchPlane : SketchPlane
 
-        print(selectedSketchPlane.name)
+        log.debug("%s", selectedSketchPlane.name)
 
         self.clear_option_layout()
         self.sketchContainer.deleteLater()
@@ -1635,7 +1344,7 @@ class MainWindow(wdg.QDialog):
         # control points
         controlPoints = sp.zeros(numberOfControlPoints, 3)
 
-        sp.pretty_print(controlPoints)
+        log.debug("controlPoints:%s", Pretty(controlPoints))
 
         # callbacks
         cancelButton.clicked.connect(lambda: self.escape_container(self.sketchContainer))
@@ -1662,7 +1371,7 @@ class MainWindow(wdg.QDialog):
             if field is not None and field.text() != '':
                 controlPoints[idx, 2] = float(field.text())
 
-        sp.pretty_print(controlPoints)
+        log.debug("controlPoints:%s", Pretty(controlPoints))
 
         self.setup_2d_plot(selectedSketchPlane.initial_orientation)
 
@@ -1670,16 +1379,7 @@ class MainWindow(wdg.QDialog):
 
         line_traces = CUBSpline.generate_traces()
 
-        match selectedSketchPlane.initial_orientation:
-            case 'xy':
-                for line_trace in line_traces:
-                    self.sc.axes.plot(line_trace[:, 0], line_trace[:, 1], color=CUBSpline.color)
-            case 'yz':
-                for line_trace in line_traces:
-                    self.sc.axes.plot(line_trace[:, 1], line_trace[:, 2], color=CUBSpline.color)
-            case 'xz':
-                for line_trace in line_traces:
-                    self.sc.axes.plot(line_trace[:, 0], line_trace[:, 2], color=CUBSpline.color)
+        self.renderer.draw_traces(line_traces, color=CUBSpline.color, columns=PLANE_COLUMNS[selectedSketchPlane.initial_orientation])
 
         return
     
@@ -1700,9 +1400,9 @@ class MainWindow(wdg.QDialog):
             if field is not None and field.text() != '':
                 controlPoints[idx, 2] = float(field.text())
 
-        sp.pretty_print(controlPoints)
+        log.debug("controlPoints:%s", Pretty(controlPoints))
 
-        CUBSpline = ClosedUniformBSpline(f"curve{self.featureTree.curveCount}", 3, controlPoints, 40, selectedSketchPlane)
+        CUBSpline = self.featureTree.construct(ClosedUniformBSpline, f"curve{self.featureTree.curveCount}", 3, controlPoints, 40, selectedSketchPlane)
 
         line_traces = CUBSpline.generate_traces()
         # match selectedSketchPlane.initial_orientation:
@@ -1716,6 +1416,8 @@ class MainWindow(wdg.QDialog):
         #         for line_trace in line_traces:
         #             self.sc.axes.plot(line_trace[:, 0], line_trace[:, 2], color=CUBSpline.color)
 
+        self.history.checkpoint('closed b-spline')
+
         for curve in CUBSpline.curves:
             self.featureTree.add_curve(curve)
 
@@ -1824,7 +1526,7 @@ class MainWindow(wdg.QDialog):
         # control points
         controlPoints = sp.zeros(numberOfControlPoints, 3)
 
-        sp.pretty_print(controlPoints)
+        log.debug("controlPoints:%s", Pretty(controlPoints))
 
         # callbacks
         cancelButton.clicked.connect(lambda: self.escape_container(self.sketchContainer))
@@ -1851,7 +1553,7 @@ class MainWindow(wdg.QDialog):
             if field is not None and field.text() != '':
                 controlPoints[idx, 2] = float(field.text())
 
-        sp.pretty_print(controlPoints)
+        log.debug("controlPoints:%s", Pretty(controlPoints))
 
         self.setup_2d_plot(selectedSketchPlane.initial_orientation)
 
@@ -1886,9 +1588,9 @@ class MainWindow(wdg.QDialog):
             if field is not None and field.text() != '':
                 controlPoints[idx, 2] = float(field.text())
 
-        sp.pretty_print(controlPoints)
+        log.debug("controlPoints:%s", Pretty(controlPoints))
 
-        bezierCurve = BezierCurve(f"curve{self.featureTree.curveCount}", controlPoints, 40, selectedSketchPlane)
+        bezierCurve = self.featureTree.construct(BezierCurve, f"curve{self.featureTree.curveCount}", controlPoints, 40, selectedSketchPlane)
 
         # line_trace = bezierCurve.generate_trace()
         # match selectedSketchPlane.initial_orientation:
@@ -1903,6 +1605,7 @@ class MainWindow(wdg.QDialog):
 
         # bezierCurve.rotate(selectedSketchPlane.alpha, selectedSketchPlane.beta, selectedSketchPlane.gamma)
 
+        self.history.checkpoint('bezier curve')
         self.featureTree.add_curve(bezierCurve)
 
         self.clear_mpl_container()
@@ -2010,7 +1713,7 @@ class MainWindow(wdg.QDialog):
         # control points
         controlPoints = sp.zeros(numberOfControlPoints, 3)
 
-        sp.pretty_print(controlPoints)
+        log.debug("controlPoints:%s", Pretty(controlPoints))
 
         # callbacks
         cancelButton.clicked.connect(lambda: self.escape_container(self.sketchContainer))
@@ -2037,7 +1740,7 @@ class MainWindow(wdg.QDialog):
             if field is not None and field.text() != '':
                 controlPoints[idx, 2] = float(field.text())
 
-        sp.pretty_print(controlPoints)
+        log.debug("controlPoints:%s", Pretty(controlPoints))
 
         self.setup_2d_plot(selectedSketchPlane.initial_orientation)
 
@@ -2071,9 +1774,9 @@ class MainWindow(wdg.QDialog):
             if field is not None and field.text() != '':
                 controlPoints[idx, 2] = float(field.text())
 
-        sp.pretty_print(controlPoints)
+        log.debug("controlPoints:%s", Pretty(controlPoints))
 
-        spline = Spline(f"curve{self.featureTree.curveCount}", controlPoints, 40, selectedSketchPlane)
+        spline = self.featureTree.construct(Spline, f"curve{self.featureTree.curveCount}", controlPoints, 40, selectedSketchPlane)
 
         # line_trace = spline.generate_trace()
         # match selectedSketchPlane.initial_orientation:
@@ -2088,6 +1791,7 @@ class MainWindow(wdg.QDialog):
 
         # spline.rotate(selectedSketchPlane.alpha, selectedSketchPlane.beta, selectedSketchPlane.gamma)
 
+        self.history.checkpoint('spline')
         self.featureTree.add_curve(spline)
 
         self.clear_mpl_container()
@@ -2096,7 +1800,7 @@ class MainWindow(wdg.QDialog):
 
 
     def draw_straight_line(self, selectedSketchPlane : SketchPlane):
-        print(f"draw straight line, selected sketch plane: {selectedSketchPlane.offset.x}, {selectedSketchPlane.offset.y}, {selectedSketchPlane.offset.z}")
+        log.debug("draw straight line, selected sketch plane: %s, %s, %s", selectedSketchPlane.offset.x, selectedSketchPlane.offset.y, selectedSketchPlane.offset.z)
         self.clear_option_layout()
         self.sketchContainer.deleteLater()
 
@@ -2197,7 +1901,7 @@ class MainWindow(wdg.QDialog):
 
 
     def accept_straight_line(self, selectedSketchPlane:SketchPlane):
-        print(f"{selectedSketchPlane.offset.x}, {selectedSketchPlane.offset.y}, {selectedSketchPlane.offset.z}")
+        log.debug("%s, %s, %s", selectedSketchPlane.offset.x, selectedSketchPlane.offset.y, selectedSketchPlane.offset.z)
 
         # field values
         p0 = sp.Matrix([[0, 0, 0]])
@@ -2221,14 +1925,15 @@ class MainWindow(wdg.QDialog):
         if self.slp1zField is not None and self.slp1zField.text() != '': 
             p1[0, 2] = float(self.slp1zField.text())
 
-        line = StraightLine(f"curve{self.featureTree.curveCount}", p0, p1, 40, selectedSketchPlane)
+        line = self.featureTree.construct(StraightLine, f"curve{self.featureTree.curveCount}", p0, p1, 40, selectedSketchPlane)
 
         # line.translate(selectedSketchPlane.offset)
 
         # line.rotate(selectedSketchPlane.alpha, selectedSketchPlane.beta, selectedSketchPlane.gamma)
 
-        print(f"in accept straight line: {line.offset.x}, {line.offset.y}, {line.offset.z}")
+        log.debug("in accept straight line: %s, %s, %s", line.offset.x, line.offset.y, line.offset.z)
 
+        self.history.checkpoint('straight line')
         self.featureTree.add_curve(line)
 
         self.clear_mpl_container()
@@ -2237,9 +1942,9 @@ class MainWindow(wdg.QDialog):
 
 
     def preview_straight_line(self, selectedSketchPlane:SketchPlane):
-        print(f"in preview straight line")
+        log.debug("in preview straight line")
 
-        print(f"{selectedSketchPlane.offset.x}, {selectedSketchPlane.offset.y}, {selectedSketchPlane.offset.z}")
+        log.debug("%s, %s, %s", selectedSketchPlane.offset.x, selectedSketchPlane.offset.y, selectedSketchPlane.offset.z)
         # field values
         p0 = sp.Matrix([[0, 0, 0]])
         p1 = sp.Matrix([[0, 0, 0]])
@@ -2266,7 +1971,7 @@ class MainWindow(wdg.QDialog):
 
         line = StraightLine(f"curve{self.featureTree.curveCount}", p0, p1, 40, selectedSketchPlane)
 
-        print(f"in preview straight line: {line.offset.x}, {line.offset.y}, {line.offset.z}")
+        log.debug("in preview straight line: %s, %s, %s", line.offset.x, line.offset.y, line.offset.z)
 
         line_trace = line.generate_trace()
         match selectedSketchPlane.initial_orientation:
@@ -2281,11 +1986,10 @@ class MainWindow(wdg.QDialog):
 
 
     def deleteSketchPlane(self, sketchPlaneList, items):
-        names = [item.text() for item in items]
+        self.history.checkpoint('delete sketch planes')
 
-        updatedSketchPlanes = [sketchPlane for sketchPlane in self.featureTree.sketchPlanes if sketchPlane.name not in names]
-        
-        self.featureTree.sketchPlanes = updatedSketchPlanes
+        for sketchPlane in self.selected(items, self.featureTree.sketch_plane):
+            self.featureTree.remove(sketchPlane)
 
         for item in items:
             sketchPlaneList.takeItem(sketchPlaneList.row(item))
@@ -2303,11 +2007,11 @@ class MainWindow(wdg.QDialog):
         if self.sketch_plane_dialogue_displayed == True: 
             return
         
-        self.color_all_sketchplanes_blue()
+        self.unhighlight_sketch_planes()
 
-        self.color_all_sketchplanes_blue()
+        self.unhighlight_sketch_planes()
 
-        self.color_all_surfaces_green()
+        self.unhighlight_surfaces()
         
         self.setup_3d_plot()
 
@@ -2360,6 +2064,8 @@ class MainWindow(wdg.QDialog):
 
     def escape_container(self, container):
         container.deleteLater()
+        self.extrusionTimer.stop()
+        self.pendingExtrusion = None
         self.sketch_plane_dialogue_displayed = False
         self.sketch_dialogue_displayed = False
         self.sketch_displayed = False
@@ -2367,13 +2073,13 @@ class MainWindow(wdg.QDialog):
         self.intersection_dialogue_displayed = False
 
         # wipe canvas
-        self.color_all_sketchplanes_blue()
+        self.unhighlight_sketch_planes()
 
-        self.color_all_sketchplanes_blue()
+        self.unhighlight_sketch_planes()
 
-        self.color_all_curves_blue()
+        self.unhighlight_curves()
 
-        self.color_all_surfaces_green()
+        self.unhighlight_surfaces()
 
         self.clear_mpl_container()
 
@@ -2392,6 +2098,7 @@ class MainWindow(wdg.QDialog):
         self.set_labels_3d()
         self.set_limits_3d()
 
+        self.history.checkpoint('sketch plane')
         self.featureTree.add_sketch_plane(self.tempSketchPlane)
         self.tempSketchPlane = None
 
@@ -2433,8 +2140,7 @@ class MainWindow(wdg.QDialog):
         sketchPlaneTraces = sketchPlane.generate_traces()
 
         self.sc.axes.cla()
-        for trace in sketchPlaneTraces:
-            self.sc.axes.plot(trace[:, 0], trace[:, 1], trace[:, 2], color=sketchPlane.color, alpha=0.3)
+        self.renderer.draw_traces(sketchPlaneTraces, color=sketchPlane.color, alpha=0.3)
 
         self.set_labels_3d()
         self.set_limits_3d()
@@ -2479,7 +2185,7 @@ class MainWindow(wdg.QDialog):
 
         offset = Offset(float(self.xOffsetField.text()), float(self.yOffsetField.text()), float(self.zOffsetField.text()))
 
-        print(f"offset: {offset.x}, {offset.y}, {offset.z}")
+        log.debug("offset: %s, %s, %s", offset.x, offset.y, offset.z)
 
         sketchPlane.translate(offset)
 
@@ -2488,8 +2194,7 @@ class MainWindow(wdg.QDialog):
         sketchPlaneTraces = sketchPlane.generate_traces()
 
         self.sc.axes.cla()
-        for trace in sketchPlaneTraces:
-            self.sc.axes.plot(trace[:, 0], trace[:, 1], trace[:, 2], color=sketchPlane.color, alpha=0.3)
+        self.renderer.draw_traces(sketchPlaneTraces, color=sketchPlane.color, alpha=0.3)
 
         self.set_labels_3d()
         self.set_limits_3d()
@@ -2500,7 +2205,7 @@ class MainWindow(wdg.QDialog):
 
     def xy_button_callback(self, layout:wdg.QGridLayout):
         self.selectedSketchPlane = 'xy'
-        print('xy')
+        log.debug('xy')
         self.add_angle_widgets(layout)
         self.add_offset_widgets(layout)
         self.preview_sketch_plane_initial()
@@ -2508,7 +2213,7 @@ class MainWindow(wdg.QDialog):
 
     def yz_button_callback(self, layout:wdg.QGridLayout):
         self.selectedSketchPlane = 'yz'
-        print('yz')
+        log.debug('yz')
         self.add_angle_widgets(layout)
         self.add_offset_widgets(layout)
         self.preview_sketch_plane_initial()
@@ -2516,7 +2221,7 @@ class MainWindow(wdg.QDialog):
 
     def xz_button_callback(self, layout:wdg.QGridLayout):
         self.selectedSketchPlane = 'xz'
-        print('xz')
+        log.debug('xz')
         self.add_angle_widgets(layout)
         self.add_offset_widgets(layout)
         self.preview_sketch_plane_initial()
@@ -2601,51 +2306,202 @@ class MainWindow(wdg.QDialog):
     
 
     def draw_features(self):
-        print('draw features')
+        log.debug('draw features')
         self.sc.axes.cla()
+        self.picker.clear()
+        self.renderer.clear()
+
+        # shaded surfaces cull against the view box, so the limits have to be in place before drawing
+        self.set_limits_3d()
+
+        # the traces features keep for drawing are cached at display precision
+        dtype = current_display_dtype()
 
-        print(self.featureTree.sketchPlanes)
+        log.debug("%s", self.featureTree.sketchPlanes)
 
         for sketchPlane in self.featureTree.sketchPlanes:
-            sketchPlaneTraces = sketchPlane.generate_traces()
+            sketchPlaneTraces = self.featureTree.evaluate(sketchPlane, dtype)
 
-            sp.pretty_print(sketchPlane.S_u_w)
+            log.debug("S_u_w:%s", Pretty(sketchPlane.S_u_w))
 
-            sketchPlane.offset.print()
+            log.debug("offset: %s", sketchPlane.offset)
 
-            for trace in sketchPlaneTraces:
-                self.sc.axes.plot(trace[:, 0], trace[:, 1], trace[:, 2], color=sketchPlane.color, alpha=0.3)
+            with profiler.measure('plot', sketchPlane):
+                self.renderer.draw_traces(sketchPlaneTraces, color=self.color_of(sketchPlane), alpha=0.3)
+
+            self.picker.add(sketchPlane, sketchPlaneTraces)
 
         for curve in self.featureTree.curves:
-            print(curve.P_u)
-            curveTrace = curve.generate_trace()
+            log.debug("drawing curve %s", curve.name)
+            curveTrace = self.featureTree.evaluate(curve, dtype)[0]
+
+            with profiler.measure('plot', curve):
+                self.renderer.draw_traces([curveTrace], color=self.color_of(curve))
 
-            self.sc.axes.plot(curveTrace[:, 0], curveTrace[:, 1], curveTrace[:, 2], color=curve.color)
+            self.picker.add(curve, [curveTrace])
 
         for surface in self.featureTree.surfaces:
-            surfaceTraces = surface.generate_traces()
+            # surfaces still on the symbolic path have no normals and stay wireframe
+            if self.shaded and getattr(surface, 'numeric', False):
+                S, N = self.featureTree.evaluate_shaded(surface, dtype)
+
+                with profiler.measure('plot', surface):
+                    self.renderer.draw_shaded(S, N, color=self.color_of(surface), cull_back_faces=self.cull_back_faces)
+
+                self.picker.add(surface, [S])
+
+                continue
 
-            for trace in surfaceTraces:
-                self.sc.axes.plot(trace[:, 0], trace[:, 1], trace[:, 2], color=surface.color)
+            surfaceTraces = self.featureTree.evaluate(surface, dtype)
 
+            with profiler.measure('plot', surface):
+                self.renderer.draw_traces(surfaceTraces, color=self.color_of(surface))
+
+            self.picker.add(surface, surfaceTraces)
 
         self.set_labels_3d()
         self.set_limits_3d()
-        self.sc.figure.canvas.draw()
+
+        with profiler.measure('render', ('Canvas', 'figure')):
+            self.sc.figure.canvas.draw()
+
+        self.prepare_picking()
 
     
-    def color_all_sketchplanes_blue(self):
+    def canvas_pressed(self, event):
+        self.press = (event.x, event.y) if event.button == 1 else None
+
+
+    def canvas_released(self, event):
+        # dragging rotates or zooms the view, only a click that stays where it went down selects
+        if self.press is None or event.button != 1:
+            self.view_changed()
+            return
+
+        moved = np.hypot(event.x - self.press[0], event.y - self.press[1])
+
+        self.press = None
+
+        if moved > self.picker.tolerance:
+            self.view_changed()
+            return
+
+        with profiler.measure('pick', ('Canvas', 'figure')):
+            feature = self.picker.pick(event.x, event.y)
+
+        if feature is None:
+            return
+
+        self.feature_picked(feature)
+
+
+    def view_changed(self):
+        # shaded surfaces were culled and lit for the view they were drawn in, redo that for the new one
+        if self.renderer.refresh_shaded():
+            self.sc.figure.canvas.draw_idle()
+
+        self.prepare_picking()
+
+
+    def prepare_picking(self):
+        # the picker projects and indexes the drawn points for the settled view once the event loop is idle,
+        # so every click is answered from the index
+        QTimer.singleShot(0, self.picker.prepare)
+
+
+    def feature_picked(self, feature):
+        log.debug("picked %s", feature.name)
+
+        self.selectedFeature = feature
+
+        self.unhighlight_sketch_planes()
+        self.unhighlight_curves()
+        self.unhighlight_surfaces()
+
+        self.highlight(feature, 'orange')
+
+        # redrawn on the same axes, so the view the click was made in is kept
+        self.draw_features()
+
+
+    def undo(self):
+        if self.history.undo() is not None:
+            self.history_restored()
+
+
+    def redo(self):
+        if self.history.redo() is not None:
+            self.history_restored()
+
+
+    def history_restored(self):
+        # the restored features bring their cached geometry along, redrawing them evaluates nothing new;
+        # open dialogues are closed since their lists may name features that are gone
+        self.selectedFeature = None
+
+        self.clear_option_layout()
+
+        self.sketch_displayed = False
+        self.sketch_plane_dialogue_displayed = False
+        self.sketch_dialogue_displayed = False
+        self.surface_dialogue_displayed = False
+        self.intersection_dialogue_displayed = False
+
+        # highlights may name features the restored state no longer holds
+        self.highlights = {}
+
+        self.setup_3d_plot()
+
+
+    def shaded_toggled(self, checked):
+        self.shaded = checked
+
+        self.draw_features()
+
+
+    def cull_toggled(self, checked):
+        self.cull_back_faces = checked
+
+        self.draw_features()
+
+
+    def fill_list(self, listWidget, features):
+        for feature in features:
+            item = wdg.QListWidgetItem(feature.name)
+            item.setData(ID_ROLE, feature.id)
+
+            listWidget.addItem(item)
+
+
+    def selected(self, items, lookup):
+        # features behind list items through one of the tree's typed lookups, in the order they were added
+        features = [lookup(item.data(ID_ROLE)) for item in items]
+
+        return sorted([feature for feature in features if feature is not None], key=lambda feature: feature.id)
+
+
+    def highlight(self, feature, color):
+        self.highlights[feature.id] = color
+
+
+    def color_of(self, feature):
+        # a highlighted feature is drawn in its highlight colour, any other in its own
+        return self.highlights.get(feature.id, feature.color)
+
+
+    def unhighlight_sketch_planes(self):
         for sketchPlane in self.featureTree.sketchPlanes:
-            sketchPlane.color = 'blue'
+            self.highlights.pop(sketchPlane.id, None)
 
 
-    def color_all_curves_blue(self):
+    def unhighlight_curves(self):
         for curve in self.featureTree.curves:
-            curve.color = 'blue'
+            self.highlights.pop(curve.id, None)
+
 
-    def color_all_surfaces_green(self):
+    def unhighlight_surfaces(self):
         for surface in self.featureTree.surfaces:
-            surface.color = 'green'
+            self.highlights.pop(surface.id, None)
 
 
 if __name__ == "__main__":